@@ -0,0 +1,23 @@
+"""
+Admin Module
+Access check for operator-only endpoints. They are disabled unless
+ADMIN_TOKEN is set, and then require it in the X-Admin-Token header.
+"""
+import os
+import hmac
+from typing import Optional
+from fastapi import Header, HTTPException
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or None
+
+
+def is_admin(token: Optional[str]) -> bool:
+    return bool(ADMIN_TOKEN and token and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()))
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """FastAPI dependency for admin endpoints (404 while disabled, 401 on a bad token)."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
@@ -0,0 +1,314 @@
+"""
+Admission Module
+Admission control for the endpoints that fan out to paid or rate-limited
+upstreams (Groq, DuckDuckGo, Hugging Face, NewsData). Each endpoint class
+has a per-client token bucket (429 when empty), a cap on concurrent
+requests, and a bounded wait queue in front of the cap (503 when full or
+when the wait times out). Rejections carry Retry-After. Limits are per
+process.
+"""
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+from logs import get_logger
+
+log = get_logger("admission")
+
+ADMISSION_ENABLED = (os.getenv("ADMISSION_ENABLED") or "true").lower() in ("1", "true", "yes")
+# Seconds a request may wait for a concurrency slot before it is shed
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT") or "10")
+# Use the first X-Forwarded-For address as the client (only behind a trusted proxy)
+ADMISSION_TRUST_PROXY = (os.getenv("ADMISSION_TRUST_PROXY") or "false").lower() in ("1", "true", "yes")
+# Clients whose buckets are remembered per class (least recently seen are dropped)
+ADMISSION_MAX_CLIENTS = int(os.getenv("ADMISSION_MAX_CLIENTS") or "10000")
+
+# (method, path) -> endpoint class
+ENDPOINT_CLASSES = {
+    ("POST", "/api/verify"): "verify",
+    ("POST", "/api/images/batch"): "image",
+    ("POST", "/api/forensics"): "image",
+    ("POST", "/api/score"): "llm",
+    ("POST", "/api/explain"): "llm",
+    ("POST", "/api/chat"): "chat",
+    ("POST", "/api/scan"): "scan",
+}
+
+# class -> (requests per minute per client, burst, concurrent requests, queued requests);
+# override with ADMISSION_<CLASS>=rate,burst,concurrency,queue
+DEFAULT_LIMITS = {
+    "verify": (30, 10, 16, 32),
+    "image": (10, 5, 4, 8),
+    "llm": (60, 20, 16, 32),
+    "chat": (30, 10, 16, 32),
+    "scan": (6, 3, 2, 4),
+}
+
+
+class ClassLimits:
+    def __init__(self, name: str, rate_per_minute: float, burst: int, concurrency: int, queue: int):
+        self.name = name
+        self.rate = rate_per_minute / 60
+        self.burst = max(1, burst)
+        self.concurrency = max(1, concurrency)
+        self.queue = max(0, queue)
+
+    @classmethod
+    def from_env(cls, name: str, default: Tuple) -> "ClassLimits":
+        raw = os.getenv(f"ADMISSION_{name.upper()}")
+        values = default
+        if raw:
+            try:
+                values = tuple(float(part) for part in raw.split(","))
+                if len(values) != 4:
+                    raise ValueError("expected rate,burst,concurrency,queue")
+            except ValueError as e:
+                log.warning("Ignoring invalid admission limits", endpoint_class=name, value=raw, error=str(e))
+                values = default
+        rate, burst, concurrency, queue = values
+        return cls(name, rate, int(burst), int(concurrency), int(queue))
+
+    def to_dict(self) -> Dict:
+        return {"rate_per_minute": round(self.rate * 60, 2), "burst": self.burst, "concurrency": self.concurrency, "queue": self.queue}
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+
+    def take(self, rate: float, burst: int, now: float) -> float:
+        """Take one token; 0 when admitted, otherwise seconds until one is available."""
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate if rate > 0 else 60.0
+
+
+class ConcurrencyGate:
+    """
+    At most `limit` holders, with up to `queue` waiters served in arrival
+    order. Only used from the event loop, so it needs no lock; a released
+    slot is handed straight to the next waiter.
+    """
+
+    def __init__(self, limit: int, queue: int):
+        self.limit = limit
+        self.queue = queue
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        # Moving average of how long a slot is held, for Retry-After
+        self.hold_seconds = 1.0
+
+    @property
+    def waiting(self) -> int:
+        return len(self.waiters)
+
+    async def acquire(self, timeout: float) -> Optional[str]:
+        """None once a slot is held, otherwise "queue_full" or "queue_timeout"."""
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            return None
+        if self.waiting >= self.queue:
+            return "queue_full"
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+            return None
+        except asyncio.TimeoutError:
+            return None if self._handed_over(waiter) else "queue_timeout"
+        except asyncio.CancelledError:
+            # Client went away while queued
+            if self._handed_over(waiter):
+                self.release(self.hold_seconds)
+            raise
+
+    def _handed_over(self, waiter: asyncio.Future) -> bool:
+        """Give up waiting; True if a slot was handed over just before, so it is held after all."""
+        if waiter.done() and not waiter.cancelled():
+            return True
+        waiter.cancel()
+        self.waiters.remove(waiter)
+        return False
+
+    def release(self, held_seconds: float):
+        self.hold_seconds = 0.8 * self.hold_seconds + 0.2 * held_seconds
+        if self.waiters:
+            self.waiters.popleft().set_result(None)
+            return
+        self.active -= 1
+
+    def retry_after(self) -> int:
+        """Rough seconds until a queued request would get a slot."""
+        return max(1, math.ceil(self.hold_seconds * (self.waiting + 1) / self.limit))
+
+
+class AdmissionController:
+    def __init__(self, limits: Optional[Dict[str, ClassLimits]] = None, enabled: bool = ADMISSION_ENABLED):
+        self.enabled = enabled
+        self.limits = limits or {name: ClassLimits.from_env(name, default) for name, default in DEFAULT_LIMITS.items()}
+        self.gates = {name: ConcurrencyGate(limit.concurrency, limit.queue) for name, limit in self.limits.items()}
+        self.buckets: Dict[str, "OrderedDict[str, TokenBucket]"] = {name: OrderedDict() for name in self.limits}
+        self.counts = {name: {"admitted": 0, "rate_limited": 0, "queue_full": 0, "queue_timeout": 0} for name in self.limits}
+        self._lock = threading.Lock()
+
+    def classify(self, method: str, path: str) -> Optional[str]:
+        endpoint_class = ENDPOINT_CLASSES.get((method, path.rstrip("/") or "/"))
+        return endpoint_class if endpoint_class in self.limits else None
+
+    def check_rate(self, endpoint_class: str, client: str) -> float:
+        """0 when the client may proceed, otherwise seconds until it may retry."""
+        limits = self.limits[endpoint_class]
+        buckets = self.buckets[endpoint_class]
+        now = time.monotonic()
+        bucket = buckets.get(client)
+        if bucket is None:
+            bucket = buckets[client] = TokenBucket(limits.burst, now)
+            if len(buckets) > ADMISSION_MAX_CLIENTS:
+                buckets.popitem(last=False)
+        else:
+            buckets.move_to_end(client)
+        return bucket.take(limits.rate, limits.burst, now)
+
+    def count(self, endpoint_class: str, outcome: str):
+        with self._lock:
+            self.counts[endpoint_class][outcome] += 1
+
+    def status(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "classes": {
+                name: {
+                    **limits.to_dict(),
+                    "active": self.gates[name].active,
+                    "waiting": self.gates[name].waiting,
+                    "clients": len(self.buckets[name]),
+                    **self.counts[name],
+                }
+                for name, limits in self.limits.items()
+            },
+        }
+
+    def prometheus(self) -> str:
+        """Admission metrics in the Prometheus text exposition format."""
+        status = self.status()["classes"]
+        lines = [
+            "# HELP crux_admission_requests_total Requests to limited endpoints by outcome",
+            "# TYPE crux_admission_requests_total counter",
+        ]
+        for name, stats in status.items():
+            for outcome in ("admitted", "rate_limited", "queue_full", "queue_timeout"):
+                lines.append(f'crux_admission_requests_total{{class="{name}",outcome="{outcome}"}} {stats[outcome]}')
+        lines += ["# HELP crux_admission_active Requests holding a concurrency slot", "# TYPE crux_admission_active gauge"]
+        lines += [f'crux_admission_active{{class="{name}"}} {stats["active"]}' for name, stats in status.items()]
+        lines += ["# HELP crux_admission_waiting Requests queued for a concurrency slot", "# TYPE crux_admission_waiting gauge"]
+        lines += [f'crux_admission_waiting{{class="{name}"}} {stats["waiting"]}' for name, stats in status.items()]
+        return "\n".join(lines) + "\n"
+
+
+def _client_key(scope) -> str:
+    if ADMISSION_TRUST_PROXY:
+        forwarded = dict(scope.get("headers") or []).get(b"x-forwarded-for")
+        if forwarded:
+            return forwarded.split(b",")[0].strip().decode("latin-1")
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+async def _reject(send, status: int, detail: str, retry_after: float):
+    body = f'{{"detail":"{detail}"}}'.encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying the controller to classified endpoints. The
+    concurrency slot is held until the endpoint returns, including its
+    background tasks (so /api/scan's scans count against the scan cap).
+    """
+
+    def __init__(self, app, controller: Optional[AdmissionController] = None):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        controller = self.controller or admission
+        endpoint_class = controller.classify(scope.get("method", ""), scope.get("path", "")) if scope["type"] == "http" and controller.enabled else None
+        if endpoint_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        client = _client_key(scope)
+        wait = controller.check_rate(endpoint_class, client)
+        if wait:
+            controller.count(endpoint_class, "rate_limited")
+            log.info("Rate limited", endpoint_class=endpoint_class, client=client, retry_after=round(wait, 1))
+            await _reject(send, 429, "Too many requests, slow down", wait)
+            return
+
+        gate = controller.gates[endpoint_class]
+        refused = await gate.acquire(ADMISSION_QUEUE_TIMEOUT)
+        if refused:
+            controller.count(endpoint_class, refused)
+            log.warning("Request shed", endpoint_class=endpoint_class, reason=refused, active=gate.active, waiting=gate.waiting)
+            await _reject(send, 503, "Server busy, retry later", gate.retry_after())
+            return
+
+        controller.count(endpoint_class, "admitted")
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release(time.monotonic() - started)
+
+
+class InFlightGuard:
+    """Set of keys (e.g. scan URLs) with work in progress; acquire fails for a key already held."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = set()
+
+    @staticmethod
+    def _normalize(key: str) -> str:
+        # Scheme and host are case-insensitive; a trailing slash or fragment makes no difference
+        parts = urlsplit(key.strip())
+        return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), parts.query, ""))
+
+    def acquire(self, key: str) -> bool:
+        key = self._normalize(key)
+        with self._lock:
+            if key in self._keys:
+                return False
+            self._keys.add(key)
+            return True
+
+    def release(self, key: str):
+        with self._lock:
+            self._keys.discard(self._normalize(key))
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+# Global instances
+admission = AdmissionController()
+scan_guard = InFlightGuard()
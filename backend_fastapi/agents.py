@@ -1,24 +1,47 @@
 import os
 import json
+import uuid
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 from duckduckgo_search import DDGS
 from groq import Groq
 from models import Claim, Evidence, ScoreResponse, CrisisAlert, CrisisResponse
+from dedup import HeadlineIndex, headline_index
+from evidence_index import evidence_index
+from reputation import domain_registry
+from deadline import Deadline, MIN_STAGE_SECONDS, unbounded
+from telemetry import telemetry
+from tracing import span
+from logs import get_logger
 import requests
 from bs4 import BeautifulSoup
 
 load_dotenv()
 
+log = get_logger("agents")
+
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 NEWSDATA_API_KEY = os.getenv("NEWSDATA_API_KEY")
+# Alternative NewsData endpoint (staging, or the local stand-ins in benchmarks/fakes.py).
+# Groq's client reads GROQ_BASE_URL on its own.
+NEWSDATA_BASE_URL = os.getenv("NEWSDATA_BASE_URL") or None
+# Fraction of claim terms a locally indexed document must contain to be reused
+EVIDENCE_INDEX_MIN_COVERAGE = float(os.getenv("EVIDENCE_INDEX_MIN_COVERAGE", "0.6"))
+# ...and the BM25 score it must reach per claim term. Matches on a few common
+# words stay below this, so generic claims still go to web search.
+EVIDENCE_INDEX_MIN_SCORE = float(os.getenv("EVIDENCE_INDEX_MIN_SCORE", "1.5"))
+
+# Per-stage timeout caps (seconds); a request Deadline can only shorten these
+LINK_FETCH_TIMEOUT = 10
+SEARCH_TIMEOUT = 10
+SCORE_TIMEOUT = 30
 
 class ScanAgent:
     def __init__(self):
         self.api_key = NEWSDATA_API_KEY
         if not self.api_key:
-            print("WARNING: NEWSDATA_API_KEY not set. Using mock data for news scanning.")
+            log.warning("NEWSDATA_API_KEY not set. Using mock data for news scanning.")
         
         # Map frontend categories to NewsData API categories
         self.category_mapping = {
@@ -34,51 +57,35 @@ class ScanAgent:
             "social": "entertainment"
         }
 
-    def scan_by_category(self, category: str) -> List[Claim]:
-        """Scan news by category"""
+    @telemetry.instrument("ScanAgent", "Fetched category news")
+    def fetch_by_category(self, category: str) -> List[Claim]:
+        """
+        Fetch live news for a category without the mock fallback.
+        Raises on upstream errors; returns [] when no API key is configured.
+        """
         claims = []
+        if not self.api_key:
+            return claims
+        
+        from newsdataapi import NewsDataApiClient
         
         # Map frontend category to NewsData category
         api_category = self.category_mapping.get(category, "top")
+        api = NewsDataApiClient(apikey=self.api_key)
+        if NEWSDATA_BASE_URL:
+            api.set_base_url(NEWSDATA_BASE_URL)
+        log.info("Fetching category news", category=category, api_category=api_category)
         
-        if self.api_key:
-            try:
-                from newsdataapi import NewsDataApiClient
-                api = NewsDataApiClient(apikey=self.api_key)
-                print(f"Fetching {category} news (API category: {api_category})...")
-                
-                # Fetch news for specific category
-                response = api.news_api(category=api_category, language="en")
-                
-                if response and 'results' in response:
-                    seen_titles = set()
-                    for article in response['results']:
-                        title = article.get('title', 'No title')
-                        if title not in seen_titles:
-                            seen_titles.add(title)
-                            claims.append(Claim(
-                                text=title,
-                                source=article.get('source_id', 'newsdata'),
-                                status="unverified",
-                                evidence=[Evidence(
-                                    source=article.get('source_id', 'newsdata'),
-                                    content=article.get('description', '') or title,
-                                    url=article.get('link', '')
-                                )]
-                            ))
-                    print(f"Successfully fetched {len(claims)} articles for {category}")
-                else:
-                    print(f"No results from NewsData API for {category}")
-            except ImportError as e:
-                print(f"ERROR: Failed to import newsdataapi: {e}")
-            except Exception as e:
-                print(f"ERROR: Failed to fetch {category} news: {e}")
-        else:
-            print(f"Using mock data for {category} (no NEWSDATA_API_KEY)")
+        # Fetch news for specific category
+        with span("newsdata.fetch", category=api_category):
+            response = api.news_api(category=api_category, language="en")
         
-        if not claims:
-            # Fallback mock data
-            claims = self._get_mock_news_by_category(category)
+        if response and 'results' in response:
+            claims = self._claims_from_articles(response['results'], HeadlineIndex())
+            log.info("Fetched category news", category=category, articles=len(claims))
+        else:
+            log.warning("No results from NewsData API", category=category)
+        telemetry.note(f"{category}: {len(claims)} articles")
         
         return claims
     
@@ -103,88 +110,150 @@ class ScanAgent:
             status="unverified"
         )]
 
-    def scan(self, source_url: Optional[str] = None) -> List[Claim]:
+    def _claims_from_articles(self, articles: List[dict], index: HeadlineIndex) -> List[Claim]:
+        """
+        Turn NewsData articles into claims, collapsing near-duplicate headlines
+        (syndicated copies, "- Reuters" suffixes, ...) into one canonical claim
+        that carries each copy as Evidence.
+        """
+        claims_by_id = {}
+        for article in articles:
+            title = article.get('title', 'No title')
+            source = article.get('source_id', 'newsdata')
+            canonical_id, canonical_text, _ = index.add(title, str(uuid.uuid4()), source)
+            claim = claims_by_id.get(canonical_id)
+            if claim is None:
+                claim = Claim(
+                    id=canonical_id,
+                    text=canonical_text,
+                    source=source,
+                    status="unverified",
+                    evidence=[]
+                )
+                claims_by_id[canonical_id] = claim
+            evidence = Evidence(
+                source=source,
+                content=article.get('description', '') or title,
+                url=article.get('link', ''),
+                image_url=article.get('image_url') or None,
+                published_at=self._parse_pub_date(article.get('pubDate'))
+            )
+            claim.evidence.append(evidence)
+            evidence_index.add(evidence)
+        return list(claims_by_id.values())
+
+    @staticmethod
+    def _parse_pub_date(value: Optional[str]) -> Optional[datetime]:
+        """NewsData pubDate ("2024-05-01 12:30:00", UTC)"""
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+        except ValueError:
+            return None
+
+    def ingest(self, source_url: Optional[str] = None) -> List[Claim]:
+        """
+        Scan against the persistent headline index. Headlines already seen in
+        earlier scans come back under their canonical claim id, so callers can
+        merge them into the stored claim instead of adding a new one.
+        """
+        return self.scan(source_url, index=headline_index)
+
+    @telemetry.instrument("ScanAgent", "Scanned for crisis events")
+    def scan(self, source_url: Optional[str] = None, index: Optional[HeadlineIndex] = None) -> List[Claim]:
         claims = []
         if self.api_key:
             try:
                 from newsdataapi import NewsDataApiClient
                 api = NewsDataApiClient(apikey=self.api_key)
-                print(f"Scanning news with NewsData API...")
+                if NEWSDATA_BASE_URL:
+                    api.set_base_url(NEWSDATA_BASE_URL)
+                log.info("Scanning news with NewsData API")
                 # Fetch latest news about crisis topics
-                response = api.news_api(q="crisis OR war OR disaster OR emergency OR earthquake OR attack", language="en", country="us")
+                with span("newsdata.scan"):
+                    response = api.news_api(q="crisis OR war OR disaster OR emergency OR earthquake OR attack", language="en", country="us")
                 
                 if response and 'results' in response:
-                    seen_titles = set()
-                    for article in response['results']:
-                        title = article.get('title', 'No title')
-                        if title not in seen_titles:
-                            seen_titles.add(title)
-                            claims.append(Claim(
-                                text=title,
-                                source=article.get('source_id', 'newsdata'),
-                                status="unverified",
-                                evidence=[Evidence(
-                                    source=article.get('source_id', 'newsdata'),
-                                    content=article.get('description', '') or title,
-                                    url=article.get('link', '')
-                                )]
-                            ))
-                    print(f"Successfully scanned {len(claims)} news articles")
+                    claims = self._claims_from_articles(response['results'], index or HeadlineIndex())
+                    log.info("Scanned news articles", articles=len(claims))
                 else:
-                    print("No results from NewsData API")
+                    log.warning("No results from NewsData API")
             except ImportError as e:
-                print(f"ERROR: Failed to import newsdataapi: {e}")
+                log.error("Failed to import newsdataapi", error=str(e))
+                telemetry.error("import_error")
             except Exception as e:
-                print(f"ERROR: Failed to scan news: {e}")
+                log.error("Failed to scan news", error=str(e))
+                telemetry.error("newsdata_error")
         else:
-            print("Using mock data (no NEWSDATA_API_KEY)")
+            log.info("Using mock scan data (no NEWSDATA_API_KEY)")
         
         if not claims:
             # Fallback mock data if API fails or returns nothing
-            print("Returning mock crisis data")
+            log.info("Returning mock crisis data")
             claims.append(Claim(
                 text="Breaking: Major earthquake reported in Japan.",
                 source="social_media_mock",
                 status="unverified"
             ))
+            telemetry.note("mock data")
+        else:
+            telemetry.note(f"{len(claims)} articles")
         return claims
 
 class VerifyAgent:
-    def verify(self, claim: Claim, link: Optional[str] = None, image_content: Optional[bytes] = None) -> Claim:
-        print(f"Verifying claim: {claim.text}")
+    @telemetry.instrument("VerifyAgent", "Gathered evidence")
+    def verify(
+        self,
+        claim: Claim,
+        link: Optional[str] = None,
+        image_content: Optional[bytes] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Claim:
+        log.info("Verifying claim", claim=claim.text[:80], link=link)
+        deadline = deadline or unbounded()
         
         # Process Link
-        if link:
+        if link and deadline.allows("link_fetch"):
             try:
                 import requests
                 from bs4 import BeautifulSoup
-                print(f"Fetching content from link: {link}")
-                response = requests.get(link, timeout=10)
-                response.raise_for_status()
-                soup = BeautifulSoup(response.content, 'html.parser')
-                title = soup.title.string if soup.title else link
-                text_content = soup.get_text()[:1000] # Limit content
+                with span("link_fetch", url=link) as fetch_span:
+                    response = requests.get(link, timeout=deadline.timeout(LINK_FETCH_TIMEOUT))
+                    fetch_span.set("http.status_code", response.status_code)
+                    fetch_span.set("bytes", len(response.content))
+                    response.raise_for_status()
+                with span("link_parse"):
+                    soup = BeautifulSoup(response.content, 'html.parser')
+                    title = soup.title.string if soup.title else link
+                    text_content = soup.get_text()[:1000] # Limit content
                 
-                claim.evidence.append(Evidence(
+                link_evidence = Evidence(
                     source=f"User Link: {title}",
                     content=f"Extracted content: {text_content}...",
                     url=link
-                ))
+                )
+                claim.evidence.append(link_evidence)
+                evidence_index.add(link_evidence)
                 
                 # If claim text is empty, use the link title/content
                 if not claim.text:
                     claim.text = f"Check content from {link}"
-                print(f"Successfully extracted content from link")
+                log.debug("Extracted content from link", link=link)
                     
             except requests.exceptions.RequestException as e:
-                print(f"ERROR: Failed to fetch link {link}: {e}")
+                log.error("Failed to fetch link", link=link, error=str(e))
+                telemetry.error("link_fetch_error")
+                if deadline.remaining() < MIN_STAGE_SECONDS:
+                    deadline.cut("link_fetch")
                 claim.evidence.append(Evidence(
                     source="User Link",
                     content=f"Failed to fetch content from {link}: {str(e)}",
                     url=link
                 ))
             except Exception as e:
-                print(f"ERROR: Unexpected error processing link: {e}")
+                log.exception("Unexpected error processing link", link=link)
+                telemetry.error("link_error")
                 claim.evidence.append(Evidence(
                     source="User Link",
                     content=f"Error processing link: {str(e)}",
@@ -193,7 +262,7 @@ class VerifyAgent:
 
         # Process Image (Placeholder for now)
         if image_content:
-            print(f"Received image upload ({len(image_content)} bytes)")
+            log.info("Received image upload", bytes=len(image_content))
             claim.evidence.append(Evidence(
                 source="User Image",
                 content="Image received. (Vision analysis not yet implemented)",
@@ -202,8 +271,26 @@ class VerifyAgent:
             if not claim.text:
                 claim.text = "Verify uploaded image content"
 
-        # Perform Search Verification
+        # Check evidence collected by earlier scans and verifications first
+        local_results = []
         if claim.text:
+            known_urls = {e.url for e in claim.evidence}
+            with span("evidence_index.search") as index_span:
+                local_results = [
+                    e for e, _ in evidence_index.search(
+                        claim.text, k=3, min_coverage=EVIDENCE_INDEX_MIN_COVERAGE, min_score=EVIDENCE_INDEX_MIN_SCORE
+                    )
+                    if e.url not in known_urls
+                ]
+                index_span.set("results", len(local_results))
+            claim.evidence.extend(local_results)
+            # The local evidence index is this agent's cache in front of web search
+            telemetry.cache("VerifyAgent", hit=len(local_results) >= 3)
+            if local_results:
+                log.info("Found results in local evidence index", results=len(local_results))
+
+        # Perform Search Verification (only when the local index came up short)
+        if claim.text and len(local_results) < 3 and deadline.allows("search"):
             try:
                 # Improve search query to get fact-checking results
                 search_queries = [
@@ -212,57 +299,72 @@ class VerifyAgent:
                     f"{claim.text} verified"
                 ]
                 
-                print(f"Searching for fact-checking evidence: {claim.text}")
-                with DDGS() as ddgs:
+                log.info("Searching for fact-checking evidence", claim=claim.text[:80])
+                with span("search") as search_span, DDGS(timeout=deadline.timeout(SEARCH_TIMEOUT)) as ddgs:
                     # Try multiple search strategies
                     all_results = []
                     for query in search_queries[:2]:  # Use first 2 queries
+                        if not deadline.allows("search"):
+                            break  # score with what we have so far
+                        # DDGS reads its timeout per request: give each query what is left now
+                        ddgs.timeout = deadline.timeout(SEARCH_TIMEOUT)
                         try:
-                            results = list(ddgs.text(query, max_results=2))
+                            with span("search.query"):
+                                results = list(ddgs.text(query, max_results=2))
                             all_results.extend(results)
                             if len(all_results) >= 3:
                                 break
                         except:
                             continue
                     
-                    # Remove duplicates and limit to 3 results
-                    seen_urls = set()
+                    # Remove duplicates and limit to 3 results overall
+                    seen_urls = {e.url for e in local_results}
                     unique_results = []
                     for r in all_results:
                         url = r.get('href', '')
                         if url and url not in seen_urls:
                             seen_urls.add(url)
                             unique_results.append(r)
-                            if len(unique_results) >= 3:
+                            if len(local_results) + len(unique_results) >= 3:
                                 break
                     
                     for r in unique_results:
-                        claim.evidence.append(Evidence(
+                        search_evidence = Evidence(
                             source=r.get('title', 'Unknown'),
                             content=r.get('body', ''),
                             url=r.get('href', '')
-                        ))
-                    print(f"Found {len(unique_results)} fact-checking results")
+                        )
+                        claim.evidence.append(search_evidence)
+                        evidence_index.add(search_evidence)
+                    search_span.set("results", len(unique_results))
+                    log.info("Found fact-checking results", results=len(unique_results))
             except Exception as e:
-                print(f"ERROR: DuckDuckGo search failed: {e}")
-                claim.evidence.append(Evidence(
-                    source="Search Error",
-                    content=f"Failed to perform web search: {str(e)}",
-                    url=""
-                ))
+                log.error("DuckDuckGo search failed", error=str(e))
+                telemetry.error("search_error")
+                if not local_results:
+                    claim.evidence.append(Evidence(
+                        source="Search Error",
+                        content=f"Failed to perform web search: {str(e)}",
+                        url=""
+                    ))
         
+        telemetry.note(f"{len(claim.evidence)} evidence items")
         return claim
 
 class ScoreAgent:
     def __init__(self):
-        self.client = Groq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
+        # No client-side retries: a retry would run past the request's deadline
+        self.client = Groq(api_key=GROQ_API_KEY, max_retries=0) if GROQ_API_KEY else None
         if not self.client:
-            print("WARNING: GROQ_API_KEY not set. Scoring will return UNVERIFIED.")
+            log.warning("GROQ_API_KEY not set. Scoring will return UNVERIFIED.")
 
-    def score(self, claim: Claim) -> ScoreResponse:
+    @telemetry.instrument("ScoreAgent", "Scored claim")
+    def score(self, claim: Claim, deadline: Optional[Deadline] = None) -> ScoreResponse:
+        deadline = deadline or unbounded()
         if not self.client:
             # Fallback if no API key
-            print("ERROR: Cannot score claim - no GROQ_API_KEY configured")
+            log.error("Cannot score claim - no GROQ_API_KEY configured")
+            telemetry.error("not_configured")
             return ScoreResponse(
                 final_score=0,
                 source_reliability=0,
@@ -272,6 +374,15 @@ class ScoreAgent:
             )
 
         evidence_text = "\n".join([f"- {e.content} ({e.url})" for e in claim.evidence])
+        # Source reliability comes from the domain registry when the evidence has
+        # URLs, so it is reproducible and the model only judges the evidence itself
+        reliability = domain_registry.assess(e.url for e in claim.evidence)
+        if reliability is not None:
+            sources = ", ".join(f"{s['domain']} ({s['category']}, {s['score']})" for s in reliability["sources"])
+            reliability_text = (f"2. source_reliability: {reliability['score']} (precomputed from the sources' "
+                                f"domains: {sources}). Use this value as given.")
+        else:
+            reliability_text = "2. source_reliability: How trustworthy are the sources (0=unreliable, 100=highly reliable)"
         prompt = f"""
         You are an expert fact-checker. Analyze the following claim based on the evidence provided.
         
@@ -287,7 +398,7 @@ class ScoreAgent:
            - If claim is MIXED/UNCERTAIN, score should be 40-60
            - If claim is VERIFIED, score should be 70-100
         
-        2. source_reliability: How trustworthy are the sources (0=unreliable, 100=highly reliable)
+        {reliability_text}
         
         3. evidence_strength: How strong is the evidence (0=weak/contradictory, 100=strong/conclusive)
         
@@ -308,21 +419,38 @@ class ScoreAgent:
         {{"final_score": <number>, "source_reliability": <number>, "evidence_strength": <number>, "consistency": <number>, "verdict": "<string>"}}
         """
         
-        try:
-            print(f"Scoring claim with Groq AI: {claim.text[:50]}...")
-            chat_completion = self.client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": "You are a fact-checking AI. Output ONLY JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                model="llama-3.3-70b-versatile",
-                response_format={"type": "json_object"}
+        if not deadline.allows("score", minimum=1.0):
+            telemetry.error("deadline")
+            return ScoreResponse(
+                final_score=0,
+                source_reliability=0,
+                evidence_strength=0,
+                consistency=0,
+                verdict="UNVERIFIED"
             )
+
+        try:
+            log.info("Scoring claim with Groq", claim=claim.text[:50])
+            with span("score.llm", model="llama-3.3-70b-versatile", evidence=len(claim.evidence)):
+                chat_completion = self.client.chat.completions.create(
+                    messages=[
+                        {"role": "system", "content": "You are a fact-checking AI. Output ONLY JSON."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    model="llama-3.3-70b-versatile",
+                    response_format={"type": "json_object"},
+                    timeout=deadline.timeout(SCORE_TIMEOUT)
+                )
+            telemetry.tokens("ScoreAgent", chat_completion.usage)
             result = json.loads(chat_completion.choices[0].message.content)
-            print(f"Scoring complete: {result.get('verdict', 'UNKNOWN')}")
+            log.info("Scoring complete", verdict=result.get('verdict', 'UNKNOWN'))
+            telemetry.note(result.get('verdict', 'UNKNOWN'))
+            if reliability is not None:
+                result["source_reliability"] = reliability["score"]
             return ScoreResponse(**result)
         except json.JSONDecodeError as e:
-            print(f"ERROR: Failed to parse Groq response as JSON: {e}")
+            log.error("Failed to parse Groq response as JSON", error=str(e))
+            telemetry.error("bad_response")
             return ScoreResponse(
                 final_score=0,
                 source_reliability=0,
@@ -331,7 +459,10 @@ class ScoreAgent:
                 verdict="UNVERIFIED"
             )
         except Exception as e:
-            print(f"ERROR: Groq API call failed: {e}")
+            log.error("Groq API call failed", error=str(e))
+            telemetry.error("groq_error")
+            if deadline.remaining() < MIN_STAGE_SECONDS:
+                deadline.cut("score")
             return ScoreResponse(
                 final_score=0,
                 source_reliability=0,
@@ -342,34 +473,40 @@ class ScoreAgent:
 
 class ExplainAgent:
     def __init__(self):
-        self.client = Groq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
+        self.client = Groq(api_key=GROQ_API_KEY, max_retries=0) if GROQ_API_KEY else None
         if not self.client:
-            print("WARNING: GROQ_API_KEY not set. Explanations will be unavailable.")
+            log.warning("GROQ_API_KEY not set. Explanations will be unavailable.")
 
+    @telemetry.instrument("ExplainAgent", "Generated explanation")
     def explain(self, claim_text: str, verdict: str, lang: str = "en") -> str:
         if not self.client:
-            print("ERROR: Cannot generate explanation - no GROQ_API_KEY configured")
+            log.error("Cannot generate explanation - no GROQ_API_KEY configured")
+            telemetry.error("not_configured")
             return "Explanation unavailable (No GROQ_API_KEY configured)."
 
         prompt = f"Explain why the claim '{claim_text}' was judged as {verdict}. Language: {lang}. Keep it concise."
         
         try:
-            print(f"Generating explanation for verdict: {verdict}")
-            chat_completion = self.client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant."},
-                    {"role": "user", "content": prompt}
-                ],
-                model="llama-3.3-70b-versatile",
-            )
+            log.info("Generating explanation", verdict=verdict, lang=lang)
+            with span("explain.llm", model="llama-3.3-70b-versatile"):
+                chat_completion = self.client.chat.completions.create(
+                    messages=[
+                        {"role": "system", "content": "You are a helpful assistant."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    model="llama-3.3-70b-versatile",
+                )
+            telemetry.tokens("ExplainAgent", chat_completion.usage)
             explanation = chat_completion.choices[0].message.content
-            print(f"Explanation generated successfully")
+            log.debug("Explanation generated")
             return explanation
         except Exception as e:
-            print(f"ERROR: Failed to generate explanation: {e}")
+            log.error("Failed to generate explanation", error=str(e))
+            telemetry.error("groq_error")
             return f"Error generating explanation: {str(e)}"
 
 class CrisisAgent:
+    @telemetry.instrument("CrisisAgent", "Checked claims for crises")
     def detect_crisis(self, claims: List[Claim]) -> CrisisResponse:
         alerts = []
         keywords = [
@@ -394,6 +531,7 @@ class CrisisAgent:
                     description=claim.text
                 ))
         
+        telemetry.note(f"{len(alerts)} alerts in {len(claims)} claims")
         return CrisisResponse(
             crisis_detected=len(alerts) > 0,
             alerts=alerts,
@@ -0,0 +1,188 @@
+"""
+AI Detector Module
+Offline AI-generated image detection from frequency-domain and
+noise-residual statistics, scored by a small bundled linear model.
+"""
+import os
+import json
+import time
+from typing import Dict, List, Optional
+import numpy as np
+from PIL import Image
+from uploads import image_stream
+from logs import get_logger
+
+log = get_logger("ai_detector")
+
+AI_DETECTOR_MODEL = os.getenv("AI_DETECTOR_MODEL") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "ai_detector_model.json"
+)
+CROP_SIZE = 256             # power of two so upsampling peaks land on exact FFT bins
+MAX_CROPS = 4
+DECODE_MIN_SIDE = 1024      # JPEGs are decoded at reduced scale down to this long side
+RADIAL_BINS = 8
+# Residual spread (in 8-bit levels) below which an image has no texture to
+# judge: flat fills, solid colours, heavily smoothed graphics
+MIN_RESIDUAL_STD = 0.5
+
+FEATURE_NAMES = (
+    [f"radial_{i}" for i in range(RADIAL_BINS)]
+    + ["peak_x2", "peak_x4", "peak_x8"]
+    + ["corr_rg", "corr_gb", "corr_rb"]
+    + ["cfa_green", "cfa_red"]
+    + ["residual_log_std", "residual_kurtosis", "residual_flat_share"]
+)
+
+_window = np.hanning(CROP_SIZE).astype(np.float32)
+_HANN = np.outer(_window, _window)
+_fy = np.fft.fftfreq(CROP_SIZE)[:, None]
+_fx = np.fft.rfftfreq(CROP_SIZE)[None, :]
+_RADIUS = np.sqrt(_fy ** 2 + _fx ** 2) / 0.5  # 0 at DC, 1 at Nyquist along an axis
+_RADIAL_INDEX = np.minimum((_RADIUS * RADIAL_BINS).astype(np.int64), RADIAL_BINS).ravel()
+
+
+def _peak_positions(factor: int) -> List[tuple]:
+    """
+    rfft2 bins where k-fold upsampling leaves periodic peaks: odd multiples
+    of N/k (even multiples belong to the smaller factors).
+    """
+    step = CROP_SIZE // factor
+    return [
+        (y, x)
+        for y in range(0, CROP_SIZE, step)
+        for x in range(0, CROP_SIZE // 2 + 1, step)
+        if (y // step) % 2 or (x // step) % 2
+    ]
+
+
+_PEAKS = {factor: _peak_positions(factor) for factor in (2, 4, 8)}
+_PEAK_YX = np.array([p for factor in (2, 4, 8) for p in _PEAKS[factor]])
+_PEAK_FACTOR = np.array([factor for factor in (2, 4, 8) for _ in _PEAKS[factor]])
+# 5x5 neighborhood offsets without the center
+_RING = np.array([(dy, dx) for dy in range(-2, 3) for dx in range(-2, 3) if dy or dx])
+
+
+def _crops(image_data: bytes) -> np.ndarray:
+    """Up to MAX_CROPS native-resolution CROP_SIZE tiles as one (n, S, S, 3) float32 batch."""
+    image = Image.open(image_stream(image_data))
+    if image.format == "JPEG":
+        image.draft("RGB", (DECODE_MIN_SIDE, DECODE_MIN_SIDE))
+    image = image.convert("RGB")
+    width, height = image.size
+    if min(width, height) < CROP_SIZE:
+        scale = CROP_SIZE / min(width, height)
+        image = image.resize((max(CROP_SIZE, round(width * scale)), max(CROP_SIZE, round(height * scale))), Image.BICUBIC)
+        width, height = image.size
+    # Tiles spread over the image; only they are converted to float
+    ys = np.linspace(0, height - CROP_SIZE, 2 if height >= 2 * CROP_SIZE else 1).astype(int)
+    xs = np.linspace(0, width - CROP_SIZE, 2 if width >= 2 * CROP_SIZE else 1).astype(int)
+    boxes = [(x, y, x + CROP_SIZE, y + CROP_SIZE) for y in ys for x in xs][:MAX_CROPS]
+    return np.stack([np.asarray(image.crop(box), dtype=np.float32) for box in boxes])
+
+
+def _residual(batch: np.ndarray) -> np.ndarray:
+    """Separable second-derivative high-pass, same size as the input (edge padded)."""
+    padded = np.pad(batch, ((0, 0), (1, 1), (1, 1), (0, 0)), mode="edge")
+    horizontal = padded[:, :, :-2] - 2 * padded[:, :, 1:-1] + padded[:, :, 2:]
+    return horizontal[:, :-2] - 2 * horizontal[:, 1:-1] + horizontal[:, 2:]
+
+
+def extract_features(image_data: bytes) -> np.ndarray:
+    """FEATURE_NAMES-ordered float64 vector for one image."""
+    batch = _crops(image_data)
+    residual = _residual(batch)
+    luma = residual @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+    # Power spectrum of the luminance residual, averaged over tiles
+    spectrum = np.fft.rfft2(luma * _HANN, axes=(1, 2))
+    power = (spectrum.real ** 2 + spectrum.imag ** 2).mean(axis=0)
+    log_power = np.log(power + 1e-6)
+    radial = np.bincount(_RADIAL_INDEX, weights=log_power.ravel(), minlength=RADIAL_BINS + 1)
+    radial = (radial / np.bincount(_RADIAL_INDEX, minlength=RADIAL_BINS + 1))[:RADIAL_BINS]
+    radial -= radial.mean()
+
+    # Periodic peaks against the median of their 5x5 neighborhood
+    padded = np.pad(log_power, 2, mode="edge")
+    neighborhoods = padded[_PEAK_YX[:, 0, None] + _RING[:, 0] + 2, _PEAK_YX[:, 1, None] + _RING[:, 1] + 2]
+    contrast = log_power[_PEAK_YX[:, 0], _PEAK_YX[:, 1]] - np.median(neighborhoods, axis=1)
+    peaks = [contrast[_PEAK_FACTOR == factor].max() for factor in (2, 4, 8)]
+
+    # Inter-channel correlation of residuals (demosaicing couples channels)
+    channels = np.moveaxis(residual, -1, 0).reshape(3, -1)
+    channels = channels - channels.mean(axis=1, keepdims=True)
+    covariance = (channels @ channels.T).astype(np.float64)
+    scale = np.sqrt(np.diag(covariance)) + 1e-9
+    correlation = covariance / np.outer(scale, scale)
+
+    # Bayer lattice: residual energy on the 2x2 diagonal vs anti-diagonal sites
+    def lattice_ratio(channel):
+        energy = np.square(residual[..., channel])
+        diagonal = energy[:, 0::2, 0::2].mean() + energy[:, 1::2, 1::2].mean()
+        anti = energy[:, 0::2, 1::2].mean() + energy[:, 1::2, 0::2].mean()
+        return abs(np.log((diagonal + 1e-6) / (anti + 1e-6)))
+
+    values = luma.ravel()
+    std = float(values.std())
+    if std < MIN_RESIDUAL_STD:
+        raise ValueError("Image has too little texture for local AI detection")
+    standardized = np.square((values - values.mean()) / std)
+    kurtosis = float(np.mean(standardized * standardized, dtype=np.float64))
+
+    return np.concatenate([
+        radial,
+        peaks,
+        [correlation[0, 1], correlation[1, 2], correlation[0, 2]],
+        [lattice_ratio(1), lattice_ratio(0)],
+        [np.log(std), np.log(kurtosis + 1e-9), np.mean(np.abs(values) < 0.5)],
+    ]).astype(np.float64)
+
+
+class SpectralDetector:
+    """
+    Standardized features -> logistic regression. Weights and scaling live
+    in a JSON model file written by evaluate_ai_detector.py --train.
+    """
+
+    def __init__(self, model_path: str = AI_DETECTOR_MODEL):
+        self.model = None
+        try:
+            with open(model_path, encoding="utf-8") as f:
+                model = json.load(f)
+            if model["features"] != FEATURE_NAMES:
+                raise ValueError("feature list does not match this detector version")
+            self.model = model
+            self._mean = np.array(model["mean"])
+            self._scale = np.array(model["scale"])
+            self._weights = np.array(model["weights"])
+            self._bias = float(model["bias"])
+        except Exception as e:
+            log.warning("AI detector model unavailable. Local AI detection disabled.", error=str(e))
+
+    @property
+    def available(self) -> bool:
+        return self.model is not None
+
+    def probability(self, features: np.ndarray) -> float:
+        logit = float(((features - self._mean) / self._scale) @ self._weights + self._bias)
+        return float(1.0 / (1.0 + np.exp(-logit)))
+
+    def predict(self, image_data: bytes) -> Dict:
+        started = time.perf_counter()
+        features = extract_features(image_data)
+        if not np.all(np.isfinite(features)):
+            raise ValueError("Image features out of range for local AI detection")
+        probability = self.probability(features)
+        contributions = (features - self._mean) / self._scale * self._weights
+        top = np.argsort(-np.abs(contributions))[:3]
+        return {
+            "ai_probability": round(probability * 100, 2),
+            "features": {name: round(float(value), 4) for name, value in zip(FEATURE_NAMES, features)},
+            "top_signals": [FEATURE_NAMES[i] for i in top],
+            "model_version": self.model.get("version"),
+            "trained_on": self.model.get("trained_on"),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+
+# Global instance
+spectral_detector = SpectralDetector()
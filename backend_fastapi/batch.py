@@ -0,0 +1,282 @@
+"""
+Batch Module
+Analysis of a set of images (several uploads or a zip/tar archive) from
+one story. CPU-bound stages run on a process pool, network stages stay
+on the event loop, and results are yielded as each image finishes.
+"""
+import os
+import json
+import time
+import asyncio
+import tarfile
+import zipfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, Dict, List, Optional
+from batch_worker import analyze_cpu, init_worker
+from deadline import Deadline
+from image_analyzer import CACHED_STAGES, ImageInfo, image_analyzer, prepare_model_input
+from image_cache import image_result_cache
+from uploads import BATCH_MAX_TOTAL_BYTES, UPLOAD_MAX_BYTES, UploadRejected, receive_upload, sniff_format
+from logs import get_logger
+
+log = get_logger("batch")
+
+# Worker processes for the CPU-bound stages (decode, hashing, local AI detection, forensics)
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS") or os.cpu_count() or 1)
+# Images analyzed at once; the rest wait so network stages of one overlap CPU stages of others
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY") or 2 * BATCH_WORKERS)
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "50"))
+
+
+class BatchItem:
+    """One image of a batch, or the reason it was rejected."""
+
+    def __init__(self, name: str, data: Optional[bytes] = None, error: Optional[str] = None, status: int = 200):
+        self.name = name
+        self.data = data
+        self.error = error
+        self.status = status
+
+
+def _archive_kind(head: bytes) -> Optional[str]:
+    if head.startswith(b"PK\x03\x04"):
+        return "zip"
+    if head.startswith(b"\x1f\x8b") or head[257:262] == b"ustar":
+        return "tar"
+    return None
+
+
+def _skipped_member(name: str) -> bool:
+    base = os.path.basename(name.rstrip("/"))
+    return not base or base.startswith(".") or name.startswith("__MACOSX/")
+
+
+class BatchAnalyzer:
+    def __init__(self):
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Started on first use; spawn keeps workers free of the API's threads and indexes."""
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=BATCH_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_worker,
+                )
+                log.info("Batch process pool started", workers=BATCH_WORKERS)
+            return self._pool
+
+    def _discard_pool(self, pool: ProcessPoolExecutor):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def collect(self, uploads: List) -> List[BatchItem]:
+        """
+        Read every upload into memory (archives expanded) before streaming
+        starts, so nothing depends on the request's spool files afterwards.
+        Blocking; call via run_in_threadpool.
+        """
+        items: List[BatchItem] = []
+        total = 0
+        for upload in uploads:
+            source = upload.file
+            source.seek(0)
+            kind = _archive_kind(source.read(512))
+            if kind:
+                for item in self._expand(upload, kind, BATCH_MAX_TOTAL_BYTES - total):
+                    items.append(item)
+                    total += len(item.data or b"")
+            else:
+                try:
+                    with receive_upload(upload) as received:
+                        items.append(BatchItem(upload.filename or "upload", bytes(received.data)))
+                        total += received.size
+                except UploadRejected as e:
+                    items.append(BatchItem(upload.filename or "upload", error=e.detail, status=e.status_code))
+            if len(items) > BATCH_MAX_FILES:
+                raise UploadRejected(413, f"Batch exceeds {BATCH_MAX_FILES} files")
+            if total > BATCH_MAX_TOTAL_BYTES:
+                raise UploadRejected(413, "Batch exceeds the total size limit")
+        if not items:
+            raise UploadRejected(400, "No images in batch")
+        return items
+
+    def _expand(self, upload, kind: str, room: int) -> List[BatchItem]:
+        """Image members of a zip/tar archive; sizes are checked before anything is inflated."""
+        prefix = f"{upload.filename or 'archive'}/"
+        upload.file.seek(0)
+        members = []
+        try:
+            if kind == "zip":
+                archive = zipfile.ZipFile(upload.file)
+                for info in archive.infolist():
+                    if not info.is_dir() and not _skipped_member(info.filename):
+                        members.append((info.filename, info.file_size, lambda info=info: archive.open(info)))
+            else:
+                archive = tarfile.open(fileobj=upload.file, mode="r:*")
+                for info in archive.getmembers():
+                    if info.isfile() and not _skipped_member(info.name):
+                        members.append((info.name, info.size, lambda info=info: archive.extractfile(info)))
+        except (zipfile.BadZipFile, tarfile.TarError) as e:
+            return [BatchItem(upload.filename or "archive", error=f"Unreadable archive: {e}", status=400)]
+
+        if len(members) > BATCH_MAX_FILES:
+            raise UploadRejected(413, f"Batch exceeds {BATCH_MAX_FILES} files")
+        items = []
+        for name, size, opener in members:
+            if size > UPLOAD_MAX_BYTES:
+                items.append(BatchItem(prefix + name, error="File exceeds the size limit", status=413))
+                continue
+            if size > room:
+                raise UploadRejected(413, "Batch exceeds the total size limit")
+            with opener() as member:
+                # Bounded read: the header's size is not trusted
+                data = member.read(UPLOAD_MAX_BYTES + 1)
+            if len(data) > UPLOAD_MAX_BYTES:
+                items.append(BatchItem(prefix + name, error="File exceeds the size limit", status=413))
+            elif sniff_format(data[:32]) is None:
+                items.append(BatchItem(prefix + name, error="Not an image", status=415))
+            else:
+                items.append(BatchItem(prefix + name, data))
+                room -= len(data)
+        return items
+
+    async def _cpu_stages(self, image_data: bytes) -> Dict:
+        pool = self._get_pool()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, analyze_cpu, image_data)
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory on a huge decode): the next image gets a fresh pool
+            log.error("Batch worker process died; restarting pool")
+            self._discard_pool(pool)
+            raise
+
+    async def analyze(self, item: BatchItem, budget: Optional[float] = None, source_url: Optional[str] = None) -> Dict:
+        """
+        Same result shape as ImageAnalyzer.analyze_image, plus forensics.
+        Uses the image cache and reverse index the same way.
+        """
+        deadline = Deadline.from_request(budget)
+        started = time.perf_counter()
+        image_data = item.data
+        cpu = await self._cpu_stages(image_data)
+        signature = cpu.get("signature")
+        timings = {name: value for name, value in cpu["timings_ms"].items()}
+
+        if signature is not None:
+            cached = image_result_cache.lookup(signature.phash, signature.dhash)
+            if cached:
+                result, match = cached
+                reverse = await asyncio.to_thread(image_analyzer.reverse_image_search, image_data, signature)
+                # Metadata is this file's own (see ImageAnalyzer.analyze_image)
+                metadata = await asyncio.to_thread(image_analyzer.extract_metadata, image_data)
+                image_analyzer._record_sighting(signature, source_url, None)
+                timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+                return {"ai_detection": result["ai_detection"], "reverse_search": reverse, "description": result["description"],
+                        "metadata": metadata, "forensics": cpu.get("forensics"), "timings_ms": timings, "cache": match}
+
+        try:
+            info = await asyncio.to_thread(ImageInfo, image_data)
+        except Exception as e:
+            log.error("Failed to decode image header", error=str(e))
+            info = None
+
+        async def timed(name, call, *args):
+            stage_started = time.perf_counter()
+            value = await asyncio.to_thread(call, *args)
+            timings[name] = round((time.perf_counter() - stage_started) * 1000, 1)
+            return value
+
+        model_input = None
+        if image_analyzer.hf_client and info:
+            try:
+                model_input = (await asyncio.to_thread(prepare_model_input, image_data))[0]
+            except Exception as e:
+                log.error("Failed to prepare model input, sending original", error=str(e))
+        if image_analyzer.hf_client:
+            ai_detection = timed("ai_detection", image_analyzer.detect_ai_generated, image_data, deadline, info, model_input)
+            description = timed("description", image_analyzer.describe_image, image_data, deadline, info, model_input)
+        elif cpu.get("spectral"):
+            ai_detection = timed("ai_detection", image_analyzer._local_ai_detection, image_data, cpu["spectral"])
+            description = timed("description", image_analyzer._fallback_description, image_data, info)
+        else:
+            ai_detection = timed("ai_detection", image_analyzer._fallback_ai_detection, image_data, info)
+            description = timed("description", image_analyzer._fallback_description, image_data, info)
+        reverse_search = timed("reverse_search", image_analyzer.reverse_image_search, image_data, signature) if signature else asyncio.sleep(0, [])
+        metadata = timed("metadata", image_analyzer.extract_metadata, image_data, info)
+
+        values = await asyncio.gather(ai_detection, reverse_search, description, metadata)
+        results = dict(zip(("ai_detection", "reverse_search", "description", "metadata"), values))
+
+        complete = (
+            signature is not None
+            and image_analyzer.hf_client is not None
+            and not deadline.cut_short
+            and results["ai_detection"].get("model") not in ("local_spectral", "fallback_heuristic", "error")
+        )
+        if complete:
+            image_result_cache.store(signature.phash, signature.dhash, {name: results[name] for name in CACHED_STAGES})
+        if signature is not None:
+            image_analyzer._record_sighting(signature, source_url, None)
+
+        results["forensics"] = cpu.get("forensics") or {"error": (cpu.get("errors") or {}).get("forensics", "Forensic analysis failed")}
+        timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+        results["timings_ms"] = timings
+        results["cache"] = {"hit": False}
+        if deadline.cut_short:
+            results["deadline"] = deadline.summary()
+        return results
+
+    async def stream(self, items: List[BatchItem], budget: Optional[float] = None, source_url: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        NDJSON lines in completion order: one per image (its `index` in the
+        batch, filename and analysis or error), then a summary line.
+        """
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+        async def run(index: int, item: BatchItem) -> Dict:
+            line = {"index": index, "filename": item.name}
+            if item.error:
+                return {**line, "error": item.error, "status": item.status}
+            async with semaphore:
+                try:
+                    return {**line, "bytes": len(item.data), "analysis": await self.analyze(item, budget, source_url)}
+                except Exception as e:
+                    log.exception("Batch analysis failed", image=item.name)
+                    return {**line, "error": str(e) or type(e).__name__, "status": 500}
+
+        errors = 0
+        tasks = [asyncio.ensure_future(run(index, item)) for index, item in enumerate(items)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                line = await finished
+                errors += "error" in line
+                yield json.dumps(line, default=str) + "\n"
+        finally:
+            # Client went away: stop work that nobody will read
+            for task in tasks:
+                task.cancel()
+        yield json.dumps({
+            "done": True,
+            "images": len(items),
+            "errors": errors,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }) + "\n"
+
+
+# Global instance
+batch_analyzer = BatchAnalyzer()
@@ -0,0 +1,44 @@
+"""
+Batch Worker Module
+CPU-bound image stages run in batch worker processes. Kept free of the
+API's heavy imports (indexes, HTTP clients) so spawned workers start fast
+and don't load the parent's state.
+"""
+import os
+import time
+from typing import Dict
+
+
+def init_worker():
+    # One process per core already: keep each worker's NumPy and
+    # forensic detectors single-threaded. Runs before the lazy imports below.
+    os.environ["OMP_NUM_THREADS"] = "1"
+    os.environ["OPENBLAS_NUM_THREADS"] = "1"
+    os.environ["FORENSICS_WORKERS"] = "1"
+
+
+def analyze_cpu(image_data: bytes) -> Dict:
+    """
+    Perceptual signature, local AI detection and forensics for one image.
+    Each part fails independently (None plus an entry in "errors").
+    """
+    from image_hash import image_signature
+    from ai_detector import spectral_detector
+    from forensics import forensics_engine
+
+    result = {"timings_ms": {}}
+
+    def stage(name, compute):
+        started = time.perf_counter()
+        try:
+            result[name] = compute()
+        except Exception as e:
+            result[name] = None
+            result.setdefault("errors", {})[name] = str(e)
+        result["timings_ms"][name] = round((time.perf_counter() - started) * 1000, 1)
+
+    stage("signature", lambda: image_signature(image_data))
+    if spectral_detector.available:
+        stage("spectral", lambda: spectral_detector.predict(image_data))
+    stage("forensics", lambda: forensics_engine.analyze(image_data))
+    return result
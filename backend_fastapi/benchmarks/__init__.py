@@ -0,0 +1,10 @@
+"""
+Benchmarks
+Performance suite for the backend, runnable without API keys or network:
+local stand-ins for every upstream (fakes.py), micro-benchmarks of the hot
+functions (micro.py), HTTP load scenarios (load.py) and a comparison of
+two result files (compare.py). Run from backend_fastapi:
+
+    python -m benchmarks.run --out results.json
+    python -m benchmarks.compare baseline.json results.json
+"""
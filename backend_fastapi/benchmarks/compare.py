@@ -0,0 +1,81 @@
+"""
+Benchmark Comparison
+Compares two result files from benchmarks.run, metric by metric, and
+exits with status 1 when any metric regressed by more than the threshold
+(micro p50, payload and response bytes, load p50/p95/p99 latency and
+throughput, load error rate).
+
+    python -m benchmarks.compare baseline.json results.json --threshold 10
+"""
+import sys
+import json
+import argparse
+from typing import Dict, Iterator, List, Tuple
+
+# Error rates move in absolute terms: this many points is a regression
+ERROR_RATE_TOLERANCE = 0.01
+
+
+def metrics(results: Dict) -> Iterator[Tuple[str, float, bool]]:
+    """(name, value, higher_is_better) for every compared metric."""
+    for name, stats in results.get("micro", {}).items():
+        yield f"micro/{name}/p50_us", stats["p50_us"], False
+    for name, sizes in results.get("payloads", {}).items():
+        for coding, size in sizes.items():
+            yield f"payload/{name}/{coding}_bytes", size, False
+    for name, stats in results.get("load", {}).items():
+        yield f"load/{name}/throughput_rps", stats["throughput_rps"], True
+        if stats.get("bytes_per_response"):
+            yield f"load/{name}/bytes_per_response", stats["bytes_per_response"], False
+        for quantile in ("p50", "p95", "p99"):
+            if stats["latency_ms"].get(quantile) is not None:
+                yield f"load/{name}/{quantile}_ms", stats["latency_ms"][quantile], False
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> Tuple[List[Dict], List[str]]:
+    before = {name: value for name, value, _ in metrics(baseline)}
+    rows, regressions = [], []
+    for name, value, higher_is_better in metrics(current):
+        if name not in before:
+            continue
+        old = before[name]
+        change = ((value - old) / old * 100) if old else 0.0
+        worse = -change if higher_is_better else change
+        rows.append({"metric": name, "baseline": old, "current": value, "change_pct": round(change, 1)})
+        if worse > threshold:
+            regressions.append(name)
+    for name, stats in current.get("load", {}).items():
+        old = baseline.get("load", {}).get(name)
+        if old and stats["error_rate"] - old["error_rate"] > ERROR_RATE_TOLERANCE:
+            regressions.append(f"load/{name}/error_rate")
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed regression in percent")
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as handle:
+        baseline = json.load(handle)
+    with open(args.current, encoding="utf-8") as handle:
+        current = json.load(handle)
+
+    rows, regressions = compare(baseline, current, args.threshold)
+    print(f"{baseline['meta']['commit']} -> {current['meta']['commit']}")
+    for row in rows:
+        flag = "  REGRESSION" if row["metric"] in regressions else ""
+        print(f"  {row['metric']:<44} {row['baseline']:>12} {row['current']:>12} {row['change_pct']:>+8.1f}%{flag}")
+    for name in regressions:
+        if name.endswith("/error_rate"):
+            print(f"  {name:<44} REGRESSION")
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold:g}%")
+        sys.exit(1)
+    print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Fake Upstreams
+One local HTTP server standing in for Groq, NewsData, DuckDuckGo, Hugging
+Face inference and arbitrary article pages, each with its own latency and
+error profile. The app is pointed at it through environment variables
+(see environment()); DuckDuckGo has no configurable endpoint, so FakeDDGS
+replaces agents.DDGS with a client for the fake search route.
+"""
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+import requests
+
+SERVICES = ("groq", "newsdata", "search", "hf", "articles")
+
+
+class ServiceProfile:
+    """
+    Latency is latency_ms plus lognormal jitter with a median of jitter_ms;
+    error_rate of requests get a 500 and timeout_rate hang for hang_ms.
+    """
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0,
+                 timeout_rate: float = 0, hang_ms: float = 30000):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang_ms = hang_ms
+
+    def delay(self, rng: random.Random) -> float:
+        jitter = rng.lognormvariate(0, 0.75) * self.jitter_ms if self.jitter_ms else 0
+        return (self.latency_ms + jitter) / 1000
+
+    def to_dict(self) -> Dict:
+        return dict(self.__dict__)
+
+
+# Named profiles: per-service overrides of the defaults
+PROFILES = {
+    "instant": {},
+    "realistic": {
+        "groq": {"latency_ms": 350, "jitter_ms": 120, "error_rate": 0.01},
+        "newsdata": {"latency_ms": 250, "jitter_ms": 80, "error_rate": 0.01},
+        "search": {"latency_ms": 500, "jitter_ms": 200, "error_rate": 0.02},
+        "hf": {"latency_ms": 700, "jitter_ms": 300, "error_rate": 0.02},
+        "articles": {"latency_ms": 120, "jitter_ms": 60},
+    },
+    "degraded": {
+        "groq": {"latency_ms": 1200, "jitter_ms": 600, "error_rate": 0.1, "timeout_rate": 0.02},
+        "newsdata": {"latency_ms": 800, "jitter_ms": 400, "error_rate": 0.1},
+        "search": {"latency_ms": 1500, "jitter_ms": 800, "error_rate": 0.15, "timeout_rate": 0.02},
+        "hf": {"latency_ms": 2500, "jitter_ms": 1000, "error_rate": 0.1, "timeout_rate": 0.05},
+        "articles": {"latency_ms": 400, "jitter_ms": 300, "error_rate": 0.05},
+    },
+}
+
+WORDS = (
+    "officials said the report confirmed earlier claims about the flood response while experts "
+    "questioned figures released by the ministry and local residents described damage across the region "
+    "after the storm analysts warned that misinformation spread quickly online as videos circulated"
+).split()
+
+
+def article_html(article_id: int, size: int = 20000) -> str:
+    """Deterministic news-like page of about `size` bytes (nav, scripts, paragraphs)."""
+    rng = random.Random(article_id)
+    title = " ".join(rng.choice(WORDS) for _ in range(8)).capitalize()
+    parts = [
+        f"<!DOCTYPE html><html><head><title>{title}</title>",
+        "<script>window.dataLayer=[];function track(){}</script><style>body{font-family:serif}</style></head><body>",
+        "<nav><ul>" + "".join(f"<li><a href='/section/{i}'>Section {i}</a></li>" for i in range(12)) + "</ul></nav>",
+        f"<article><h1>{title}</h1>",
+    ]
+    length = sum(len(part) for part in parts)
+    while length < size:
+        paragraph = "<p>" + " ".join(rng.choice(WORDS) for _ in range(60)) + ".</p>"
+        parts.append(paragraph)
+        length += len(paragraph)
+    parts.append("</article><footer>&copy; Example News</footer></body></html>")
+    return "".join(parts)
+
+
+def _articles(category: str, count: int = 10):
+    rng = random.Random(category)
+    return [{
+        "title": " ".join(rng.choice(WORDS) for _ in range(9)).capitalize(),
+        "source_id": f"source{rng.randint(1, 20)}",
+        "description": " ".join(rng.choice(WORDS) for _ in range(30)),
+        "link": f"https://news.example/{category}/{i}",
+        "image_url": None,
+        "pubDate": "2024-05-01 12:30:00",
+    } for i in range(count)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "FakeUpstreams"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body, content_type: str = "application/json"):
+        data = body if isinstance(body, bytes) else (body if isinstance(body, str) else json.dumps(body)).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self):
+        url = urlparse(self.path)
+        service = url.path.strip("/").split("/", 1)[0]
+        if service not in SERVICES:
+            self._send(404, {"error": "unknown service"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        profile = self.server.profiles[service]
+        rng = self.server.rng()
+        self.server.count(service)
+        roll = rng.random()
+        if roll < profile.timeout_rate:
+            time.sleep(profile.hang_ms / 1000)
+        time.sleep(profile.delay(rng))
+        if roll < profile.timeout_rate + profile.error_rate:
+            self._send(500, {"error": f"fake {service} failure"})
+            return
+        getattr(self, f"_{service}")(url, body, rng)
+
+    do_GET = _handle
+    do_POST = _handle
+
+    def _groq(self, url, body: bytes, rng: random.Random):
+        request = json.loads(body or b"{}")
+        if request.get("response_format", {}).get("type") == "json_object":
+            score = rng.randint(0, 100)
+            verdict = "FALSE" if score < 35 else "VERIFIED" if score > 65 else "MIXED"
+            content = json.dumps({"final_score": score, "source_reliability": rng.randint(20, 95),
+                                  "evidence_strength": rng.randint(20, 95), "consistency": rng.randint(20, 95),
+                                  "verdict": verdict})
+        else:
+            content = "The available evidence does not support this claim; independent sources contradict it."
+        prompt_tokens = sum(len(m.get("content", "")) for m in request.get("messages", [])) // 4
+        self._send(200, {
+            "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                      "total_tokens": prompt_tokens + len(content) // 4},
+        })
+
+    def _newsdata(self, url, body: bytes, rng: random.Random):
+        query = parse_qs(url.query)
+        category = (query.get("category") or query.get("q") or ["top"])[0]
+        self._send(200, {"status": "success", "totalResults": 10, "results": _articles(category)})
+
+    def _search(self, url, body: bytes, rng: random.Random):
+        query = (parse_qs(url.query).get("q") or [""])[0]
+        self._send(200, [{
+            "title": f"Fact check: {query[:60]}",
+            "href": f"https://factcheck.example/{abs(hash((query, i))) % 100000}",
+            "body": " ".join(rng.choice(WORDS) for _ in range(40)),
+        } for i in range(int((parse_qs(url.query).get("max_results") or ["2"])[0]))])
+
+    def _hf(self, url, body: bytes, rng: random.Random):
+        if "blip" in url.path or "caption" in url.path:
+            self._send(200, [{"generated_text": "a photo of a flooded street with cars"}])
+        else:
+            ai = rng.random()
+            self._send(200, [{"label": "artificial", "score": ai}, {"label": "human", "score": 1 - ai}])
+
+    def _articles(self, url, body: bytes, rng: random.Random):
+        article_id = int(url.path.rstrip("/").rsplit("/", 1)[-1] or 0) if url.path.rstrip("/")[-1:].isdigit() else 0
+        size = int((parse_qs(url.query).get("size") or ["20000"])[0])
+        self._send(200, article_html(article_id, size), "text/html; charset=utf-8")
+
+
+class FakeUpstreams(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, profile: str = "instant", overrides: Optional[Dict[str, Dict]] = None, port: int = 0, seed: int = 1):
+        super().__init__(("127.0.0.1", port), _Handler)
+        settings = {**PROFILES[profile]}
+        for service, values in (overrides or {}).items():
+            settings[service] = {**settings.get(service, {}), **values}
+        self.profile_name = profile
+        self.profiles = {service: ServiceProfile(**settings.get(service, {})) for service in SERVICES}
+        self.calls = {service: 0 for service in SERVICES}
+        self._lock = threading.Lock()
+        self._seed = seed
+        self._requests = 0
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def rng(self) -> random.Random:
+        with self._lock:
+            self._requests += 1
+            return random.Random(self._seed * 1_000_003 + self._requests)
+
+    def count(self, service: str):
+        with self._lock:
+            self.calls[service] += 1
+
+    def start(self) -> "FakeUpstreams":
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-upstreams", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def environment(self) -> Dict[str, str]:
+        """Environment for an app process that should talk only to these fakes."""
+        return {
+            "GROQ_API_KEY": "fake-groq-key",
+            "GROQ_BASE_URL": f"{self.base_url}/groq",
+            "NEWSDATA_API_KEY": "fake-newsdata-key",
+            "NEWSDATA_BASE_URL": f"{self.base_url}/newsdata/",
+            "HUGGINGFACE_API_KEY": "fake-hf-key",
+            "HF_INFERENCE_URL": f"{self.base_url}/hf",
+            "BENCH_SEARCH_URL": f"{self.base_url}/search",
+        }
+
+    def describe(self) -> Dict:
+        return {"profile": self.profile_name, "services": {name: p.to_dict() for name, p in self.profiles.items()}}
+
+
+class FakeDDGS:
+    """Drop-in for duckduckgo_search.DDGS (context manager + text()) backed by the fake search route."""
+
+    url: str = ""
+
+    def __init__(self, timeout: int = 10, **kwargs):
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.session.close()
+
+    def text(self, keywords: str, max_results: int = 10, **kwargs):
+        response = self.session.get(self.url, params={"q": keywords, "max_results": max_results}, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+def install_fake_search(url: str):
+    """Route the VerifyAgent's web search to the fake search server."""
+    import agents
+    FakeDDGS.url = url
+    agents.DDGS = FakeDDGS
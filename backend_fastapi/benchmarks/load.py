@@ -0,0 +1,131 @@
+"""
+Load Scenarios
+Closed-loop HTTP load against a running backend: `concurrency` clients
+each send the scenario's request, wait for the response and send the
+next, for a fixed duration. Reports throughput, latency percentiles and
+status codes per scenario.
+"""
+import time
+import random
+import asyncio
+from typing import Callable, Dict, List, Optional, Tuple
+import httpx
+from benchmarks.fakes import WORDS
+from benchmarks.micro import sample_image
+
+REQUEST_TIMEOUT = 60
+WARMUP_REQUESTS = 3
+
+
+class Scenario:
+    def __init__(self, name: str, method: str, path: str, build: Callable[[random.Random, int], Dict], description: str):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.build = build
+        self.description = description
+
+
+def _claim_text(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(14)) + f" {rng.randrange(10**9)}"
+
+
+def scenarios(upstream_url: str) -> Dict[str, Scenario]:
+    repeated = [f"Flood waters reached the {place} city centre on Monday" for place in ("north", "south", "east")]
+    image = sample_image(800, 600)
+    return {scenario.name: scenario for scenario in [
+        Scenario("verify_text", "POST", "/api/verify",
+                 lambda rng, i: {"data": {"text": _claim_text(rng)}},
+                 "unique claims: evidence search + scoring on every request"),
+        Scenario("verify_cached", "POST", "/api/verify",
+                 lambda rng, i: {"data": {"text": repeated[i % len(repeated)]}},
+                 "a few repeated claims: claim-cache hits after the first of each"),
+        Scenario("verify_link", "POST", "/api/verify",
+                 lambda rng, i: {"data": {"text": _claim_text(rng), "link": f"{upstream_url}/articles/{rng.randrange(1000)}"}},
+                 "claim plus article link: fetch + HTML extraction + search + scoring"),
+        Scenario("verify_image", "POST", "/api/verify",
+                 lambda rng, i: {"files": {"image": ("photo.jpg", image, "image/jpeg")}},
+                 "image upload: full image analysis against the fake inference server"),
+        Scenario("crisis", "GET", "/api/crisis", lambda rng, i: {}, "crisis detection over the processed claims"),
+        Scenario("claims", "GET", "/api/claims", lambda rng, i: {}, "list of processed claims"),
+    ]}
+
+
+def summarize(latencies: List[float], statuses: Dict[str, int], elapsed: float, wire_bytes: int = 0) -> Dict:
+    latencies = sorted(latencies)
+    count = sum(statuses.values())
+    errors = sum(n for status, n in statuses.items() if not status.startswith("2"))
+    pick = lambda q: round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 2) if latencies else None
+    return {
+        "requests": count,
+        "errors": errors,
+        "error_rate": round(errors / count, 4) if count else 0.0,
+        "throughput_rps": round(count / elapsed, 2) if elapsed else 0.0,
+        # Response body bytes on the wire (compressed when the server compressed)
+        "bytes_per_response": round(wire_bytes / count) if count else 0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 2) if latencies else None,
+            "p50": pick(0.50),
+            "p90": pick(0.90),
+            "p95": pick(0.95),
+            "p99": pick(0.99),
+            "max": round(latencies[-1], 2) if latencies else None,
+        },
+        "status_codes": dict(sorted(statuses.items())),
+    }
+
+
+async def _send(client: httpx.AsyncClient, scenario: Scenario, rng: random.Random, i: int) -> Tuple[str, float, int]:
+    started = time.perf_counter()
+    size = 0
+    try:
+        # Bodies are read raw (never decompressed) so the driver's own CPU use does
+        # not depend on the response encoding, and size is what crossed the wire
+        async with client.stream(scenario.method, scenario.path, **scenario.build(rng, i)) as response:
+            async for chunk in response.aiter_raw():
+                size += len(chunk)
+        status = str(response.status_code)
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    return status, (time.perf_counter() - started) * 1000, size
+
+
+async def run_scenario(base_url: str, scenario: Scenario, concurrency: int, duration: float, seed: int = 1) -> Dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=REQUEST_TIMEOUT, limits=limits) as client:
+        warm_rng = random.Random(seed - 1)
+        for i in range(WARMUP_REQUESTS):
+            await _send(client, scenario, warm_rng, i)
+
+        latencies: List[float] = []
+        statuses: Dict[str, int] = {}
+        wire_bytes = [0]
+        counter = iter(range(10**9))
+        stop_at = time.perf_counter() + duration
+
+        async def worker(worker_id: int):
+            rng = random.Random(seed * 1000 + worker_id)
+            while time.perf_counter() < stop_at:
+                status, elapsed_ms, size = await _send(client, scenario, rng, next(counter))
+                latencies.append(elapsed_ms)
+                wire_bytes[0] += size
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {"description": scenario.description, "concurrency": concurrency, "duration_s": round(elapsed, 2),
+            **summarize(latencies, statuses, elapsed, wire_bytes[0])}
+
+
+def run(base_url: str, upstream_url: str, names: Optional[List[str]] = None, concurrency: int = 8,
+        duration: float = 10.0, echo: Callable[[str], None] = print) -> Dict:
+    results = {}
+    for name, scenario in scenarios(upstream_url).items():
+        if names and name not in names:
+            continue
+        results[name] = asyncio.run(run_scenario(base_url, scenario, concurrency, duration))
+        latency = results[name]["latency_ms"]
+        echo(f"  {name:<14} {results[name]['throughput_rps']:>8.1f} req/s   p50 {latency['p50']} ms   "
+             f"p99 {latency['p99']} ms   errors {results[name]['errors']}")
+    return results
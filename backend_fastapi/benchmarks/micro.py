@@ -0,0 +1,217 @@
+"""
+Micro-benchmarks
+In-process timings of the CPU-bound hot spots: crisis keyword detection,
+article HTML extraction, the image stages, claim-cache and domain
+reputation lookups and the response path (claim-list serialization,
+compression). Each benchmark runs for a fixed time budget after a
+warm-up and reports per-call latency percentiles in microseconds.
+"""
+import io
+import time
+import random
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from PIL import Image
+from benchmarks.fakes import WORDS, article_html
+
+# Seconds spent timing each benchmark (after WARMUP_CALLS untimed calls)
+DEFAULT_SECONDS = 1.0
+WARMUP_CALLS = 3
+MIN_CALLS = 5
+
+
+def measure(fn: Callable[[], object], seconds: float = DEFAULT_SECONDS) -> Dict:
+    """Call fn repeatedly for about `seconds`; per-call latency summary in microseconds."""
+    for _ in range(WARMUP_CALLS):
+        fn()
+    samples: List[float] = []
+    deadline = time.perf_counter() + seconds
+    while len(samples) < MIN_CALLS or time.perf_counter() < deadline:
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1e6)
+    samples.sort()
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    mean = sum(samples) / len(samples)
+    return {
+        "calls": len(samples),
+        "mean_us": round(mean, 1),
+        "min_us": round(samples[0], 1),
+        "p50_us": round(pick(0.50), 1),
+        "p95_us": round(pick(0.95), 1),
+        "max_us": round(samples[-1], 1),
+        "ops_per_s": round(1e6 / mean, 1),
+    }
+
+
+def sample_image(width: int, height: int, image_format: str = "JPEG", seed: int = 7) -> bytes:
+    """Photo-like test image: smooth gradients plus sensor-style noise (flat images are degenerate)."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([x / width * 200, y / height * 180, (x + y) / (width + height) * 220], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 18, base.shape), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format=image_format, **({"quality": 88} if image_format == "JPEG" else {}))
+    return buffer.getvalue()
+
+
+def sample_claims(count: int, seed: int = 3):
+    from models import Claim
+    rng = random.Random(seed)
+    topics = ["earthquake", "election", "vaccine", "flood", "budget", "missile", "festival", "heat"]
+    return [
+        Claim(id=str(i), text=f"{rng.choice(topics)} " + " ".join(rng.choice(WORDS) for _ in range(18)))
+        for i in range(count)
+    ]
+
+
+def _crisis(claims) -> Callable:
+    from agents import CrisisAgent
+    agent = CrisisAgent()
+    return lambda: agent.detect_crisis(claims)
+
+
+def _extract(html: bytes) -> Callable:
+    from bs4 import BeautifulSoup
+
+    # Same parse as VerifyAgent.verify's link_parse stage
+    def run():
+        soup = BeautifulSoup(html, "html.parser")
+        title = soup.title.string if soup.title else None
+        return title, soup.get_text()[:1000]
+    return run
+
+
+def _claim_cache(entries: int) -> Callable:
+    from claim_cache import ClaimCache
+    from models import ScoreResponse
+    cache = ClaimCache(path=None)
+    score = ScoreResponse(final_score=40, source_reliability=50, evidence_strength=40, consistency=30, verdict="MIXED")
+    for claim in sample_claims(entries, seed=11):
+        cache.store(claim, score)
+    queries = [claim.text for claim in sample_claims(50, seed=12)]
+    position = [0]
+
+    def run():
+        position[0] = (position[0] + 1) % len(queries)
+        return cache.lookup(queries[position[0]])
+    return run
+
+
+def _reputation(sources: int) -> Callable:
+    from reputation import DomainRegistry
+    registry = DomainRegistry(overrides_dir=None)
+    hosts = ["www.reuters.com", "edition.cnn.com", "example-blog.net", "www.snopes.com", "news.example.org",
+             "timesofindia.indiatimes.com", "www.cdc.gov", "twitter.com", "dailymail.co.uk", "local-news.in"]
+    urls = [f"https://{hosts[i % len(hosts)]}/2024/05/story-{i}.html" for i in range(sources)]
+    return lambda: registry.source_reliability(urls)
+
+
+def _claims_json(claims, path: str) -> Callable:
+    import json
+    from typing import List
+    from pydantic import TypeAdapter
+    from fastapi.encoders import jsonable_encoder
+    from models import Claim
+    from serialization import to_json
+    if path == "encoder":
+        return lambda: json.dumps(jsonable_encoder(claims))
+    if path == "response_model":
+        # FastAPI's default for response_model=List[Claim]: re-validate, dump to
+        # Python, then json.dumps in JSONResponse
+        adapter = TypeAdapter(List[Claim])
+        return lambda: json.dumps(adapter.dump_python(adapter.validate_python(claims), mode="json"),
+                                  ensure_ascii=False, separators=(",", ":")).encode()
+    if path == "fast":
+        return lambda: to_json(claims)
+    raise ValueError(path)
+
+
+def _compress(encoding: str) -> Callable:
+    from compression import brotli, compress
+    from serialization import to_json
+    if encoding == "br" and brotli is None:
+        return None
+    body = to_json(sample_claims(500))
+    return lambda: compress(body, encoding)
+
+
+def payloads() -> Dict[str, Dict[str, int]]:
+    """Bytes on the wire for typical list responses: plain JSON and each available coding."""
+    from compression import brotli, compress
+    from serialization import to_json
+    from agents import CrisisAgent
+    bodies = {
+        "claims_500": to_json(sample_claims(500)),
+        "claims_50": to_json(sample_claims(50)),
+        "crisis_500": to_json(CrisisAgent().detect_crisis(sample_claims(500))),
+    }
+    sizes = {}
+    for name, body in bodies.items():
+        sizes[name] = {"json": len(body), "gzip": len(compress(body, "gzip"))}
+        if brotli is not None:
+            sizes[name]["br"] = len(compress(body, "br"))
+    return sizes
+
+
+def benchmarks() -> Dict[str, Callable[[], Callable]]:
+    """name -> factory returning the zero-argument callable to time (setup stays out of the timing)."""
+    def image_stage(stage: str, data_factory: Callable[[], bytes]) -> Callable[[], Callable]:
+        def factory():
+            data = data_factory()
+            if stage == "info":
+                from image_analyzer import ImageInfo
+                return lambda: ImageInfo(data)
+            if stage == "prepare_model_input":
+                from image_analyzer import prepare_model_input
+                return lambda: prepare_model_input(data)
+            if stage == "signature":
+                from image_hash import image_signature
+                return lambda: image_signature(data)
+            if stage == "spectral":
+                from ai_detector import spectral_detector
+                return lambda: spectral_detector.predict(data)
+            if stage == "metadata":
+                from image_metadata import parse_metadata
+                return lambda: parse_metadata(data)
+            if stage == "forensics":
+                from forensics import forensics_engine
+                return lambda: forensics_engine.analyze(data)
+            raise ValueError(stage)
+        return factory
+
+    photo = lambda: sample_image(1600, 1200)
+    return {
+        "crisis.detect_100": lambda: _crisis(sample_claims(100)),
+        "crisis.detect_1000": lambda: _crisis(sample_claims(1000)),
+        "html.extract_20kb": lambda: _extract(article_html(1, 20_000).encode()),
+        "html.extract_200kb": lambda: _extract(article_html(2, 200_000).encode()),
+        "image.info": image_stage("info", photo),
+        "image.prepare_model_input": image_stage("prepare_model_input", photo),
+        "image.signature": image_stage("signature", photo),
+        "image.spectral": image_stage("spectral", photo),
+        "image.metadata": image_stage("metadata", photo),
+        "image.forensics": image_stage("forensics", photo),
+        "claim_cache.lookup_1000": lambda: _claim_cache(1000),
+        "reputation.source_reliability_10": lambda: _reputation(10),
+        # Before: FastAPI's response_model path and plain jsonable_encoder; after:
+        # pydantic-core in one pass, and the per-claim cache of serialization.py
+        "claims.serialize_500_response_model": lambda: _claims_json(sample_claims(500), "response_model"),
+        "claims.serialize_500": lambda: _claims_json(sample_claims(500), "encoder"),
+        "claims.serialize_500_fast": lambda: _claims_json(sample_claims(500), "fast"),
+        "compress.gzip_claims_500": lambda: _compress("gzip"),
+        "compress.br_claims_500": lambda: _compress("br"),
+    }
+
+
+def run(names: Optional[List[str]] = None, seconds: float = DEFAULT_SECONDS, echo: Callable[[str], None] = print) -> Dict:
+    results = {}
+    for name, factory in benchmarks().items():
+        if names and not any(name.startswith(prefix) for prefix in names):
+            continue
+        fn = factory()
+        if fn is None:  # optional dependency missing
+            continue
+        results[name] = measure(fn, seconds)
+        echo(f"  {name:<28} p50 {results[name]['p50_us']:>10.1f} us   p95 {results[name]['p95_us']:>10.1f} us")
+    return results
@@ -0,0 +1,122 @@
+"""
+Benchmark Runner
+Runs the micro-benchmarks in-process and the load scenarios against a
+fresh server process wired to the fake upstreams, then writes one JSON
+document (environment, upstream profile, results) for compare.py.
+
+    python -m benchmarks.run --out results.json
+    python -m benchmarks.run --profile realistic --duration 30 --concurrency 16
+    python -m benchmarks.run --skip-load --micro image.    # image stages only
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+import httpx
+from benchmarks import load, micro
+from benchmarks.fakes import PROFILES, FakeUpstreams
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_START_TIMEOUT = 60
+
+
+def _git_commit() -> str:
+    try:
+        completed = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True, timeout=5)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=HERE, capture_output=True, text=True, timeout=5)
+        return completed.stdout.strip() + ("-dirty" if dirty.stdout.strip() else "") if completed.returncode == 0 else "unknown"
+    except Exception:
+        return "unknown"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(upstreams: FakeUpstreams, data_dir: str, seed_claims: int, admission: bool) -> tuple:
+    port = _free_port()
+    env = {**os.environ, **upstreams.environment(), "CRUX_DATA_DIR": data_dir, "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+           # Per-client rate limits would turn most load-test requests into 429s
+           "ADMISSION_ENABLED": "true" if admission else "false"}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.serve", "--port", str(port), "--seed-claims", str(seed_claims)],
+        cwd=HERE, env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Benchmark server exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/", timeout=1).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Benchmark server did not start in time")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", help="write results JSON here (default: print only)")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="instant", help="upstream latency/error profile")
+    parser.add_argument("--micro", nargs="*", help="micro-benchmark name prefixes (default: all)")
+    parser.add_argument("--micro-seconds", type=float, default=micro.DEFAULT_SECONDS)
+    parser.add_argument("--load", nargs="*", choices=sorted(load.scenarios("").keys()), help="load scenarios (default: all)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per load scenario")
+    parser.add_argument("--seed-claims", type=int, default=200, help="claims in /api/claims before the load starts")
+    parser.add_argument("--admission", action="store_true", help="keep admission control on (measures shedding, not the pipeline)")
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--skip-load", action="store_true")
+    args = parser.parse_args()
+
+    upstreams = FakeUpstreams(args.profile).start()
+    results = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "upstreams": upstreams.describe(),
+            "load": {"concurrency": args.concurrency, "duration_s": args.duration, "seed_claims": args.seed_claims, "admission": args.admission},
+        },
+        "micro": {},
+        "payloads": {},
+        "load": {},
+    }
+    try:
+        if not args.skip_micro:
+            print("Micro-benchmarks")
+            results["micro"] = micro.run(args.micro, args.micro_seconds)
+            results["payloads"] = micro.payloads()
+        if not args.skip_load:
+            with tempfile.TemporaryDirectory(prefix="crux-bench-") as data_dir:
+                process, base_url = _start_server(upstreams, data_dir, args.seed_claims, args.admission)
+                try:
+                    print(f"Load scenarios ({args.concurrency} clients, {args.duration:g}s each, {args.profile} upstreams)")
+                    results["load"] = load.run(base_url, upstreams.base_url, args.load, args.concurrency, args.duration)
+                finally:
+                    process.terminate()
+                    process.wait(timeout=10)
+            results["meta"]["upstream_calls"] = dict(upstreams.calls)
+    finally:
+        upstreams.stop()
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, indent=2)
+        print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
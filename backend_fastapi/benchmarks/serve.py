@@ -0,0 +1,32 @@
+"""
+Benchmark Server
+Runs the API under uvicorn for load tests, wired to the fake upstreams:
+the environment comes from FakeUpstreams.environment() (set by run.py),
+web search is routed to the fake search endpoint, and /api/claims can be
+pre-seeded with claims.
+
+    python -m benchmarks.serve --port 8765 --seed-claims 200
+"""
+import os
+import argparse
+import uvicorn
+from benchmarks.fakes import install_fake_search
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed-claims", type=int, default=0, help="claims added to /api/claims before serving")
+    args = parser.parse_args()
+
+    if os.getenv("BENCH_SEARCH_URL"):
+        install_fake_search(os.environ["BENCH_SEARCH_URL"])
+    import main as api
+    if args.seed_claims:
+        from benchmarks.micro import sample_claims
+        api.processed_claims.extend(sample_claims(args.seed_claims))
+    uvicorn.run(api.app, host="127.0.0.1", port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Chat Module
+Assistant chat service: one shared Groq client, server-side sessions with
+bounded memory, older turns rolled into a compact summary under a token
+budget, and per-session concurrency limits. Known intents are answered
+by the local intent router before any LLM call.
+"""
+import os
+import time
+import uuid
+import asyncio
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, List, Optional
+from dotenv import load_dotenv
+from groq import AsyncGroq
+from intent_router import intent_router
+from telemetry import telemetry
+from logs import get_logger
+
+load_dotenv()
+
+log = get_logger("chat")
+
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+CHAT_MODEL = os.getenv("CHAT_MODEL", "llama-3.3-70b-versatile")
+# Smaller model for folding old turns into the session summary
+CHAT_SUMMARY_MODEL = os.getenv("CHAT_SUMMARY_MODEL", "llama-3.1-8b-instant")
+# Prompt budget for summary + recent turns + the new message (estimated tokens)
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "1024"))
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "160"))
+CHAT_REPLY_TOKENS = 150
+CHAT_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "1000"))
+CHAT_SESSION_TTL = int(os.getenv("CHAT_SESSION_TTL", "3600"))
+CHAT_MAX_MESSAGE_CHARS = 2000
+# Requests one session may have in flight, and across all sessions
+CHAT_SESSION_CONCURRENCY = int(os.getenv("CHAT_SESSION_CONCURRENCY", "1"))
+CHAT_MAX_CONCURRENCY = int(os.getenv("CHAT_MAX_CONCURRENCY", "16"))
+# Per-call cap (seconds) for the LLM
+CHAT_TIMEOUT = 20
+# Client-sent history is only used to seed a new session, and only this much of it
+SEED_TURNS = 6
+
+SYSTEM_PROMPT = (
+    "You are CruxAI Assistant, a helpful AI for a fact-checking platform. "
+    "Be concise (2-3 sentences max). Help users verify claims and navigate features."
+)
+FALLBACK_RESPONSE = (
+    "I'm here to help! You can ask me about crisis alerts, agent status, or to verify claims. "
+    "What would you like to know?"
+)
+
+
+class ChatRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English) plus per-message overhead."""
+    return len(text) // 4 + 4
+
+
+class ChatSession:
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.summary = ""
+        self.turns: Deque[Dict] = deque()
+        self.turn_tokens = 0
+        self.last_active = time.monotonic()
+        self.in_flight = 0
+        self.summarizing: Optional[asyncio.Task] = None
+
+    def add(self, role: str, content: str):
+        self.turns.append({"role": role, "content": content})
+        self.turn_tokens += estimate_tokens(content)
+
+    def pop_oldest(self) -> Dict:
+        turn = self.turns.popleft()
+        self.turn_tokens -= estimate_tokens(turn["content"])
+        return turn
+
+
+class ChatService:
+    def __init__(self):
+        self.client = AsyncGroq(api_key=GROQ_API_KEY, timeout=CHAT_TIMEOUT) if GROQ_API_KEY else None
+        if not self.client:
+            log.warning("GROQ_API_KEY not set. Chat will use canned responses.")
+        self.sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.stats = {"requests": 0, "llm_calls": 0, "summaries": 0, "rejected_busy": 0, "errors": 0}
+
+    def _session(self, session_id: Optional[str], history: Optional[List[Dict]]) -> ChatSession:
+        now = time.monotonic()
+        # Sessions are kept in LRU order: expire from the old end, then cap the count
+        while self.sessions:
+            oldest = next(iter(self.sessions.values()))
+            if now - oldest.last_active < CHAT_SESSION_TTL and len(self.sessions) < CHAT_MAX_SESSIONS:
+                break
+            if oldest.in_flight:
+                break
+            self.sessions.popitem(last=False)
+
+        session = self.sessions.get(session_id) if session_id else None
+        if session is None:
+            session = ChatSession(session_id or uuid.uuid4().hex)
+            for message in (history or [])[-SEED_TURNS:]:
+                role = message.get("role") if isinstance(message, dict) else None
+                content = str(message.get("content") or "")[:CHAT_MAX_MESSAGE_CHARS] if role else ""
+                if role in ("user", "assistant") and content:
+                    session.add(role, content)
+            self.sessions[session.id] = session
+        self.sessions.move_to_end(session.id)
+        session.last_active = now
+        return session
+
+    def _fold_old_turns(self, session: ChatSession, incoming: str) -> List[Dict]:
+        """Remove the oldest turns until summary + turns + the new message fit the budget."""
+        budget = CHAT_CONTEXT_TOKENS - estimate_tokens(SYSTEM_PROMPT) - estimate_tokens(incoming) - CHAT_SUMMARY_TOKENS
+        folded = []
+        while session.turns and session.turn_tokens > budget:
+            folded.append(session.pop_oldest())
+        # Never leave an assistant reply without the question it answers
+        if session.turns and session.turns[0]["role"] == "assistant":
+            folded.append(session.pop_oldest())
+        return folded
+
+    async def _summarize(self, session: ChatSession, folded: List[Dict]):
+        transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in folded)
+        summary = None
+        if self.client:
+            try:
+                completion = await self.client.chat.completions.create(
+                    model=CHAT_SUMMARY_MODEL,
+                    messages=[
+                        {"role": "system", "content": "Update the running summary of a support chat. Keep the facts, claims and questions the user cares about. Reply with the summary only, at most 80 words."},
+                        {"role": "user", "content": f"Summary so far: {session.summary or '(none)'}\n\nNew turns:\n{transcript}"},
+                    ],
+                    temperature=0.2,
+                    max_tokens=CHAT_SUMMARY_TOKENS,
+                )
+                summary = completion.choices[0].message.content.strip()
+                self.stats["llm_calls"] += 1
+                telemetry.tokens("ChatAgent", completion.usage)
+            except Exception as e:
+                log.error("Failed to summarize chat session", error=str(e))
+        if not summary:
+            summary = self._extractive_summary(session.summary, folded)
+        session.summary = summary
+        self.stats["summaries"] += 1
+
+    def _extractive_summary(self, previous: str, folded: List[Dict]) -> str:
+        """First sentence of each folded turn, newest kept when over the summary budget."""
+        parts = [previous] if previous else []
+        for turn in folded:
+            sentence = turn["content"].split(". ")[0].strip()[:200]
+            parts.append(f"{'User' if turn['role'] == 'user' else 'Assistant'}: {sentence}")
+        while len(parts) > 1 and estimate_tokens(" ".join(parts)) > CHAT_SUMMARY_TOKENS:
+            parts.pop(0)
+        return " ".join(parts)[: CHAT_SUMMARY_TOKENS * 4]
+
+    def _messages(self, session: ChatSession, message: str) -> List[Dict]:
+        system = SYSTEM_PROMPT
+        if session.summary:
+            system += f"\n\nEarlier in this conversation: {session.summary}"
+        return [{"role": "system", "content": system}, *session.turns, {"role": "user", "content": message}]
+
+    @telemetry.instrument("ChatAgent", "Answered chat message")
+    async def reply(
+        self,
+        message: str,
+        session_id: Optional[str] = None,
+        history: Optional[List[Dict]] = None,
+        context: Optional[Callable[[], Dict]] = None
+    ) -> Dict:
+        """
+        Answer `message` in the given session (created when unknown).
+        `context` supplies live data for locally answered intents.
+        Raises ChatRejected (400 empty, 429 session busy).
+        """
+        message = (message or "").strip()[:CHAT_MAX_MESSAGE_CHARS]
+        if not message:
+            raise ChatRejected(400, "Message is required")
+        self.stats["requests"] += 1
+        session = self._session(session_id, history)
+        # Navigation and FAQ messages are answered locally, without an LLM call
+        routed = intent_router.route(message, context)
+        # Locally routed answers are the chat's cache in front of the LLM
+        telemetry.cache("ChatAgent", hit=bool(routed))
+        if routed:
+            telemetry.note(f"intent: {routed['intent']}")
+            session.add("user", message)
+            session.add("assistant", routed["response"])
+            return {"response": routed["response"], "session_id": session.id, "intent": routed["intent"]}
+        if session.in_flight >= CHAT_SESSION_CONCURRENCY:
+            self.stats["rejected_busy"] += 1
+            raise ChatRejected(429, "A reply is still in progress for this session")
+        if self._slots is None:
+            # Created on the serving loop
+            self._slots = asyncio.Semaphore(CHAT_MAX_CONCURRENCY)
+
+        session.in_flight += 1
+        try:
+            if session.summarizing:
+                await session.summarizing
+                session.summarizing = None
+            folded = self._fold_old_turns(session, message)
+            if folded:
+                await self._summarize(session, folded)
+            if not self.client:
+                response = FALLBACK_RESPONSE
+            else:
+                async with self._slots:
+                    try:
+                        completion = await self.client.chat.completions.create(
+                            model=CHAT_MODEL,
+                            messages=self._messages(session, message),
+                            temperature=0.7,
+                            max_tokens=CHAT_REPLY_TOKENS,
+                            top_p=1,
+                        )
+                        response = completion.choices[0].message.content.strip()
+                        self.stats["llm_calls"] += 1
+                        telemetry.tokens("ChatAgent", completion.usage)
+                    except Exception as e:
+                        log.error("Chat completion failed", error=str(e))
+                        self.stats["errors"] += 1
+                        telemetry.error("groq_error")
+                        return {"response": FALLBACK_RESPONSE, "session_id": session.id}
+            session.add("user", message)
+            session.add("assistant", response)
+            # Fold what the next turn would push out now, off the request path
+            folded = self._fold_old_turns(session, "")
+            if folded:
+                session.summarizing = asyncio.create_task(self._summarize(session, folded))
+            return {"response": response, "session_id": session.id}
+        finally:
+            session.in_flight -= 1
+            session.last_active = time.monotonic()
+
+    def status(self) -> Dict:
+        return {
+            "sessions": len(self.sessions),
+            "model": CHAT_MODEL if self.client else None,
+            **self.stats,
+            "router": intent_router.status(),
+        }
+
+
+# Global instance
+chat_service = ChatService()
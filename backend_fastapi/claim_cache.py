@@ -0,0 +1,305 @@
+"""
+Claim Cache Module
+Maps incoming claims to previously verified canonical claims using hashed
+TF-IDF vectors (character n-grams, word stems and word bigrams) and batched
+cosine search. A match is only reused when negation, numbers, rare terms and
+the order of named entities agree as well, since a paraphrase score alone
+can't tell "Israel attacked Iran" from "Iran attacked Israel".
+"""
+import os
+import re
+import json
+import time
+import zlib
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from models import Claim, Evidence, ScoreResponse, ClaimMatch
+from storage import data_path
+from logs import get_logger
+
+log = get_logger("claim_cache")
+
+CLAIM_CACHE_THRESHOLD = float(os.getenv("CLAIM_CACHE_THRESHOLD", "0.9"))
+CLAIM_CACHE_TTL = float(os.getenv("CLAIM_CACHE_TTL", str(7 * 24 * 3600)))
+CLAIM_CACHE_MAX_ENTRIES = int(os.getenv("CLAIM_CACHE_MAX_ENTRIES", "20000"))
+
+FEATURE_DIM = 2048
+CHAR_NGRAMS = (3, 4, 5)
+AUDIT_LOG_SIZE = 200
+# Terms held by at least this share of cached claims (and at least
+# COMMON_TERM_MIN_DOCS of them) may differ between a claim and its match;
+# every rarer term must appear on both sides
+COMMON_TERM_FRACTION = 0.02
+COMMON_TERM_MIN_DOCS = 20
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_CAPITALIZED = re.compile(r"\b[A-Z][A-Za-z0-9]*")
+_STOPWORDS = frozenset(
+    "a an and are as at be been by do does for from has have in is it its of on or that the this to was "
+    "were will with claim claims says said reportedly".split()
+)
+_NEGATIONS = frozenset("not no never none nobody nothing neither nor cannot isn aren wasn weren doesn didn don won hoax fake false myth debunked".split())
+
+
+def _stem(token: str) -> str:
+    for suffix in ("ing", "ed", "es", "s"):
+        if len(token) > len(suffix) + 2 and token.endswith(suffix):
+            token = token[:-len(suffix)]
+            break
+    # "cause"/"causes" and "vaccine"/"vaccines" share a stem
+    return token[:-1] if len(token) > 4 and token.endswith("e") else token
+
+
+def claim_terms(text: str) -> List[str]:
+    return [_stem(t) for t in _TOKEN.findall(text.lower().replace("'t", " not")) if t not in _STOPWORDS]
+
+
+def _negated(terms: List[str]) -> bool:
+    return any(t in _NEGATIONS for t in terms)
+
+
+def _numbers(terms: List[str]) -> frozenset:
+    return frozenset(t for t in terms if t.isdigit())
+
+
+def _entities(text: str) -> frozenset:
+    """Terms written capitalized (names, places, acronyms)."""
+    return frozenset(claim_terms(" ".join(_CAPITALIZED.findall(text))))
+
+
+def _ordered(terms: List[str], keep: frozenset) -> List[str]:
+    """First occurrences of the `keep` terms, in claim order."""
+    seen: List[str] = []
+    for term in terms:
+        if term in keep and term not in seen:
+            seen.append(term)
+    return seen
+
+
+def _feature_counts(terms: List[str]) -> Dict[int, int]:
+    counts: Dict[int, int] = {}
+    features = [f"w:{t}" for t in terms]
+    features.extend(f"b:{a} {b}" for a, b in zip(terms, terms[1:]))
+    for term in terms:
+        padded = f" {term} "
+        for n in CHAR_NGRAMS:
+            features.extend(padded[i:i + n] for i in range(max(1, len(padded) - n + 1)))
+    for feature in features:
+        bucket = zlib.crc32(feature.encode("utf-8")) % FEATURE_DIM
+        counts[bucket] = counts.get(bucket, 0) + 1
+    return counts
+
+
+class CacheEntry:
+    def __init__(self, claim_id: str, text: str, score: ScoreResponse, evidence: List[Evidence], created_at: float):
+        self.claim_id = claim_id
+        self.text = text
+        self.score = score
+        self.evidence = evidence
+        self.created_at = created_at
+        self.terms = claim_terms(text)
+        self.entities = _entities(text)
+        # Claims differing in negation or in any number ("kills 50" vs "kills 500") never match
+        self.key = (_negated(self.terms), _numbers(self.terms))
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "claim_id": self.claim_id,
+            "text": self.text,
+            "score": self.score.model_dump(),
+            "evidence": [e.model_dump(mode="json") for e in self.evidence],
+            "created_at": self.created_at,
+        })
+
+    @classmethod
+    def from_json(cls, line: str) -> "CacheEntry":
+        data = json.loads(line)
+        return cls(
+            data["claim_id"],
+            data["text"],
+            ScoreResponse(**data["score"]),
+            [Evidence(**e) for e in data["evidence"]],
+            data["created_at"],
+        )
+
+
+class ClaimCache:
+    """
+    Canonical-claim index.
+
+    Term-frequency vectors are stored sparsely: bucket and weight of every
+    non-zero feature, row after row, in growable NumPy arrays with each
+    row's start offset. IDF weights come from running document frequencies,
+    so a lookup is two segment sums over the stored features of all live
+    entries.
+    """
+
+    def __init__(self, path: Optional[str] = "claim_cache", threshold: float = CLAIM_CACHE_THRESHOLD):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries: List[CacheEntry] = []
+        # Growable buffers; only the first len(self._entries) starts and the
+        # first self._size features are live
+        self._starts = np.empty(256, dtype=np.int64)
+        self._buckets = np.empty(16384, dtype=np.int16)
+        self._weights = np.empty(16384, dtype=np.float32)
+        self._size = 0
+        self._doc_freq = np.zeros(FEATURE_DIM, dtype=np.float32)
+        self._term_docs: Dict[str, int] = {}
+        self._audit: deque = deque(maxlen=AUDIT_LOG_SIZE)
+        self._file = None
+        if path:
+            try:
+                self._file = data_path(path, "claims.jsonl")
+                self._load()
+            except Exception as e:
+                log.warning("Claim cache persistence unavailable. Using memory only.", error=str(e))
+                self._file = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, text: str) -> Optional[Tuple[CacheEntry, ClaimMatch]]:
+        """Return the best compatible canonical entry at or above the threshold, if any."""
+        terms = claim_terms(text)
+        if not terms:
+            return None
+        query = self._vector(terms)
+        entities = _entities(text)
+        key = (_negated(terms), _numbers(terms))
+        with self._lock:
+            count = len(self._entries)
+            if not count:
+                return None
+            idf = self._idf()
+            query_norm = np.linalg.norm(query * idf)
+            if not query_norm:
+                return None
+            idf_sq = idf * idf
+            starts = self._starts[:count]
+            buckets = self._buckets[:self._size]
+            weights = self._weights[:self._size]
+            dots = np.add.reduceat(weights * (query * idf_sq)[buckets], starts)
+            norms = np.add.reduceat(weights * weights * idf_sq[buckets], starts)
+            similarity = dots / (np.sqrt(np.maximum(norms, 1e-12)) * query_norm)
+
+            now = time.time()
+            for row in np.argsort(-similarity)[:5]:
+                if similarity[row] < self.threshold:
+                    break
+                entry = self._entries[row]
+                if entry.key != key or now - entry.created_at > CLAIM_CACHE_TTL or not self._compatible(entry, terms, entities):
+                    continue
+                match = ClaimMatch(
+                    canonical_claim_id=entry.claim_id,
+                    canonical_text=entry.text,
+                    similarity=round(float(similarity[row]), 4),
+                    verified_at=entry.created_at,
+                )
+                self._audit.append({"query": text, "matched_at": now, **match.model_dump()})
+                return entry, match
+        return None
+
+    def _compatible(self, entry: CacheEntry, terms: List[str], entities: frozenset) -> bool:
+        """Named entities must agree, in the same order, and so must all but common terms."""
+        named = entry.entities | entities
+        if _ordered(entry.terms, named) != _ordered(terms, named):
+            return False
+        common = max(COMMON_TERM_MIN_DOCS, COMMON_TERM_FRACTION * len(self._entries))
+        return all(self._term_docs.get(term, 0) >= common for term in set(entry.terms) ^ set(terms))
+
+    def store(self, claim: Claim, score: ScoreResponse):
+        entry = CacheEntry(claim.id, claim.text, score, list(claim.evidence), time.time())
+        with self._lock:
+            self._insert(entry)
+        if self._file:
+            try:
+                with open(self._file, "a", encoding="utf-8") as f:
+                    f.write(entry.to_json() + "\n")
+            except OSError as e:
+                log.warning("Failed to persist claim cache entry", error=str(e))
+
+    def audit_log(self) -> List[dict]:
+        with self._lock:
+            return list(reversed(self._audit))
+
+    def _vector(self, terms: List[str]) -> np.ndarray:
+        vector = np.zeros(FEATURE_DIM, dtype=np.float32)
+        for bucket, count in _feature_counts(terms).items():
+            vector[bucket] = 1.0 + np.log(count)
+        return vector
+
+    def _idf(self) -> np.ndarray:
+        # Features no stored claim has yet are weighted like the rarest seen
+        # ones, so a small cache doesn't penalize every new word in a query
+        n = len(self._entries)
+        return np.log((1.0 + n) / (1.0 + np.maximum(self._doc_freq, 1.0))) + 1.0
+
+    def _insert(self, entry: CacheEntry):
+        if not entry.terms:
+            # Nothing a lookup could match (and rows must not be empty)
+            return
+        counts = _feature_counts(entry.terms)
+        count = len(self._entries)
+        if count >= CLAIM_CACHE_MAX_ENTRIES:
+            # Drop the oldest quarter in one go rather than shifting per insert
+            drop = max(1, CLAIM_CACHE_MAX_ENTRIES // 4)
+            cut = int(self._starts[drop])
+            self._doc_freq -= np.bincount(self._buckets[:cut], minlength=FEATURE_DIM)
+            for old in self._entries[:drop]:
+                for term in set(old.terms):
+                    left = self._term_docs[term] - 1
+                    if left:
+                        self._term_docs[term] = left
+                    else:
+                        del self._term_docs[term]
+            live = self._size - cut
+            self._starts[:count - drop] = self._starts[drop:count] - cut
+            self._buckets[:live] = self._buckets[cut:self._size]
+            self._weights[:live] = self._weights[cut:self._size]
+            self._size = live
+            self._entries = self._entries[drop:]
+            count -= drop
+        if count == len(self._starts):
+            self._starts = self._grown(self._starts, count, 2 * count)
+        end = self._size + len(counts)
+        if end > len(self._buckets):
+            capacity = max(2 * len(self._buckets), end)
+            self._buckets = self._grown(self._buckets, self._size, capacity)
+            self._weights = self._grown(self._weights, self._size, capacity)
+        buckets = np.fromiter(counts.keys(), dtype=np.int16, count=len(counts))
+        self._starts[count] = self._size
+        self._buckets[self._size:end] = buckets
+        self._weights[self._size:end] = 1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+        self._size = end
+        self._doc_freq[buckets] += 1
+        for term in set(entry.terms):
+            self._term_docs[term] = self._term_docs.get(term, 0) + 1
+        self._entries.append(entry)
+
+    @staticmethod
+    def _grown(array: np.ndarray, used: int, capacity: int) -> np.ndarray:
+        grown = np.empty(capacity, dtype=array.dtype)
+        grown[:used] = array[:used]
+        return grown
+
+    def _load(self):
+        if not os.path.exists(self._file):
+            return
+        now = time.time()
+        with open(self._file, encoding="utf-8") as f:
+            entries = [CacheEntry.from_json(line) for line in f if line.strip()]
+        entries = [e for e in entries if now - e.created_at <= CLAIM_CACHE_TTL][-CLAIM_CACHE_MAX_ENTRIES:]
+        for entry in entries:
+            self._insert(entry)
+        # Compact the log down to the live entries
+        with open(self._file, "w", encoding="utf-8") as f:
+            f.writelines(e.to_json() + "\n" for e in entries)
+        if entries:
+            log.info("Loaded claim cache", claims=len(entries))
+
+
+# Global instance
+claim_cache = ClaimCache()
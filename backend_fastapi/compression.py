@@ -0,0 +1,160 @@
+"""
+Compression Module
+Response compression negotiated from Accept-Encoding: brotli when the
+`brotli` package is installed and the client accepts it, gzip otherwise.
+Only complete (non-streamed) JSON/text bodies above COMPRESS_MIN_BYTES are
+compressed; repeated bodies (an unchanged claim list, a cached news
+category) are compressed once and served from a small LRU.
+"""
+import os
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES") or "1024")
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Compressed bodies kept for reuse, and the size above which compressing
+# moves off the event loop
+COMPRESS_CACHE_SIZE = 64
+COMPRESS_OFFLOAD_BYTES = 64 * 1024
+COMPRESSIBLE_TYPES = (b"application/json", b"text/")
+# Event streams must reach the client as they are produced
+UNCOMPRESSED_TYPES = (b"text/event-stream",)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best supported coding in an Accept-Encoding header ("br", "gzip" or None)."""
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name.strip().lower()] = quality
+    wildcard = weights.get("*", 0.0)
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best = max(candidates, key=lambda coding: weights.get(coding, wildcard))
+    return best if weights.get(best, wildcard) > 0 else None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressedCache:
+    """LRU of compressed bodies keyed by (encoding, digest of the plain body)."""
+
+    def __init__(self, size: int = COMPRESS_CACHE_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return value
+
+    def put(self, key: tuple, value: bytes):
+        with self._lock:
+            self._entries[key] = value
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+async def _compressed(body: bytes, encoding: str) -> bytes:
+    key = (encoding, len(body), hashlib.blake2b(body, digest_size=16).digest())
+    cached = compressed_cache.get(key)
+    if cached is not None:
+        return cached
+    if len(body) >= COMPRESS_OFFLOAD_BYTES:
+        result = await run_in_threadpool(compress, body, encoding)
+    else:
+        result = compress(body, encoding)
+    compressed_cache.put(key, result)
+    return result
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware applying the negotiated coding to eligible responses.
+    Streamed responses (several body messages) pass through untouched.
+    """
+
+    def __init__(self, app, min_bytes: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.min_bytes = min_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                response_headers = dict(message.get("headers") or [])
+                content_type = response_headers.get(b"content-type", b"")
+                if (
+                    b"content-encoding" in response_headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or content_type.startswith(UNCOMPRESSED_TYPES)
+                ):
+                    await send(message)
+                    return
+                # Hold the start until we know whether the body is complete and big enough
+                start = message
+                return
+            if start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+            held, start = start, None
+            body = message.get("body", b"")
+            if message.get("more_body") or len(body) < self.min_bytes:
+                await send(held)
+                await send(message)
+                return
+            body = await _compressed(body, encoding)
+            original = list(held.get("headers") or [])
+            vary = [value for key, value in original if key == b"vary"]
+            response_headers = [(key, value) for key, value in original if key not in (b"content-length", b"vary")] + [
+                (b"vary", b", ".join(vary + [b"Accept-Encoding"])),
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(body)).encode()),
+            ]
+            await send({**held, "headers": response_headers})
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+# Global instance
+compressed_cache = CompressedCache()
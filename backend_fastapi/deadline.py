@@ -0,0 +1,75 @@
+"""
+Deadline Module
+Per-request time budget shared by every stage of a verification.
+"""
+import os
+import time
+from typing import Dict, List, Optional
+from logs import get_logger
+
+log = get_logger("deadline")
+
+# Server-side budget for /api/verify when the client doesn't send one
+VERIFY_BUDGET_SECONDS = float(os.getenv("VERIFY_BUDGET_SECONDS", "25"))
+# Upper bound a client may request
+VERIFY_MAX_BUDGET_SECONDS = float(os.getenv("VERIFY_MAX_BUDGET_SECONDS", "60"))
+# Below this much time a network stage isn't worth starting
+MIN_STAGE_SECONDS = 0.5
+
+
+class Deadline:
+    """
+    Tracks the time left in a request. Stages ask for timeouts capped by
+    what remains, and record themselves via cut() when they had to skip
+    or stop early.
+    """
+
+    def __init__(self, budget: Optional[float] = None):
+        self.budget = budget
+        self.start = time.monotonic()
+        self.cut_short: List[str] = []
+
+    @classmethod
+    def from_request(cls, budget: Optional[float]) -> "Deadline":
+        if budget is None or budget <= 0:
+            budget = VERIFY_BUDGET_SECONDS
+        return cls(min(budget, VERIFY_MAX_BUDGET_SECONDS))
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    def remaining(self) -> float:
+        if self.budget is None:
+            return float("inf")
+        return max(0.0, self.budget - self.elapsed())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: float) -> float:
+        """Timeout for a stage that would normally allow `cap` seconds."""
+        return max(0.0, min(cap, self.remaining()))
+
+    def allows(self, stage: str, minimum: float = MIN_STAGE_SECONDS) -> bool:
+        """True if there is time to start `stage`; otherwise records it as cut."""
+        if self.remaining() >= minimum:
+            return True
+        self.cut(stage)
+        return False
+
+    def cut(self, stage: str):
+        if stage not in self.cut_short:
+            log.info("Stage cut short by deadline", stage=stage, remaining_s=round(self.remaining(), 2))
+            self.cut_short.append(stage)
+
+    def summary(self) -> Dict:
+        return {
+            "budget_seconds": self.budget,
+            "elapsed_seconds": round(self.elapsed(), 3),
+            "cut_short": list(self.cut_short),
+        }
+
+
+def unbounded() -> Deadline:
+    """Deadline for callers that don't enforce a budget."""
+    return Deadline(None)
@@ -0,0 +1,258 @@
+"""
+Headline Dedup Module
+Near-duplicate headline detection using MinHash signatures and LSH banding.
+"""
+import os
+import re
+import zlib
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from storage import data_path
+from logs import get_logger
+
+log = get_logger("dedup")
+
+HEADLINE_INDEX_THRESHOLD = float(os.getenv("HEADLINE_INDEX_THRESHOLD", "0.8"))
+
+NUM_PERM = 64
+BANDS = 8  # 8 bands x 8 rows: ~0.77 collision threshold, close to HEADLINE_INDEX_THRESHOLD
+SHINGLE_SIZE = 5
+# Rows buffered in memory before being merged into the sorted band tables
+MERGE_EVERY = 4096
+
+_HASH_PRIME = np.uint64(4294967311)  # smallest prime above 2**32
+_rng = np.random.RandomState(1)  # fixed seed: stored signatures must stay comparable
+_PERM_A = _rng.randint(1, 2**32 - 1, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, 2**32 - 1, size=NUM_PERM, dtype=np.uint64)
+_BAND_MIX = _rng.randint(1, 2**63 - 1, size=NUM_PERM // BANDS, dtype=np.uint64) | np.uint64(1)
+
+# Trailing " - Reuters", " | CNN", " — The Associated Press" segment (at most four
+# words); only dropped when it names the article's source or a known outlet,
+# since "Israel - Hamas ceasefire collapses" is a headline, not an attribution
+_SOURCE_SUFFIX = re.compile(r"\s+[-–—|]\s+([\w.&']+(?:\s+[\w.&']+){0,3})\s*$")
+_NON_WORD = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_KNOWN_OUTLETS = frozenset(
+    "reuters ap apnews associatedpress theassociatedpress afp bbc bbcnews cnn foxnews nbcnews cbsnews abcnews "
+    "npr pbs bloomberg nytimes newyorktimes thenewyorktimes washingtonpost thewashingtonpost guardian "
+    "theguardian wsj wallstreetjournal thewallstreetjournal ft financialtimes economist theeconomist "
+    "aljazeera skynews dw france24 euronews usatoday politico axios cnbc forbes businessinsider thehill "
+    "yahoonews msn googlenews timesofindia thetimesofindia hindustantimes thehindu ndtv indiatoday "
+    "indianexpress theindianexpress livemint scroll theprint newsweek time latimes independent "
+    "theindependent telegraph thetelegraph dailymail".split()
+)
+# NewsData source ids whose headlines sign off with a longer outlet name
+_SOURCE_ALIASES = {
+    "bbc": ("bbcnews",),
+    "ap": ("apnews", "associatedpress", "theassociatedpress"),
+    "apnews": ("ap", "associatedpress", "theassociatedpress"),
+    "guardian": ("theguardian",),
+    "theguardian": ("guardian",),
+    "nytimes": ("newyorktimes", "thenewyorktimes"),
+    "washingtonpost": ("thewashingtonpost",),
+    "wsj": ("wallstreetjournal", "thewallstreetjournal"),
+    "timesofindia": ("thetimesofindia",),
+    "indianexpress": ("theindianexpress",),
+    "independent": ("theindependent",),
+    "hindu": ("thehindu",),
+}
+
+
+def _compact(text: str) -> str:
+    return _NON_ALNUM.sub("", text.lower())
+
+
+def _is_attribution(suffix: str, source: Optional[str]) -> bool:
+    """Whether a trailing headline segment names the outlet rather than the story."""
+    name = _compact(suffix)
+    if name in _KNOWN_OUTLETS:
+        return True
+    source = _compact(source or "")
+    # Exact names only: a prefix rule would let "indiatoday" strip "- India"
+    return bool(source) and (name == source or name in _SOURCE_ALIASES.get(source, ()))
+
+
+def normalize_headline(text: str, source: Optional[str] = None) -> str:
+    """Lowercase, drop a trailing attribution to `source` (or a known outlet) and punctuation."""
+    text = text.strip()
+    suffix = _SOURCE_SUFFIX.search(text)
+    if suffix and _is_attribution(suffix.group(1), source):
+        text = text[:suffix.start()]
+    text = _NON_WORD.sub(" ", text.lower())
+    return _SPACES.sub(" ", text).strip()
+
+
+def minhash_signature(text: str, source: Optional[str] = None) -> Optional[np.ndarray]:
+    """MinHash signature over character shingles of the normalized headline."""
+    normalized = normalize_headline(text, source)
+    if not normalized:
+        return None
+    if len(normalized) <= SHINGLE_SIZE:
+        shingles = {normalized}
+    else:
+        shingles = {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    permuted = (hashes[:, None] * _PERM_A + _PERM_B) % _HASH_PRIME
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def band_keys(signatures: np.ndarray) -> np.ndarray:
+    """Hash each band of each signature to a uint64 key; shape (n, BANDS)."""
+    rows = signatures.reshape(len(signatures), BANDS, NUM_PERM // BANDS).astype(np.uint64)
+    with np.errstate(over="ignore"):
+        return (rows * _BAND_MIX).sum(axis=2, dtype=np.uint64)
+
+
+class HeadlineIndex:
+    """
+    LSH index of canonical headlines.
+
+    Band tables are kept as sorted NumPy arrays (searched with searchsorted)
+    plus a small dict of recent inserts, so memory stays at a few dozen bytes
+    per headline. With a path, signatures and canonical ids are appended to
+    disk and reloaded on startup.
+    """
+
+    def __init__(self, path: Optional[str] = None, threshold: float = HEADLINE_INDEX_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        # Growable signature buffer; rows beyond len(self._ids) are unused capacity
+        self._signatures = np.empty((1024, NUM_PERM), dtype=np.uint32)
+        self._table_keys = [np.empty(0, dtype=np.uint64) for _ in range(BANDS)]
+        self._table_rows = [np.empty(0, dtype=np.int64) for _ in range(BANDS)]
+        self._recent: List[Dict[int, int]] = [{} for _ in range(BANDS)]
+        if path:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def match(self, text: str, source: Optional[str] = None) -> Optional[Tuple[str, str]]:
+        """Return (canonical_id, canonical_text) of a near-duplicate, if any."""
+        signature = minhash_signature(text, source)
+        if signature is None:
+            return None
+        with self._lock:
+            row = self._best_row(signature)
+            return (self._ids[row], self._texts[row]) if row is not None else None
+
+    def add(self, text: str, claim_id: str, source: Optional[str] = None) -> Tuple[str, str, bool]:
+        """
+        Register a headline. Returns (canonical_id, canonical_text, is_new);
+        near-duplicates resolve to the existing canonical entry. `source` is
+        the outlet id, so a trailing " - <outlet>" is ignored when comparing.
+        """
+        signature = minhash_signature(text, source)
+        if signature is None:
+            return claim_id, text, True
+        with self._lock:
+            row = self._best_row(signature)
+            if row is not None:
+                return self._ids[row], self._texts[row], False
+            self._insert(signature, claim_id, text)
+            self._persist(signature, claim_id, text)
+            return claim_id, text, True
+
+    def _best_row(self, signature: np.ndarray) -> Optional[int]:
+        keys = band_keys(signature[None, :])[0]
+        candidates = set()
+        for band, key in enumerate(keys):
+            key = int(key)
+            row = self._recent[band].get(key)
+            if row is not None:
+                candidates.add(row)
+            table = self._table_keys[band]
+            pos = int(np.searchsorted(table, key))
+            while pos < len(table) and table[pos] == key:
+                candidates.add(int(self._table_rows[band][pos]))
+                pos += 1
+        if not candidates:
+            return None
+        rows = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        similarity = (self._signatures[rows] == signature).mean(axis=1)
+        best = int(similarity.argmax())
+        return int(rows[best]) if similarity[best] >= self.threshold else None
+
+    def _insert(self, signature: np.ndarray, claim_id: str, text: str):
+        row = len(self._ids)
+        self._ids.append(claim_id)
+        self._texts.append(text)
+        if row == len(self._signatures):
+            grown = np.empty((2 * row, NUM_PERM), dtype=np.uint32)
+            grown[:row] = self._signatures
+            self._signatures = grown
+        self._signatures[row] = signature
+        for band, key in enumerate(band_keys(signature[None, :])[0]):
+            self._recent[band].setdefault(int(key), row)
+        if len(self._recent[0]) >= MERGE_EVERY:
+            self._merge_recent()
+
+    def _merge_recent(self):
+        for band in range(BANDS):
+            recent = self._recent[band]
+            if not recent:
+                continue
+            keys = np.concatenate([self._table_keys[band], np.fromiter(recent.keys(), dtype=np.uint64, count=len(recent))])
+            rows = np.concatenate([self._table_rows[band], np.fromiter(recent.values(), dtype=np.int64, count=len(recent))])
+            order = np.argsort(keys, kind="stable")
+            self._table_keys[band] = keys[order]
+            self._table_rows[band] = rows[order]
+            self._recent[band] = {}
+
+    def _build_tables(self):
+        keys = band_keys(self._signatures[:len(self._ids)])
+        rows = np.arange(len(self._ids), dtype=np.int64)
+        for band in range(BANDS):
+            order = np.argsort(keys[:, band], kind="stable")
+            self._table_keys[band] = keys[order, band]
+            self._table_rows[band] = rows[order]
+
+    def _files(self) -> Tuple[str, str]:
+        return data_path(self.path, "signatures.u32"), data_path(self.path, "entries.tsv")
+
+    def _load(self):
+        try:
+            signatures_file, entries_file = self._files()
+            if not os.path.exists(entries_file):
+                return
+            with open(entries_file, encoding="utf-8") as f:
+                entries = [line.rstrip("\n").split("\t", 1) for line in f if line.strip()]
+            raw = np.fromfile(signatures_file, dtype=np.uint32) if os.path.exists(signatures_file) else np.empty(0, dtype=np.uint32)
+            signatures = raw[:len(raw) // NUM_PERM * NUM_PERM].reshape(-1, NUM_PERM)
+            count = min(len(entries), len(signatures))  # tolerate a torn final append
+            self._ids = [e[0] for e in entries[:count]]
+            self._texts = [e[1] if len(e) > 1 else "" for e in entries[:count]]
+            self._signatures = np.empty((max(1024, 2 * count), NUM_PERM), dtype=np.uint32)
+            self._signatures[:count] = signatures[:count]
+            if len(signatures) != count or len(entries) != count:
+                self._rewrite(signatures_file, entries_file)
+            self._build_tables()
+            log.info("Loaded headline index", headlines=count)
+        except Exception as e:
+            log.warning("Failed to load headline index. Starting empty.", error=str(e))
+
+    def _rewrite(self, signatures_file: str, entries_file: str):
+        self._signatures[:len(self._ids)].tofile(signatures_file)
+        with open(entries_file, "w", encoding="utf-8") as f:
+            f.writelines(f"{i}\t{t}\n" for i, t in zip(self._ids, self._texts))
+
+    def _persist(self, signature: np.ndarray, claim_id: str, text: str):
+        if not self.path:
+            return
+        try:
+            signatures_file, entries_file = self._files()
+            with open(signatures_file, "ab") as f:
+                f.write(signature.tobytes())
+            with open(entries_file, "a", encoding="utf-8") as f:
+                f.write(f"{claim_id}\t{_SPACES.sub(' ', text)}\n")
+        except OSError as e:
+            log.warning("Failed to persist headline index entry", error=str(e))
+
+
+# Global instance (persistent, used for ingested claims)
+headline_index = HeadlineIndex(path="headline_index")
@@ -0,0 +1,214 @@
+"""
+Evaluate (and optionally retrain) the offline AI-image detector.
+
+Labeled samples live in SAMPLES_DIR/real and SAMPLES_DIR/ai (any format
+PIL reads). Examples:
+
+    python evaluate_ai_detector.py samples/                 # score the bundled model
+    python evaluate_ai_detector.py samples/ --train         # 5-fold CV, then refit on all
+    python evaluate_ai_detector.py samples/ --synthetic 60  # write a synthetic proxy set first
+
+--train writes the model to ai_detector_model.json (or --model).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime, timezone
+import numpy as np
+from PIL import Image
+from ai_detector import AI_DETECTOR_MODEL, FEATURE_NAMES, SpectralDetector, extract_features
+
+L2_PENALTY = 1.0
+
+
+def load_samples(samples_dir):
+    paths, labels = [], []
+    for label, folder in ((0, "real"), (1, "ai")):
+        directory = os.path.join(samples_dir, folder)
+        if not os.path.isdir(directory):
+            sys.exit(f"Missing {directory} (expected real/ and ai/ subfolders)")
+        for name in sorted(os.listdir(directory)):
+            paths.append(os.path.join(directory, name))
+            labels.append(label)
+    return paths, np.array(labels)
+
+
+def featurize(paths):
+    features, timings, kept = [], [], []
+    for i, path in enumerate(paths):
+        with open(path, "rb") as f:
+            data = f.read()
+        started = time.perf_counter()
+        try:
+            features.append(extract_features(data))
+        except Exception as e:
+            print(f"  skipping {path}: {e}")
+            continue
+        timings.append((time.perf_counter() - started) * 1000)
+        kept.append(i)
+    return np.array(features), np.array(timings), kept
+
+
+def fit_logistic(x, y):
+    """L2-regularized logistic regression by Newton's method on standardized features."""
+    mean = x.mean(axis=0)
+    scale = x.std(axis=0) + 1e-9
+    z = np.hstack([(x - mean) / scale, np.ones((len(x), 1))])
+    w = np.zeros(z.shape[1])
+    penalty = L2_PENALTY * np.eye(z.shape[1])
+    penalty[-1, -1] = 0.0  # bias is not regularized
+    for _ in range(50):
+        p = 1.0 / (1.0 + np.exp(-(z @ w)))
+        gradient = z.T @ (p - y) + penalty @ w
+        hessian = (z * (p * (1 - p))[:, None]).T @ z + penalty
+        step = np.linalg.solve(hessian, gradient)
+        w -= step
+        if np.abs(step).max() < 1e-6:
+            break
+    return {"mean": mean.tolist(), "scale": scale.tolist(), "weights": w[:-1].tolist(), "bias": float(w[-1])}
+
+
+def predict(model, x):
+    logit = ((x - np.array(model["mean"])) / np.array(model["scale"])) @ np.array(model["weights"]) + model["bias"]
+    return 1.0 / (1.0 + np.exp(-logit))
+
+
+def roc_auc(y, scores):
+    """Probability a random AI sample outscores a random real one (ties count half)."""
+    order = np.argsort(scores)
+    ranks = np.empty(len(scores))
+    ranks[order] = np.arange(1, len(scores) + 1)
+    for value in np.unique(scores):
+        tied = scores == value
+        ranks[tied] = ranks[tied].mean()
+    positives = y.sum()
+    negatives = len(y) - positives
+    if not positives or not negatives:
+        return float("nan")
+    return float((ranks[y == 1].sum() - positives * (positives + 1) / 2) / (positives * negatives))
+
+
+def report(title, y, probabilities):
+    predicted = probabilities >= 0.5
+    tp = int(np.sum(predicted & (y == 1)))
+    tn = int(np.sum(~predicted & (y == 0)))
+    fp = int(np.sum(predicted & (y == 0)))
+    fn = int(np.sum(~predicted & (y == 1)))
+    print(f"--- {title} ---")
+    print(f"samples: {len(y)} (real {int(np.sum(y == 0))}, ai {int(np.sum(y == 1))})")
+    print(f"accuracy: {(tp + tn) / len(y):.3f}   ROC AUC: {roc_auc(y, probabilities):.3f}")
+    print(f"confusion: real->real {tn}  real->ai {fp}  ai->real {fn}  ai->ai {tp}")
+
+
+def cross_validate(x, y, folds):
+    rng = np.random.default_rng(0)
+    fold_of = np.empty(len(y), dtype=int)
+    for label in (0, 1):
+        members = rng.permutation(np.flatnonzero(y == label))
+        fold_of[members] = np.arange(len(members)) % folds
+    probabilities = np.empty(len(y))
+    for fold in range(folds):
+        test = fold_of == fold
+        model = fit_logistic(x[~test], y[~test])
+        probabilities[test] = predict(model, x[test])
+    return probabilities
+
+
+def write_synthetic(samples_dir, count):
+    """
+    Proxy data only, for bootstrapping the model without a labeled corpus:
+    "real" images go through a Bayer mosaic, demosaicing and sensor noise;
+    "ai" images are low-resolution content pushed through 2x upsampling
+    stages the way generator decoders build pixels.
+    """
+    rng = np.random.default_rng(42)
+
+    def content(height, width):
+        field = np.zeros((height, width, 3), np.float32)
+        for cells, amplitude in ((4, 70), (16, 45), (64, 25), (256, 12)):
+            noise = rng.random((max(2, height * cells // 1024), max(2, width * cells // 1024), 3))
+            layer = Image.fromarray((noise * 255).astype(np.uint8)).resize((width, height), Image.BICUBIC)
+            field += amplitude * (np.asarray(layer, np.float32) / 127.5 - 1)
+        return field + 128
+
+    def camera(height, width):
+        # Sensor noise is added before demosaicing, as on a real sensor
+        scene = content(height, width)
+        scene += rng.normal(0, rng.uniform(1.5, 5), scene.shape)
+        mosaic = np.zeros_like(scene)
+        mosaic[0::2, 0::2, 0] = scene[0::2, 0::2, 0]
+        mosaic[0::2, 1::2, 1] = scene[0::2, 1::2, 1]
+        mosaic[1::2, 0::2, 1] = scene[1::2, 0::2, 1]
+        mosaic[1::2, 1::2, 2] = scene[1::2, 1::2, 2]
+        mask = np.zeros_like(scene)
+        mask[0::2, 0::2, 0] = mask[0::2, 1::2, 1] = mask[1::2, 0::2, 1] = mask[1::2, 1::2, 2] = 1
+        # Bilinear demosaic: normalized 3x3 average of the sampled sites
+        kernel = lambda a: sum(np.roll(np.roll(a, dy, 0), dx, 1) for dy in (-1, 0, 1) for dx in (-1, 0, 1))
+        demosaiced = np.where(mask > 0, mosaic, kernel(mosaic) / np.maximum(kernel(mask), 1))
+        return Image.fromarray(np.clip(demosaiced, 0, 255).astype(np.uint8))
+
+    def generator(height, width):
+        stages = int(rng.integers(2, 4))
+        small = content(height >> stages, width >> stages)
+        for _ in range(stages):
+            small = small.repeat(2, axis=0).repeat(2, axis=1)
+            small = (small + np.roll(small, 1, 0) + np.roll(small, 1, 1) + np.roll(np.roll(small, 1, 0), 1, 1)) / 4
+            small += rng.normal(0, 0.6, small.shape)
+        return Image.fromarray(np.clip(small, 0, 255).astype(np.uint8))
+
+    for folder, make in (("real", camera), ("ai", generator)):
+        os.makedirs(os.path.join(samples_dir, folder), exist_ok=True)
+        for i in range(count):
+            side = int(rng.choice([512, 768, 1024]))
+            image = make(side, int(side * rng.choice([1.0, 1.5])) // 8 * 8)
+            if rng.random() < 0.5:
+                image.save(os.path.join(samples_dir, folder, f"synthetic_{i:03d}.png"))
+            else:
+                image.save(os.path.join(samples_dir, folder, f"synthetic_{i:03d}.jpg"), quality=int(rng.integers(80, 96)))
+    print(f"Wrote {count} synthetic samples per class to {samples_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("samples_dir")
+    parser.add_argument("--train", action="store_true", help="cross-validate, then fit on all samples and save")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--model", default=AI_DETECTOR_MODEL)
+    parser.add_argument("--synthetic", type=int, default=0, help="first write N synthetic samples per class")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        write_synthetic(args.samples_dir, args.synthetic)
+    paths, labels = load_samples(args.samples_dir)
+    x, timings, kept = featurize(paths)
+    y = labels[kept]
+    print(f"Feature extraction: mean {timings.mean():.1f} ms, p95 {np.percentile(timings, 95):.1f} ms per image")
+
+    if args.train:
+        report(f"{args.folds}-fold cross-validation", y, cross_validate(x, y, args.folds))
+        model = {
+            "version": datetime.now(timezone.utc).strftime("%Y%m%d"),
+            "features": FEATURE_NAMES,
+            **fit_logistic(x, y),
+            "trained_on": {
+                "samples_dir": os.path.basename(os.path.normpath(args.samples_dir)),
+                "real": int(np.sum(y == 0)),
+                "ai": int(np.sum(y == 1)),
+                "synthetic": sum(os.path.basename(paths[i]).startswith("synthetic_") for i in kept),
+            },
+        }
+        with open(args.model, "w", encoding="utf-8") as f:
+            json.dump(model, f, indent=2)
+        print(f"Saved model to {args.model}")
+        return
+
+    detector = SpectralDetector(args.model)
+    if not detector.available:
+        sys.exit("No model to evaluate; run with --train first")
+    report(f"model {detector.model.get('version')}", y, np.array([detector.probability(f) for f in x]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Events Module
+In-process publish/subscribe feed of scanned claims, verdicts and crisis
+alerts, served over SSE (/api/events) and WebSocket (/api/events/ws).
+Every event gets an increasing offset and is kept in a ring log, so a
+client reconnecting with its last offset gets what it missed. Each
+subscriber has a bounded buffer; one that falls behind is dropped (told
+where to resume) instead of holding memory. Idle subscribers cost one
+small object and a wait on an asyncio.Event.
+"""
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Deque, Dict, FrozenSet, Iterable, List, Optional, Set
+from pydantic_core import to_json
+from starlette.websockets import WebSocket, WebSocketDisconnect
+from logs import get_logger
+
+log = get_logger("events")
+
+# Events kept for resume-from-offset
+EVENT_LOG_SIZE = int(os.getenv("EVENT_LOG_SIZE") or "1000")
+# Undelivered events per subscriber before it is dropped as a slow consumer
+EVENT_SUBSCRIBER_BUFFER = int(os.getenv("EVENT_SUBSCRIBER_BUFFER") or "256")
+EVENT_HEARTBEAT_SECONDS = 15
+# SSE responses end after this long and the browser reconnects with Last-Event-ID;
+# keeps server restarts from waiting on streams that never finish
+EVENT_STREAM_MAX_SECONDS = float(os.getenv("EVENT_STREAM_MAX_SECONDS") or "300")
+# Crisis alerts already published (by alert id and verified flag), so repeated detection does not re-send them
+ALERTS_REMEMBERED = 10000
+SSE_RETRY_MS = 3000
+# Close code for dropped WebSocket subscribers ("try again later")
+WS_TRY_AGAIN_LATER = 1013
+
+TOPICS = ("claims", "verdicts", "crisis")
+
+
+def parse_topics(value: Optional[str]) -> FrozenSet[str]:
+    """Comma-separated topic filter; empty means every topic. Raises ValueError on unknown topics."""
+    topics = frozenset(part.strip() for part in (value or "").split(",") if part.strip())
+    unknown = topics - set(TOPICS)
+    if unknown:
+        raise ValueError(f"Unknown topics: {', '.join(sorted(unknown))} (available: {', '.join(TOPICS)})")
+    return topics or frozenset(TOPICS)
+
+
+class Event:
+    __slots__ = ("offset", "topic", "type", "json", "_sse")
+
+    def __init__(self, offset: int, topic: str, event_type: str, data: bytes):
+        self.offset = offset
+        self.topic = topic
+        self.type = event_type
+        # Encoded once; every subscriber and replay sends the same bytes
+        self.json = b'{"offset":%d,"topic":"%s","type":"%s","ts":%.3f,"data":%s}' % (
+            offset, topic.encode(), event_type.encode(), time.time(), data
+        )
+        self._sse: Optional[bytes] = None
+
+    def sse(self) -> bytes:
+        if self._sse is None:
+            # Notices carry no id, so they never move the client's Last-Event-ID
+            event_id = b"id: %d\n" % self.offset if self.offset > 0 else b""
+            self._sse = event_id + b"event: %s\ndata: %s\n\n" % (self.type.encode(), self.json)
+        return self._sse
+
+
+def _notice(event_type: str, **fields) -> Event:
+    """Control message for one subscriber (not logged, no offset)."""
+    return Event(-1, "stream", event_type, to_json(fields))
+
+
+class Subscriber:
+    __slots__ = ("topics", "buffer", "wake", "closed", "start", "last_offset")
+
+    def __init__(self, topics: FrozenSet[str], start: int, last_offset: int):
+        self.topics = topics
+        self.buffer: Deque[Event] = deque()
+        self.wake = asyncio.Event()
+        self.closed: Optional[str] = None
+        # Events up to `start` come from the log replay, later ones from dispatch
+        self.start = start
+        self.last_offset = last_offset
+
+    async def next(self, timeout: float) -> Optional[List[Event]]:
+        """Buffered events, waiting up to `timeout` seconds; None on timeout (time for a heartbeat)."""
+        if not self.buffer and not self.closed:
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        self.wake.clear()
+        events = list(self.buffer)
+        self.buffer.clear()
+        if events:
+            self.last_offset = max(self.last_offset, events[-1].offset)
+        return events
+
+
+class EventBus:
+    def __init__(self, log_size: int = EVENT_LOG_SIZE, buffer_size: int = EVENT_SUBSCRIBER_BUFFER):
+        self.buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self._log: Deque[Event] = deque(maxlen=log_size)
+        self._offset = 0
+        self._by_topic: Dict[str, Set[Subscriber]] = {topic: set() for topic in TOPICS}
+        self._subscribers: Set[Subscriber] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._alerts: "OrderedDict[tuple, None]" = OrderedDict()
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, topic: str, event_type: str, data: Any) -> int:
+        """Log an event and hand it to matching subscribers. Safe to call from any thread; returns its offset."""
+        encoded = data if isinstance(data, bytes) else to_json(data)
+        with self._lock:
+            self._offset += 1
+            event = Event(self._offset, topic, event_type, encoded)
+            self._log.append(event)
+            self.published += 1
+            loop = self._loop if self._subscribers else None
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._dispatch, event)
+        return event.offset
+
+    def publish_alerts(self, alerts: Iterable[Any]) -> int:
+        """Publish crisis alerts not published before; returns how many were new."""
+        fresh = []
+        with self._lock:
+            for alert in alerts:
+                key = (alert.id, alert.verified)
+                if key in self._alerts:
+                    continue
+                self._alerts[key] = None
+                if len(self._alerts) > ALERTS_REMEMBERED:
+                    self._alerts.popitem(last=False)
+                fresh.append(alert)
+        for alert in fresh:
+            self.publish("crisis", "crisis.alert", alert)
+        return len(fresh)
+
+    def _dispatch(self, event: Event):
+        # Runs on the event loop, so subscriber sets and buffers need no lock
+        for subscriber in list(self._by_topic.get(event.topic, ())):
+            if event.offset <= subscriber.start:
+                continue
+            if len(subscriber.buffer) >= self.buffer_size:
+                self._drop(subscriber, "slow_consumer")
+                continue
+            subscriber.buffer.append(event)
+            subscriber.wake.set()
+
+    def _drop(self, subscriber: Subscriber, reason: str):
+        if subscriber.closed:
+            return
+        self._remove(subscriber)
+        subscriber.closed = reason
+        self.dropped += 1
+        # Undelivered events are discarded; the client resumes from its last delivered offset
+        pending = [event.offset for event in subscriber.buffer if event.offset > 0]
+        resume_from = pending[0] - 1 if pending else subscriber.last_offset
+        subscriber.buffer.clear()
+        subscriber.buffer.append(_notice("stream.dropped", reason=reason, resume_from=resume_from))
+        subscriber.wake.set()
+        log.info("Dropped event subscriber", reason=reason, resume_from=resume_from)
+
+    def _remove(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+        for topic in subscriber.topics:
+            self._by_topic[topic].discard(subscriber)
+
+    def subscribe(self, topics: FrozenSet[str], since: Optional[int] = None) -> Subscriber:
+        """
+        New subscriber (call on the event loop). With `since`, logged events
+        after that offset are queued first; if some were already evicted from
+        the log, a stream.gap notice comes first so the client can refetch.
+        """
+        self._loop = asyncio.get_running_loop()
+        with self._lock:
+            subscriber = Subscriber(topics, self._offset, self._offset if since is None else since)
+            if since is not None and since < self._offset:
+                oldest = self._log[0].offset if self._log else self._offset + 1
+                if since < oldest - 1:
+                    subscriber.buffer.append(_notice("stream.gap", since=since, oldest=oldest))
+                subscriber.buffer.extend(event for event in self._log if event.offset > since and event.topic in topics)
+            self._subscribers.add(subscriber)
+            for topic in topics:
+                self._by_topic[topic].add(subscriber)
+        if subscriber.buffer:
+            subscriber.wake.set()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self._remove(subscriber)
+
+    async def sse(self, subscriber: Subscriber) -> AsyncIterator[bytes]:
+        """Server-sent events for a subscriber, with comment heartbeats while idle."""
+        ends_at = time.monotonic() + EVENT_STREAM_MAX_SECONDS
+        try:
+            yield b"retry: %d\n\n" % SSE_RETRY_MS
+            while time.monotonic() < ends_at:
+                events = await subscriber.next(min(EVENT_HEARTBEAT_SECONDS, max(0.0, ends_at - time.monotonic())))
+                if events is None:
+                    yield b": ping\n\n"
+                    continue
+                # One write per wake-up, however many events piled up
+                yield b"".join(event.sse() for event in events)
+                if subscriber.closed:
+                    return
+        finally:
+            self.unsubscribe(subscriber)
+
+    async def websocket(self, websocket: WebSocket, subscriber: Subscriber):
+        """Send a subscriber's events as JSON text frames until it is dropped or the client leaves."""
+        try:
+            while True:
+                events = await subscriber.next(EVENT_HEARTBEAT_SECONDS)
+                if events is None:
+                    await websocket.send_text('{"type":"ping"}')
+                    continue
+                for event in events:
+                    await websocket.send_text(event.json.decode())
+                if subscriber.closed:
+                    await websocket.close(code=WS_TRY_AGAIN_LATER)
+                    return
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self.unsubscribe(subscriber)
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "by_topic": {topic: len(subscribers) for topic, subscribers in self._by_topic.items()},
+                "offset": self._offset,
+                "oldest_offset": self._log[0].offset if self._log else None,
+                "published": self.published,
+                "dropped_subscribers": self.dropped,
+            }
+
+
+# Global instance
+event_bus = EventBus()
@@ -0,0 +1,345 @@
+"""
+Evidence Index Module
+Local BM25 inverted index over every Evidence item the agents have collected.
+"""
+import os
+import re
+import json
+import glob
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from models import Evidence
+from storage import data_path
+from logs import get_logger
+
+log = get_logger("evidence_index")
+
+# Documents buffered in memory before being written out as an immutable segment
+EVIDENCE_INDEX_FLUSH_DOCS = int(os.getenv("EVIDENCE_INDEX_FLUSH_DOCS", "512"))
+# Segments are compacted into one once there are more than this many
+EVIDENCE_INDEX_MAX_SEGMENTS = int(os.getenv("EVIDENCE_INDEX_MAX_SEGMENTS", "8"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with "
+    "fact check checked snopes verified".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS and len(t) > 1]
+
+
+class Segment:
+    """
+    Immutable postings for a contiguous range of doc ids.
+
+    Postings are one flat uint32 array of (doc_id, tf) pairs grouped by term,
+    so on-disk segments can be memory-mapped rather than read into the heap.
+    """
+
+    def __init__(self, start: int, end: int, terms: Dict[str, Tuple[int, int]], postings: np.ndarray, doc_lengths: np.ndarray):
+        self.start = start
+        self.end = end
+        self.terms = terms
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+
+    def lookup(self, term: str) -> Optional[np.ndarray]:
+        entry = self.terms.get(term)
+        if entry is None:
+            return None
+        offset, count = entry
+        return self.postings[offset:offset + count]
+
+    @classmethod
+    def build(cls, start: int, end: int, term_postings: Dict[str, List[Tuple[int, int]]], doc_lengths: np.ndarray) -> "Segment":
+        terms = {}
+        chunks = []
+        offset = 0
+        for term in sorted(term_postings):
+            pairs = term_postings[term]
+            terms[term] = (offset, len(pairs))
+            chunks.append(np.asarray(pairs, dtype=np.uint32).reshape(-1, 2))
+            offset += len(pairs)
+        postings = np.concatenate(chunks) if chunks else np.empty((0, 2), dtype=np.uint32)
+        return cls(start, end, terms, postings, doc_lengths.astype(np.uint32))
+
+    @classmethod
+    def merge(cls, segments: List["Segment"]) -> "Segment":
+        term_chunks: Dict[str, List[np.ndarray]] = {}
+        for segment in segments:  # ordered by doc id, so postings stay sorted
+            for term in segment.terms:
+                term_chunks.setdefault(term, []).append(segment.lookup(term))
+        terms = {}
+        chunks = []
+        offset = 0
+        for term in sorted(term_chunks):
+            block = np.concatenate(term_chunks[term])
+            terms[term] = (offset, len(block))
+            chunks.append(block)
+            offset += len(block)
+        postings = np.concatenate(chunks) if chunks else np.empty((0, 2), dtype=np.uint32)
+        doc_lengths = np.concatenate([s.doc_lengths for s in segments])
+        return cls(segments[0].start, segments[-1].end, terms, postings, doc_lengths)
+
+    def name(self) -> str:
+        return f"seg_{self.start:010d}_{self.end:010d}"
+
+    def save(self, directory: str):
+        base = os.path.join(directory, self.name())
+        np.ascontiguousarray(self.postings, dtype=np.uint32).tofile(base + ".postings.u32")
+        np.ascontiguousarray(self.doc_lengths, dtype=np.uint32).tofile(base + ".doclens.u32")
+        # Terms file last: a segment only counts once its term dictionary exists
+        with open(base + ".terms.json.tmp", "w", encoding="utf-8") as f:
+            json.dump(self.terms, f, separators=(",", ":"))
+        os.replace(base + ".terms.json.tmp", base + ".terms.json")
+
+    @classmethod
+    def load(cls, terms_file: str) -> "Segment":
+        base = terms_file[:-len(".terms.json")]
+        start, end = (int(p) for p in os.path.basename(base).split("_")[1:3])
+        with open(terms_file, encoding="utf-8") as f:
+            terms = {t: tuple(v) for t, v in json.load(f).items()}
+        postings_file = base + ".postings.u32"
+        if os.path.getsize(postings_file):
+            postings = np.memmap(postings_file, dtype=np.uint32, mode="r").reshape(-1, 2)
+        else:
+            postings = np.empty((0, 2), dtype=np.uint32)
+        doc_lengths = np.fromfile(base + ".doclens.u32", dtype=np.uint32)
+        return cls(start, end, terms, postings, doc_lengths)
+
+    def delete_files(self, directory: str):
+        base = os.path.join(directory, self.name())
+        for suffix in (".terms.json", ".postings.u32", ".doclens.u32"):
+            try:
+                os.remove(base + suffix)
+            except OSError:
+                pass
+
+
+class EvidenceIndex:
+    """
+    Incremental BM25 index.
+
+    New evidence goes to an in-memory buffer and an append-only document log
+    (docs.jsonl); the buffer is flushed to an immutable segment every
+    EVIDENCE_INDEX_FLUSH_DOCS documents. On restart, documents logged after
+    the last segment are replayed into the buffer.
+    """
+
+    def __init__(self, path: Optional[str] = "evidence_index"):
+        self._lock = threading.Lock()
+        self._segments: List[Segment] = []
+        self._buffer: Dict[str, List[Tuple[int, int]]] = {}
+        self._buffer_lengths: List[int] = []
+        self._buffer_start = 0
+        self._doc_offsets: List[int] = []
+        self._memory_docs: Dict[int, Evidence] = {}
+        self._seen: set = set()
+        self._total_length = 0
+        self._segment_lengths = np.empty(0, dtype=np.uint32)
+        self.directory = None
+        if path:
+            try:
+                self.directory = os.path.dirname(data_path(path, "docs.jsonl"))
+                self._load()
+            except Exception as e:
+                log.warning("Evidence index persistence unavailable. Using memory only.", error=str(e))
+                self.directory = None
+
+    def __len__(self) -> int:
+        return len(self._doc_offsets)
+
+    def add(self, evidence: Evidence) -> bool:
+        """Index one evidence item. Returns False for duplicates and empty text."""
+        tokens = tokenize(f"{evidence.source} {evidence.content}")
+        if not tokens:
+            return False
+        key = self._dedup_key(evidence)
+        with self._lock:
+            if key in self._seen:
+                return False
+            self._seen.add(key)
+            doc_id = len(self._doc_offsets)
+            self._doc_offsets.append(self._append_doc(doc_id, evidence))
+            self._index_tokens(doc_id, tokens)
+            if len(self._buffer_lengths) >= EVIDENCE_INDEX_FLUSH_DOCS:
+                self._flush()
+        return True
+
+    def add_many(self, evidence: List[Evidence]) -> int:
+        return sum(self.add(e) for e in evidence)
+
+    def search(self, query: str, k: int = 3, min_coverage: float = 0.0, min_score: float = 0.0) -> List[Tuple[Evidence, float]]:
+        """
+        Return up to k (evidence, bm25_score) pairs, best first. Documents must
+        contain at least min_coverage of the distinct query terms and score at
+        least min_score per distinct query term (so the floor means the same
+        for short and long queries).
+        """
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            total_docs = len(self._doc_offsets)
+            if not total_docs:
+                return []
+            avg_length = max(self._total_length / total_docs, 1.0)
+            doc_blocks = []
+            score_blocks = []
+            for term in terms:
+                postings = self._term_postings(term)
+                if postings is None or not len(postings):
+                    continue
+                doc_ids = postings[:, 0].astype(np.int64)
+                tf = postings[:, 1].astype(np.float32)
+                idf = np.log(1.0 + (total_docs - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+                norm = BM25_K1 * (1.0 - BM25_B + BM25_B * self._doc_lengths(doc_ids) / avg_length)
+                doc_blocks.append(doc_ids)
+                score_blocks.append(idf * tf * (BM25_K1 + 1.0) / (tf + norm))
+            if not doc_blocks:
+                return []
+            # Accumulate over matching postings only, never over the whole corpus
+            docs, inverse = np.unique(np.concatenate(doc_blocks), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(score_blocks))
+            matched = np.bincount(inverse)
+            keep = np.flatnonzero(
+                (matched >= max(1, int(np.ceil(min_coverage * len(terms))))) & (scores >= min_score * len(terms))
+            )
+            if not len(keep):
+                return []
+            if len(keep) > k:
+                keep = keep[np.argpartition(-scores[keep], k - 1)[:k]]
+            keep = keep[np.argsort(-scores[keep])]
+            return [(self._read_doc(int(docs[i])), float(scores[i])) for i in keep]
+
+    def _index_tokens(self, doc_id: int, tokens: List[str]):
+        counts: Dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for term, tf in counts.items():
+            self._buffer.setdefault(term, []).append((doc_id, tf))
+        self._buffer_lengths.append(len(tokens))
+        self._total_length += len(tokens)
+
+    def _term_postings(self, term: str) -> Optional[np.ndarray]:
+        blocks = [p for p in (s.lookup(term) for s in self._segments) if p is not None]
+        if term in self._buffer:
+            blocks.append(np.asarray(self._buffer[term], dtype=np.uint32).reshape(-1, 2))
+        if not blocks:
+            return None
+        return blocks[0] if len(blocks) == 1 else np.concatenate(blocks)
+
+    def _doc_lengths(self, doc_ids: np.ndarray) -> np.ndarray:
+        lengths = np.empty(len(doc_ids), dtype=np.float32)
+        in_segments = doc_ids < self._buffer_start
+        lengths[in_segments] = self._segment_lengths[doc_ids[in_segments]]
+        buffered = np.asarray(self._buffer_lengths, dtype=np.float32)
+        lengths[~in_segments] = buffered[doc_ids[~in_segments] - self._buffer_start]
+        return lengths
+
+    def _refresh_segment_lengths(self):
+        parts = [s.doc_lengths for s in self._segments]
+        self._segment_lengths = np.concatenate(parts) if parts else np.empty(0, dtype=np.uint32)
+
+    def _flush(self):
+        end = self._buffer_start + len(self._buffer_lengths)
+        segment = Segment.build(self._buffer_start, end, self._buffer, np.asarray(self._buffer_lengths))
+        if len(self._segments) >= EVIDENCE_INDEX_MAX_SEGMENTS:
+            merged = Segment.merge(self._segments + [segment])
+            old, self._segments = self._segments, [merged]
+            self._save_segment(merged, replaced=old)
+        else:
+            self._segments.append(segment)
+            self._save_segment(segment)
+        self._buffer = {}
+        self._buffer_lengths = []
+        self._buffer_start = end
+        self._refresh_segment_lengths()
+
+    def _save_segment(self, segment: Segment, replaced: Optional[List[Segment]] = None):
+        if not self.directory:
+            return
+        try:
+            segment.save(self.directory)
+            for old in replaced or []:
+                if old.name() != segment.name():
+                    old.delete_files(self.directory)
+        except OSError as e:
+            log.warning("Failed to write evidence index segment", error=str(e))
+
+    def _append_doc(self, doc_id: int, evidence: Evidence) -> int:
+        if self.directory:
+            try:
+                with open(os.path.join(self.directory, "docs.jsonl"), "ab") as f:
+                    offset = f.tell()
+                    f.write(evidence.model_dump_json().encode("utf-8") + b"\n")
+                return offset
+            except OSError as e:
+                log.warning("Failed to log evidence document", error=str(e))
+        self._memory_docs[doc_id] = evidence
+        return -1
+
+    def _read_doc(self, doc_id: int) -> Evidence:
+        evidence = self._memory_docs.get(doc_id)
+        if evidence is not None:
+            return evidence
+        with open(os.path.join(self.directory, "docs.jsonl"), "rb") as f:
+            f.seek(self._doc_offsets[doc_id])
+            return Evidence.model_validate_json(f.readline())
+
+    def _load(self):
+        for terms_file in sorted(glob.glob(os.path.join(self.directory, "seg_*.terms.json"))):
+            segment = Segment.load(terms_file)
+            expected = self._segments[-1].end if self._segments else 0
+            if segment.start < expected:
+                continue  # superseded by a merged segment whose inputs weren't cleaned up
+            if segment.start != expected:
+                log.warning("Evidence index segment gap; ignoring later segments", expected=expected)
+                break
+            self._segments.append(segment)
+
+        docs_file = os.path.join(self.directory, "docs.jsonl")
+        entries = []
+        if os.path.exists(docs_file):
+            with open(docs_file, "rb") as f:
+                offset = 0
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # torn final write
+                    entries.append((offset, line))
+                    offset += len(line)
+
+        indexed = self._segments[-1].end if self._segments else 0
+        if indexed > len(entries):
+            log.warning("Evidence index document log is shorter than its segments; rebuilding")
+            for segment in self._segments:
+                segment.delete_files(self.directory)
+            self._segments = []
+            indexed = 0
+        self._buffer_start = indexed
+        self._total_length = sum(int(s.doc_lengths.sum()) for s in self._segments)
+        self._refresh_segment_lengths()
+
+        for doc_id, (offset, line) in enumerate(entries):
+            evidence = Evidence.model_validate_json(line)
+            self._doc_offsets.append(offset)
+            self._seen.add(self._dedup_key(evidence))
+            if doc_id >= indexed:
+                self._index_tokens(doc_id, tokenize(f"{evidence.source} {evidence.content}") or ["_"])
+        if self._doc_offsets:
+            log.info("Loaded evidence index", documents=len(self._doc_offsets), segments=len(self._segments))
+
+    @staticmethod
+    def _dedup_key(evidence: Evidence) -> bytes:
+        return hashlib.sha1(f"{evidence.url}\n{evidence.content}".encode("utf-8")).digest()[:12]
+
+
+# Global instance
+evidence_index = EvidenceIndex()
@@ -0,0 +1,420 @@
+"""
+Forensics Module
+CPU-only image forensics on NumPy/PIL: error level analysis, JPEG
+quantization-table and double-compression checks, noise-residual
+consistency and block-matching copy-move detection, each with a region
+heatmap.
+"""
+import os
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+from uploads import image_stream
+
+# Refuse images above this many pixels (decompression bombs)
+FORENSICS_MAX_PIXELS = int(os.getenv("FORENSICS_MAX_PIXELS", "50000000"))
+ELA_QUALITY = 90
+# Share of the image covered by coherent ELA/noise outliers that scores 1.0
+COHERENT_AREA = 0.01
+# Lossy formats whose (4x4) block transform would read as a shifted JPEG grid
+NON_JPEG_BLOCK_CODECS = {"WEBP", "AVIF", "HEIF"}
+HEATMAP_CELLS = 32          # cells along the heatmap's long side
+NOISE_BLOCK = 32            # pixels per noise-estimate block
+COPY_MOVE_MAX_SIDE = 512    # copy-move runs on a downscaled copy
+COPY_MOVE_MIN_SHIFT = 24    # ignore matches closer than this (downscaled pixels)
+COPY_MOVE_MIN_PAIRS = 24    # matched blocks sharing one shift before it counts
+COPY_MOVE_STEP = 12.0       # DCT feature quantization step
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("FORENSICS_WORKERS", "4")), thread_name_prefix="forensics")
+
+# Detector weights in the combined score: copy-move is the most specific
+# evidence; double compression alone only shows the image was re-saved
+WEIGHTS = {
+    "copy_move": 0.9,
+    "double_compression": 0.4,
+    "noise": 0.5,
+    "ela": 0.5,
+    "grid": 0.3,
+}
+
+_k = np.arange(8)
+# Orthonormal 8x8 DCT-II basis (JPEG's transform)
+_DCT8 = (np.sqrt(2.0 / 8) * np.cos(np.pi * (2 * _k[None, :] + 1) * _k[:, None] / 16)).astype(np.float32)
+_DCT8[0] /= np.sqrt(2.0)
+
+# IJG (libjpeg) luminance table at quality 50, natural order
+_IJG_LUMA = np.array([
+    16, 11, 10, 16, 24, 40, 51, 61,
+    12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56,
+    14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77,
+    24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101,
+    72, 92, 95, 98, 112, 100, 103, 99,
+], dtype=np.float64)
+# Low-frequency AC positions used for double-quantization histograms
+_DQ_COEFFS = [(0, 1), (1, 0), (1, 1), (0, 2), (2, 0), (1, 2), (2, 1), (2, 2)]
+# Zigzag order of the first coefficients, for copy-move block features
+_ZIGZAG = [(0, 0), (0, 1), (1, 0), (2, 0), (1, 1), (0, 2)]
+
+# EXIF orientation -> transpose that makes the stored pixels upright
+_ORIENTATION = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+def _ijg_table(quality: int) -> np.ndarray:
+    scale = 5000 / quality if quality < 50 else 200 - 2 * quality
+    return np.clip(np.floor((_IJG_LUMA * scale + 50) / 100), 1, 255)
+
+
+_IJG_TABLES = np.stack([_ijg_table(q) for q in range(1, 101)])
+
+
+def _blocks(plane: np.ndarray, size: int) -> np.ndarray:
+    """(rows, cols, size, size) view of the size-aligned part of plane."""
+    h, w = plane.shape[0] // size * size, plane.shape[1] // size * size
+    return plane[:h, :w].reshape(h // size, size, w // size, size).swapaxes(1, 2)
+
+
+def _block_mean(plane: np.ndarray, size: int) -> np.ndarray:
+    h, w = plane.shape[0] // size * size, plane.shape[1] // size * size
+    return plane[:h, :w].reshape(h // size, size, w // size, size).mean(axis=(1, 3))
+
+
+def _coherent(mask: np.ndarray) -> np.ndarray:
+    """Outlier blocks with at least one outlier 4-neighbor (isolated blocks are texture noise)."""
+    padded = np.pad(mask, 1)
+    neighbors = padded[:-2, 1:-1] | padded[2:, 1:-1] | padded[1:-1, :-2] | padded[1:-1, 2:]
+    return mask & neighbors
+
+
+def _robust_z(values: np.ndarray) -> np.ndarray:
+    """Deviation from the median in units of the (MAD-estimated) spread."""
+    median = np.median(values)
+    spread = 1.4826 * np.median(np.abs(values - median))
+    return (values - median) / max(spread, 1e-3)
+
+
+class ForensicsEngine:
+    """
+    Runs every detector on the decoded luminance plane. JPEGs are decoded
+    straight to YCbCr so the Y plane is exactly what the encoder quantized.
+    Each detector returns a 0-1 score, a short finding and an optional
+    suspiciousness map; the maps are resampled onto one heatmap grid.
+    """
+
+    def analyze(self, image_data: bytes) -> Dict:
+        """Raises ValueError for data that isn't a usable image."""
+        started = time.perf_counter()
+        timings = {}
+
+        try:
+            image = Image.open(image_stream(image_data))
+            width, height = image.size
+            if width * height > FORENSICS_MAX_PIXELS:
+                raise ValueError(f"Image too large for forensic analysis ({width}x{height})")
+            if min(width, height) < 32:
+                raise ValueError(f"Image too small for forensic analysis ({width}x{height})")
+            image_format = image.format
+            qtables = getattr(image, "quantization", None) or {}
+            orientation = image.getexif().get(0x0112, 1)
+            if image_format == "JPEG":
+                image.draft("YCbCr", image.size)  # decode without color conversion
+            luma = image.convert("L") if image.mode != "YCbCr" else image.getchannel(0)
+        except (OSError, Image.DecompressionBombError) as e:
+            raise ValueError("Unreadable or unsupported image") from e
+        gray = np.asarray(luma, dtype=np.float32)
+        timings["decode"] = round((time.perf_counter() - started) * 1000, 1)
+
+        # Detectors are independent and spend their time in NumPy/PIL
+        # code that releases the GIL, so they run side by side
+        def timed(name, detector, *args):
+            stage_start = time.perf_counter()
+            result = detector(*args)
+            timings[name] = round((time.perf_counter() - stage_start) * 1000, 1)
+            return result
+
+        futures = {
+            "ela": _executor.submit(timed, "ela", self._error_level, luma, gray),
+            "double_compression": _executor.submit(timed, "double_compression", self._double_compression, gray, qtables.get(0)),
+            "grid": _executor.submit(timed, "grid", self._grid_alignment, gray, image_format),
+            "noise": _executor.submit(timed, "noise", self._noise_residual, gray),
+            "copy_move": _executor.submit(timed, "copy_move", self._copy_move, luma),
+        }
+        detectors = {}
+        maps = {}
+        for name, future in futures.items():
+            result = future.result()
+            if isinstance(result, tuple):
+                detectors[name], maps[name] = result
+            else:
+                detectors[name] = result
+
+        rows, cols = self._grid_shape(width, height, orientation)
+        heatmaps = {name: self._to_grid(m, rows, cols, orientation) for name, m in maps.items() if m is not None}
+        combined = np.max(np.stack(list(heatmaps.values())), axis=0) if heatmaps else np.zeros((rows, cols), np.float32)
+        upright = (height, width) if orientation in (5, 6, 7, 8) else (width, height)
+        regions = self._regions(combined, heatmaps, upright)
+
+        # Independent-evidence combination: each detector can only raise the score
+        clean = 1.0
+        for name, detector in detectors.items():
+            clean *= 1.0 - WEIGHTS[name] * detector["score"]
+        score = int(round(100 * (1.0 - clean)))
+        timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+
+        return {
+            "defakeScore": score,
+            "manipulations": self._findings(detectors),
+            "provenance": self._provenance(image_format, detectors["double_compression"], width, height),
+            "recommendation": "HIGH RISK" if score > 60 else ("MODERATE RISK" if score > 30 else "LIKELY AUTHENTIC"),
+            "detectors": detectors,
+            "heatmaps": {
+                "rows": rows,
+                "cols": cols,
+                "combined": np.round(combined, 2).tolist(),
+                **{name: np.round(m, 2).tolist() for name, m in heatmaps.items()},
+            },
+            "regions": regions,
+            "timings_ms": timings,
+        }
+
+    def _error_level(self, luma: Image.Image, gray: np.ndarray) -> Tuple[Dict, np.ndarray]:
+        """
+        Re-save at a fixed quality and compare. Error is normalized by local
+        texture (busy regions always change more), so what stands out is a
+        region that was compressed differently from the rest.
+        """
+        buffer = io.BytesIO()
+        luma.save(buffer, "JPEG", quality=ELA_QUALITY)
+        resaved = np.asarray(Image.open(buffer), dtype=np.float32)
+        error = _block_mean(np.abs(gray - resaved), 16)
+        texture = _block_mean(np.abs(np.diff(gray, axis=1, append=gray[:, -1:])), 16)
+        z = _robust_z(np.log((error + 0.5) / (texture + 2.0)))
+        outliers = float(np.mean(_coherent(z > 4.0)))
+        return {
+            "score": round(float(np.clip(outliers / COHERENT_AREA, 0.0, 1.0)), 3),
+            "finding": f"{outliers:.1%} of the image shows inconsistent error levels",
+        }, np.clip((z - 2.5) / 2.5, 0.0, 1.0)
+
+    def _double_compression(self, gray: np.ndarray, table: Optional[List[int]]) -> Dict:
+        """
+        A JPEG compressed twice with different quality leaves periodic gaps
+        in the histograms of its quantized DCT coefficients; a single
+        compression gives smooth, monotonically decaying histograms.
+        """
+        if table is None:
+            return {"score": 0.0, "finding": "Not a JPEG; quantization checks skipped", "quality": None, "standard_tables": None}
+        table = np.asarray(table, dtype=np.float64).reshape(8, 8)
+        distance = np.abs(_IJG_TABLES - table.ravel()).max(axis=1)
+        quality = int(np.argmin(distance)) + 1
+        standard = bool(distance[quality - 1] <= 1)
+
+        # Only the 3x3 lowest frequencies are needed
+        blocks = _blocks(gray - 128.0, 8).reshape(-1, 8, 8)
+        coefficients = _DCT8[:3] @ blocks @ _DCT8[:3].T
+        valleys = 0
+        checked = 0
+        for u, v in _DQ_COEFFS:
+            values = np.abs(np.rint(coefficients[:, u, v] / table[u, v])).astype(np.int64)
+            histogram = np.bincount(values[(values > 0) & (values <= 24)], minlength=25)[1:].astype(np.float64)
+            inner = histogram[1:-1]
+            neighbors = np.minimum(histogram[:-2], histogram[2:])
+            # Bins with enough support on both sides to be meaningful
+            supported = neighbors >= 20
+            checked += int(supported.sum())
+            valleys += int((supported & (inner < 0.6 * neighbors)).sum())
+        ratio = valleys / checked if checked else 0.0
+        score = float(np.clip((ratio - 0.05) / 0.25, 0.0, 1.0))
+        return {
+            "score": round(score, 3),
+            "finding": f"Estimated JPEG quality {quality}; {valleys} of {checked} coefficient histogram bins show double-quantization gaps",
+            "quality": quality,
+            "standard_tables": standard,
+        }
+
+    def _grid_alignment(self, gray: np.ndarray, image_format: Optional[str]) -> Dict:
+        """
+        Blocking artifacts sit on an 8-pixel grid starting at (0, 0). A
+        strong grid at another phase means the image was cropped or pasted
+        after its last JPEG compression.
+        """
+        if image_format in NON_JPEG_BLOCK_CODECS:
+            return {"score": 0.0, "finding": f"{image_format} uses its own block transform; grid check skipped", "offset": None}
+        offsets = []
+        strength = 0.0
+        for axis in (1, 0):
+            steps = np.abs(np.diff(gray, axis=axis)).mean(axis=1 - axis)
+            phase = steps[:len(steps) // 8 * 8].reshape(-1, 8).mean(axis=0)
+            peak = int(np.argmax(phase))
+            contrast = (phase[peak] - np.median(phase)) / (np.median(phase) + 1e-6)
+            offsets.append((peak + 1) % 8)
+            strength = max(strength, float(contrast))
+        misaligned = strength > 0.1 and any(offsets)
+        score = float(np.clip(strength / 0.3, 0.0, 1.0)) if misaligned else 0.0
+        return {
+            "score": round(score, 3),
+            "finding": f"JPEG grid offset {tuple(offsets)} (strength {strength:.2f})",
+            "offset": offsets,
+        }
+
+    def _noise_residual(self, gray: np.ndarray) -> Tuple[Dict, np.ndarray]:
+        """
+        Per-block sensor noise level (Immerkaer's estimator). Spliced or
+        inpainted regions carry noise unlike the rest of the image.
+        """
+        # The 3x3 kernel is the outer product of [1, -2, 1] with itself
+        horizontal = gray[:, :-2] - 2 * gray[:, 1:-1] + gray[:, 2:]
+        residual = horizontal[:-2] - 2 * horizontal[1:-1] + horizontal[2:]
+        sigma = _block_mean(np.abs(residual), NOISE_BLOCK) * (np.sqrt(np.pi / 2) / 6)
+        if sigma.size < 4:
+            return {"score": 0.0, "finding": "Image too small for noise analysis"}, None
+        z = _robust_z(np.log(sigma + 0.1))
+        outliers = float(np.mean(_coherent(np.abs(z) > 4.0)))
+        return {
+            "score": round(float(np.clip(outliers / COHERENT_AREA, 0.0, 1.0)), 3),
+            "finding": f"{outliers:.1%} of the image has a noise level unlike the rest",
+            "noise_sigma": round(float(np.median(sigma)), 2),
+        }, np.clip((np.abs(z) - 2.5) / 2.5, 0.0, 1.0)
+
+    def _copy_move(self, luma: Image.Image) -> Tuple[Dict, np.ndarray]:
+        """
+        Quantized low-frequency DCT of every 8x8 window, sorted so identical
+        blocks are adjacent. Many matches sharing one shift vector mean a
+        region was cloned elsewhere in the image.
+        """
+        scale = min(1.0, COPY_MOVE_MAX_SIDE / max(luma.size))
+        if scale < 1.0:
+            luma = luma.resize((max(8, int(luma.width * scale)), max(8, int(luma.height * scale))), Image.BILINEAR)
+        g = np.asarray(luma, dtype=np.float32)
+        height, width = g.shape
+        no_match = {"score": 0.0, "finding": "No cloned regions found", "shift": None}
+        if height < 8 or width < 8:
+            return no_match, None
+        # The 2-D DCT is separable, so each coefficient of every sliding
+        # window is an 8-tap filter along x followed by one along y
+        horizontal = {}
+        features = []
+        for u, v in _ZIGZAG:
+            if v not in horizontal:
+                horizontal[v] = sum(_DCT8[v, j] * g[:, j:width - 7 + j] for j in range(8))
+            features.append(sum(_DCT8[u, i] * horizontal[v][i:height - 7 + i] for i in range(8)))
+        features = np.stack(features, axis=-1)
+        grid_h, grid_w = features.shape[:2]
+        features = features.reshape(-1, len(_ZIGZAG))
+        heat = np.zeros((grid_h, grid_w), dtype=np.float32)
+        # Flat blocks (sky, walls) match everywhere; only textured ones count
+        index = np.flatnonzero(np.abs(features[:, 1:]).sum(axis=1) > 4 * COPY_MOVE_STEP)
+        if len(index) < 2:
+            return no_match, heat
+        keys = np.rint(features[index] / COPY_MOVE_STEP).astype(np.int32)
+        order = np.lexsort(keys.T[::-1])
+        sorted_keys = keys[order]
+        same = np.all(sorted_keys[1:] == sorted_keys[:-1], axis=1)
+        first, second = index[order[:-1][same]], index[order[1:][same]]
+        a = np.stack([first // grid_w, first % grid_w], axis=1)
+        b = np.stack([second // grid_w, second % grid_w], axis=1)
+        shift = b - a
+        # One sign per shift so A->B and B->A count together
+        flip = (shift[:, 0] < 0) | ((shift[:, 0] == 0) & (shift[:, 1] < 0))
+        shift[flip] *= -1
+        far = np.hypot(shift[:, 0], shift[:, 1]) >= COPY_MOVE_MIN_SHIFT
+        if not far.any():
+            return no_match, heat
+        shift, a, b = shift[far], a[far], b[far]
+        vectors, inverse, counts = np.unique(shift, axis=0, return_inverse=True, return_counts=True)
+        cloned = counts >= COPY_MOVE_MIN_PAIRS
+        if not cloned.any():
+            return no_match, heat
+        matched = cloned[inverse.ravel()]
+        heat[a[matched, 0], a[matched, 1]] = 1.0
+        heat[b[matched, 0], b[matched, 1]] = 1.0
+        if min(heat.shape) >= 8:
+            # Matches are sparse within a cloned area; mark whole 8x8 cells
+            heat = (_block_mean(heat, 8) > 0.02).astype(np.float32)
+        pairs = int(counts[cloned].sum())
+        dy, dx = (vectors[int(np.argmax(counts))] / scale).tolist()
+        return {
+            "score": round(float(np.clip(pairs / (4 * COPY_MOVE_MIN_PAIRS), 0.0, 1.0)), 3),
+            "finding": f"{pairs} matching blocks cloned with offset ({int(dx)}, {int(dy)}) px",
+            "shift": [int(dx), int(dy)],
+        }, heat
+
+    def _grid_shape(self, width: int, height: int, orientation: int) -> Tuple[int, int]:
+        if orientation in (5, 6, 7, 8):
+            width, height = height, width
+        long_side = max(width, height)
+        return max(1, round(HEATMAP_CELLS * height / long_side)), max(1, round(HEATMAP_CELLS * width / long_side))
+
+    def _to_grid(self, values: np.ndarray, rows: int, cols: int, orientation: int) -> np.ndarray:
+        """Resample a detector map onto the upright heatmap grid."""
+        image = Image.fromarray(values.astype(np.float32), mode="F")
+        if orientation in _ORIENTATION:
+            image = image.transpose(_ORIENTATION[orientation])
+        return np.asarray(image.resize((cols, rows), Image.BOX), dtype=np.float32)
+
+    def _regions(self, combined: np.ndarray, heatmaps: Dict[str, np.ndarray], size: Tuple[int, int], threshold: float = 0.4) -> List[Dict]:
+        """Connected groups of hot cells as pixel boxes, strongest first."""
+        rows, cols = combined.shape
+        cell_w, cell_h = size[0] / cols, size[1] / rows
+        hot = combined >= threshold
+        seen = np.zeros_like(hot)
+        regions = []
+        for r, c in zip(*np.nonzero(hot)):
+            if seen[r, c]:
+                continue
+            stack, cells = [(r, c)], []
+            seen[r, c] = True
+            while stack:
+                y, x = stack.pop()
+                cells.append((y, x))
+                for ny, nx in ((y - 1, x), (y + 1, x), (y, x - 1), (y, x + 1)):
+                    if 0 <= ny < rows and 0 <= nx < cols and hot[ny, nx] and not seen[ny, nx]:
+                        seen[ny, nx] = True
+                        stack.append((ny, nx))
+            ys, xs = zip(*cells)
+            mask = np.zeros_like(hot)
+            mask[ys, xs] = True
+            detector = max(heatmaps, key=lambda name: float(heatmaps[name][mask].mean()))
+            regions.append({
+                "x": int(min(xs) * cell_w),
+                "y": int(min(ys) * cell_h),
+                "width": int(round((max(xs) - min(xs) + 1) * cell_w)),
+                "height": int(round((max(ys) - min(ys) + 1) * cell_h)),
+                "score": round(float(combined[mask].mean()), 2),
+                "detector": detector,
+            })
+        regions.sort(key=lambda region: region["score"] * region["width"] * region["height"], reverse=True)
+        return regions[:10]
+
+    def _findings(self, detectors: Dict[str, Dict]) -> List[str]:
+        labels = {
+            "copy_move": "Cloned (copy-move) regions detected",
+            "double_compression": "Double JPEG compression detected (re-saved, possibly after editing)",
+            "noise": "Inconsistent noise levels across regions",
+            "ela": "Regions with inconsistent compression error levels",
+            "grid": "JPEG block grid misaligned (cropped or composited after compression)",
+        }
+        findings = [f"{labels[name]}: {d['finding']}" for name, d in detectors.items() if d["score"] >= 0.5]
+        return findings or ["No significant manipulation detected", "Compression artifacts analyzed"]
+
+    def _provenance(self, image_format: Optional[str], jpeg: Dict, width: int, height: int) -> str:
+        if image_format != "JPEG":
+            return f"{image_format or 'Unknown'} image, {width}x{height}; no JPEG compression history available."
+        tables = "standard (libjpeg) quantization tables" if jpeg["standard_tables"] else "non-standard quantization tables (camera firmware or custom encoder)"
+        return f"JPEG {width}x{height}, estimated quality {jpeg['quality']} with {tables}."
+
+
+# Global instance
+forensics_engine = ForensicsEngine()
@@ -0,0 +1,135 @@
+"""
+Image Cache Module
+Reuses analyze_image results for uploads that are perceptually the same
+image (re-compressed, resized, re-encoded) as one analyzed before.
+"""
+import os
+import json
+import time
+import array
+import threading
+from typing import Dict, Optional, Tuple
+import numpy as np
+from image_hash import HammingIndex, hamming
+from storage import data_path
+from logs import get_logger
+
+log = get_logger("image_cache")
+
+# Max pHash / dHash Hamming distance (of 64 bits) for two uploads to count as the same image
+IMAGE_CACHE_MAX_DISTANCE = int(os.getenv("IMAGE_CACHE_MAX_DISTANCE", "6"))
+IMAGE_CACHE_MAX_DHASH_DISTANCE = 10
+
+
+def _json_default(value):
+    # HF inference outputs are dict subclasses or dataclasses
+    if hasattr(value, "items"):
+        return dict(value)
+    if hasattr(value, "__dict__"):
+        return vars(value)
+    return str(value)
+
+
+class ImageResultCache:
+    """
+    pHash-indexed store of analysis results.
+
+    Files under DATA_DIR/<path>: results.jsonl (one result per line),
+    offsets.i64 (byte offset of each line) and hashes.u64 (phash, dhash
+    pairs). hashes.u64 is written last, so a row only exists once its
+    result is on disk.
+    """
+
+    def __init__(self, path: Optional[str] = "image_cache", max_distance: int = IMAGE_CACHE_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._index = HammingIndex()
+        self._dhashes = array.array("Q")
+        self._offsets = array.array("q")
+        self._memory_results: Dict[int, Dict] = {}
+        self.directory = None
+        if path:
+            try:
+                self.directory = os.path.dirname(data_path(path, "results.jsonl"))
+                self._load()
+            except Exception as e:
+                log.warning("Image cache persistence unavailable. Using memory only.", error=str(e))
+                self.directory = None
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def lookup(self, phash: int, dhash: int) -> Optional[Tuple[Dict, Dict]]:
+        """Return (stored_result, match_info) for the closest cached image, if any."""
+        for row, distance in self._index.search(phash, self.max_distance):
+            dhash_distance = int(hamming(np.array([self._dhashes[row]], dtype=np.uint64), dhash)[0])
+            if dhash_distance > IMAGE_CACHE_MAX_DHASH_DISTANCE:
+                continue
+            entry = self._read(row)
+            if entry is None:
+                continue
+            return entry["result"], {
+                "hit": True,
+                "phash_distance": distance,
+                "dhash_distance": dhash_distance,
+                "analyzed_at": entry["analyzed_at"],
+            }
+        return None
+
+    def store(self, phash: int, dhash: int, result: Dict):
+        line = json.dumps({"analyzed_at": time.time(), "result": result}, default=_json_default) + "\n"
+        with self._lock:
+            offset = -1
+            if self.directory:
+                try:
+                    with open(os.path.join(self.directory, "results.jsonl"), "ab") as f:
+                        offset = f.tell()
+                        f.write(line.encode("utf-8"))
+                    with open(os.path.join(self.directory, "offsets.i64"), "ab") as f:
+                        f.write(array.array("q", [offset]).tobytes())
+                    with open(os.path.join(self.directory, "hashes.u64"), "ab") as f:
+                        f.write(array.array("Q", [phash, dhash]).tobytes())
+                except OSError as e:
+                    log.warning("Failed to persist image cache entry", error=str(e))
+                    offset = -1
+            # Row data first, index last, so concurrent lookups never see a partial row
+            row = len(self._dhashes)
+            self._dhashes.append(dhash)
+            self._offsets.append(offset)
+            if offset < 0:
+                self._memory_results[row] = json.loads(line)
+            self._index.add(phash)
+
+    def _read(self, row: int) -> Optional[Dict]:
+        if row in self._memory_results:
+            return self._memory_results[row]
+        try:
+            with open(os.path.join(self.directory, "results.jsonl"), "rb") as f:
+                f.seek(self._offsets[row])
+                return json.loads(f.readline())
+        except (OSError, ValueError) as e:
+            log.warning("Failed to read cached image result", error=str(e))
+            return None
+
+    def _load(self):
+        hashes_file = os.path.join(self.directory, "hashes.u64")
+        offsets_file = os.path.join(self.directory, "offsets.i64")
+        if not os.path.exists(hashes_file) or not os.path.exists(offsets_file):
+            return
+        hashes = np.fromfile(hashes_file, dtype=np.uint64)
+        hashes = hashes[:len(hashes) // 2 * 2].reshape(-1, 2)
+        offsets = np.fromfile(offsets_file, dtype=np.int64)
+        count = min(len(hashes), len(offsets))
+        if len(hashes) != count or len(offsets) != count:
+            # Torn final append: realign both files before anything new is written
+            os.truncate(hashes_file, count * 16)
+            os.truncate(offsets_file, count * 8)
+        self._index.extend(hashes[:count, 0])
+        self._dhashes.frombytes(hashes[:count, 1].tobytes())
+        self._offsets.frombytes(offsets[:count].tobytes())
+        if count:
+            log.info("Loaded image cache", images=count)
+
+
+# Global instance
+image_result_cache = ImageResultCache()
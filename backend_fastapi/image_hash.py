@@ -0,0 +1,209 @@
+"""
+Image Hash Module
+Perceptual hashes (pHash, dHash) and a multi-index Hamming search structure.
+"""
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image, ImageOps
+from uploads import image_stream
+
+HASH_BITS = 64
+CHUNKS = 4  # 4 x 16-bit substrings; a match within r differs by <= r // 4 bits in some chunk
+CHUNK_BITS = HASH_BITS // CHUNKS
+MERGE_EVERY = 4096
+DESCRIPTOR_DIM = 128
+
+_PHASH_SIZE = 32
+_k = np.arange(_PHASH_SIZE)
+# Orthonormal DCT-II basis, so the 2-D DCT is two small matrix products
+_DCT = np.sqrt(2.0 / _PHASH_SIZE) * np.cos(np.pi * (2 * _k[None, :] + 1) * _k[:, None] / (2 * _PHASH_SIZE))
+_DCT[0] /= np.sqrt(2.0)
+_CHUNK_MASK = np.uint64((1 << CHUNK_BITS) - 1)
+# Popcount lookup for 16-bit values
+_POPCOUNT16 = np.array([bin(i).count("1") for i in range(1 << 16)], dtype=np.uint8)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.astype(np.uint8)).tobytes(), "big")
+
+
+class ImageSignature:
+    """Perceptual hashes plus a compact global descriptor for one image."""
+
+    def __init__(self, phash: int, dhash: int, descriptor: np.ndarray):
+        self.phash = phash
+        self.dhash = dhash
+        self.descriptor = descriptor
+
+
+def _thumbnail(image_data: bytes, size: int = 64) -> np.ndarray:
+    """Upright RGB thumbnail as float32, decoded at reduced scale where possible."""
+    image = Image.open(image_stream(image_data))
+    image.draft("RGB", (size * 2, size * 2))
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    return np.asarray(image.resize((size, size), Image.BILINEAR), dtype=np.float32)
+
+
+def phash(gray: np.ndarray) -> int:
+    """DCT perceptual hash: signs of the 8x8 lowest frequencies against their median."""
+    pixels = np.asarray(Image.fromarray(gray).resize((_PHASH_SIZE, _PHASH_SIZE), Image.BILINEAR), dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:8, :8].ravel()
+    return _bits_to_int(low > np.median(low[1:]))
+
+
+def dhash(gray: np.ndarray) -> int:
+    """Difference hash: sign of horizontal gradients on a 9x8 thumbnail."""
+    pixels = np.asarray(Image.fromarray(gray).resize((9, 8), Image.BILINEAR), dtype=np.float32)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def global_descriptor(rgb: np.ndarray, gray: np.ndarray) -> np.ndarray:
+    """
+    128-d unit vector: 8x8 zero-mean luminance layout plus a square-rooted
+    4x4x4 RGB histogram. Robust to re-encoding and mild crops or recolors.
+    """
+    size = gray.shape[0]
+    layout = gray.reshape(8, size // 8, 8, size // 8).mean(axis=(1, 3)).ravel()
+    layout -= layout.mean()
+    layout /= np.linalg.norm(layout) or 1.0
+    bins = (rgb // 64).astype(np.int64)
+    histogram = np.bincount((bins[..., 0] * 16 + bins[..., 1] * 4 + bins[..., 2]).ravel(), minlength=64).astype(np.float32)
+    histogram = np.sqrt(histogram / histogram.sum())
+    descriptor = np.concatenate([layout, histogram])
+    return (descriptor / (np.linalg.norm(descriptor) or 1.0)).astype(np.float16)
+
+
+def image_signature(image_data: bytes) -> ImageSignature:
+    """Decode once at thumbnail scale and compute pHash, dHash and descriptor."""
+    rgb = _thumbnail(image_data)
+    gray = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    return ImageSignature(phash(gray), dhash(gray), global_descriptor(rgb, gray))
+
+
+def hamming(a: np.ndarray, b: int) -> np.ndarray:
+    """Vectorized Hamming distance between uint64 array a and one hash b."""
+    x = a ^ np.uint64(b)
+    distance = np.zeros(len(x), dtype=np.uint8)
+    for shift in range(0, HASH_BITS, 16):
+        distance += _POPCOUNT16[((x >> np.uint64(shift)) & np.uint64(0xFFFF)).astype(np.int64)]
+    return distance
+
+
+def _neighbors(value: int, radius: int) -> List[int]:
+    """All CHUNK_BITS-bit values within `radius` (0 or 1) bit flips of value."""
+    values = [value]
+    if radius >= 1:
+        values.extend(value ^ (1 << bit) for bit in range(CHUNK_BITS))
+    return values
+
+
+class HammingIndex:
+    """
+    Multi-index hashing over 64-bit hashes.
+
+    Each hash is split into four 16-bit chunks with one sorted table per
+    chunk. By the pigeonhole principle a hash within distance r of the query
+    matches some chunk within r // 4 bits, so a query probes only those
+    neighborhoods, then verifies candidates with a vectorized popcount.
+    Hashes live in a growable uint64 array (8 bytes per image plus 12 per
+    chunk table entry), which keeps millions of images in a few hundred MB.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hashes = np.empty(1024, dtype=np.uint64)
+        self._count = 0
+        self._table_keys = [np.empty(0, dtype=np.uint16) for _ in range(CHUNKS)]
+        self._table_rows = [np.empty(0, dtype=np.int64) for _ in range(CHUNKS)]
+        self._recent: List[Dict[int, List[int]]] = [{} for _ in range(CHUNKS)]
+        self._recent_count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, value: int) -> int:
+        """Append a hash; returns its row number."""
+        with self._lock:
+            row = self._count
+            if row == len(self._hashes):
+                grown = np.empty(2 * row, dtype=np.uint64)
+                grown[:row] = self._hashes
+                self._hashes = grown
+            self._hashes[row] = np.uint64(value)
+            self._count += 1
+            for chunk in range(CHUNKS):
+                key = (value >> (chunk * CHUNK_BITS)) & ((1 << CHUNK_BITS) - 1)
+                self._recent[chunk].setdefault(key, []).append(row)
+            self._recent_count += 1
+            if self._recent_count >= MERGE_EVERY:
+                self._merge_recent()
+            return row
+
+    def extend(self, values: np.ndarray):
+        """Bulk-load hashes (rows continue from the current count)."""
+        values = np.asarray(values, dtype=np.uint64)
+        with self._lock:
+            self._merge_recent()
+            start = self._count
+            needed = start + len(values)
+            if needed > len(self._hashes):
+                grown = np.empty(max(needed, 2 * len(self._hashes)), dtype=np.uint64)
+                grown[:start] = self._hashes[:start]
+                self._hashes = grown
+            self._hashes[start:needed] = values
+            self._count = needed
+            rows = np.arange(start, needed, dtype=np.int64)
+            for chunk in range(CHUNKS):
+                keys = ((values >> np.uint64(chunk * CHUNK_BITS)) & _CHUNK_MASK).astype(np.uint16)
+                self._merge_chunk(chunk, keys, rows)
+
+    def search(self, value: int, radius: int) -> List[Tuple[int, int]]:
+        """(row, distance) pairs within `radius` bits (at most 7), nearest first."""
+        if radius >= 2 * CHUNKS:
+            raise ValueError(f"HammingIndex supports radius < {2 * CHUNKS}")
+        probe_radius = radius // CHUNKS
+        with self._lock:
+            candidates = set()
+            for chunk in range(CHUNKS):
+                key = (value >> (chunk * CHUNK_BITS)) & ((1 << CHUNK_BITS) - 1)
+                probes = _neighbors(key, probe_radius)
+                for probe in probes:
+                    candidates.update(self._recent[chunk].get(probe, ()))
+                # Probe with the table's dtype so searchsorted doesn't upcast the table
+                probes = np.asarray(probes, dtype=np.uint16)
+                table = self._table_keys[chunk]
+                los = np.searchsorted(table, probes, side="left")
+                his = np.searchsorted(table, probes, side="right")
+                for lo, hi in zip(los.tolist(), his.tolist()):
+                    if hi > lo:
+                        candidates.update(self._table_rows[chunk][lo:hi].tolist())
+            if not candidates:
+                return []
+            rows = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            distance = hamming(self._hashes[rows], value)
+        keep = distance <= radius
+        rows, distance = rows[keep], distance[keep]
+        order = np.lexsort((rows, distance))
+        return [(int(rows[i]), int(distance[i])) for i in order]
+
+    def hash_at(self, row: int) -> int:
+        return int(self._hashes[row])
+
+    def _merge_recent(self):
+        if not self._recent_count:
+            return
+        for chunk in range(CHUNKS):
+            recent = self._recent[chunk]
+            keys = np.fromiter((k for k, rows in recent.items() for _ in rows), dtype=np.uint16)
+            rows = np.fromiter((r for rows in recent.values() for r in rows), dtype=np.int64)
+            self._merge_chunk(chunk, keys, rows)
+            self._recent[chunk] = {}
+        self._recent_count = 0
+
+    def _merge_chunk(self, chunk: int, keys: np.ndarray, rows: np.ndarray):
+        keys = np.concatenate([self._table_keys[chunk], keys])
+        rows = np.concatenate([self._table_rows[chunk], rows])
+        order = np.argsort(keys, kind="stable")
+        self._table_keys[chunk] = keys[order]
+        self._table_rows[chunk] = rows[order]
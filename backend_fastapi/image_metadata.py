@@ -0,0 +1,850 @@
+"""
+Image Metadata Module
+Header-only metadata extraction: EXIF, XMP, IPTC and C2PA (content
+credentials) read straight from the container segments of JPEG, PNG,
+WebP, TIFF and HEIF/AVIF files. Pixel data is skipped, never decoded.
+"""
+import re
+import html
+import math
+import zlib
+import struct
+import time
+from typing import Dict, List, Optional, Tuple
+from uploads import sniff_format
+from logs import get_logger
+
+log = get_logger("image_metadata")
+
+# Longest text value (prompts, captions, PNG text chunks) kept in the result
+MAX_TEXT = 300
+# Cap on inflated zTXt/iTXt chunks
+MAX_INFLATED = 1024 * 1024
+
+# EXIF tags by IFD
+IFD0_TAGS = {
+    0x010E: "description", 0x010F: "make", 0x0110: "model", 0x0112: "orientation",
+    0x0131: "software", 0x0132: "modified", 0x013B: "artist", 0x8298: "copyright",
+    0x0100: "width", 0x0101: "height",
+}
+EXIF_TAGS = {
+    0x9003: "original", 0x9004: "digitized", 0x9011: "offset_original",
+    0x829A: "exposure_time", 0x829D: "f_number", 0x8827: "iso", 0x920A: "focal_length",
+    0xA434: "lens_model", 0x9286: "user_comment", 0x927C: "maker_note",
+    0xA002: "pixel_width", 0xA003: "pixel_height",
+}
+GPS_TAGS = {1: "lat_ref", 2: "lat", 3: "lon_ref", 4: "lon", 5: "alt_ref", 6: "alt", 29: "date"}
+EXIF_IFD, GPS_IFD, XMP_TAG, IPTC_TAG = 0x8769, 0x8825, 0x02BC, 0x83BB
+# Bytes per value for each TIFF field type
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4}
+# Tags reported as text; some writers store them as BYTE/UNDEFINED arrays
+TEXT_TAGS = frozenset((
+    "description", "make", "model", "software", "modified", "artist", "copyright",
+    "original", "digitized", "offset_original", "lens_model", "gps_lat_ref", "gps_lon_ref", "gps_date",
+))
+
+# IPTC-IIM application record (2:xx) datasets
+IPTC_DATASETS = {
+    5: "object_name", 55: "date_created", 60: "time_created", 65: "originating_program",
+    80: "byline", 110: "credit", 115: "source", 116: "copyright", 120: "caption",
+}
+
+XMP_PROPERTIES = {
+    "xmp:CreatorTool": "creator_tool",
+    "xmp:CreateDate": "create_date",
+    "xmp:ModifyDate": "modify_date",
+    "photoshop:DateCreated": "date_created",
+    "Iptc4xmpExt:DigitalSourceType": "digital_source_type",
+    "dc:creator": "creator",
+    "dc:rights": "rights",
+    "photoshop:Credit": "credit",
+    "tiff:Make": "make",
+    "tiff:Model": "model",
+}
+
+# IPTC digital source types (newscodes) and what they declare
+DIGITAL_SOURCE_TYPES = {
+    "trainedAlgorithmicMedia": "ai_generated",
+    "compositeWithTrainedAlgorithmicMedia": "ai_edited",
+    "algorithmicMedia": "algorithmic",
+    "compositeSynthetic": "composite",
+    "digitalCapture": "camera_capture",
+    "negativeFilm": "film_scan",
+    "positiveFilm": "film_scan",
+    "print": "print_scan",
+    "minorHumanEdits": "edited",
+    "composite": "composite",
+}
+_DIGITAL_SOURCE_RE = re.compile(rb"digitalsourcetype/([A-Za-z]+)")
+
+# Tool names AI image generators write into Software/CreatorTool/C2PA/PNG text
+GENERATORS = [
+    ("Midjourney", re.compile(r"midjourney", re.I)),
+    ("DALL-E", re.compile(r"dall[\s\-·]?e", re.I)),
+    ("OpenAI", re.compile(r"openai|chatgpt", re.I)),
+    ("Adobe Firefly", re.compile(r"firefly", re.I)),
+    ("Stable Diffusion", re.compile(r"stable[\s_-]?diffusion|\bsdxl\b|automatic1111|\bsd-webui", re.I)),
+    ("ComfyUI", re.compile(r"comfyui", re.I)),
+    ("InvokeAI", re.compile(r"invokeai", re.I)),
+    ("NovelAI", re.compile(r"novelai", re.I)),
+    ("Fooocus", re.compile(r"fooocus", re.I)),
+    ("Google Imagen", re.compile(r"\bimagen\s?\d|google\s+(?:ai|gemini)|gemini", re.I)),
+    ("Leonardo.Ai", re.compile(r"leonardo\.?ai", re.I)),
+    ("Ideogram", re.compile(r"ideogram", re.I)),
+    ("FLUX", re.compile(r"black\s?forest\s?labs|\bflux\.1\b", re.I)),
+    ("Microsoft Designer", re.compile(r"bing image creator|microsoft designer", re.I)),
+    ("Meta AI", re.compile(r"imagine with meta|\bmeta ai\b", re.I)),
+    ("Craiyon", re.compile(r"craiyon", re.I)),
+    ("DreamStudio", re.compile(r"dreamstudio", re.I)),
+    ("Runway", re.compile(r"runwayml|runway gen", re.I)),
+]
+EDITORS = re.compile(
+    r"photoshop|lightroom|gimp|snapseed|affinity|pixelmator|canva|picsart|facetune|capture one|darktable|paint\.net|pixlr|vsco",
+    re.I,
+)
+# Automatic1111/Forge generation parameters ("Steps: 30, Sampler: ...")
+_SD_PARAMETERS = re.compile(r"\bSteps: \d+, Sampler: ", re.I)
+
+C2PA_BMFF_UUID = bytes.fromhex("d8fec3d61b0e483c92975828877ec481")
+
+
+class _Metadata:
+    """Accumulates what each container segment yields."""
+
+    def __init__(self):
+        self.format = None
+        self.mode = None
+        self.width = None
+        self.height = None
+        self.exif = {}          # flattened IFD0/Exif/GPS values by name
+        self.exif_tags = 0
+        self.xmp: List[bytes] = []
+        self.iptc = {}
+        self.jumbf: List[bytes] = []
+        self.text = {}          # PNG text chunks
+
+    def tiff(self, buf: bytes):
+        try:
+            _parse_tiff(buf, self)
+        except (struct.error, IndexError, ValueError):
+            pass
+
+
+def _clip(text: str) -> str:
+    text = text.strip()
+    return text if len(text) <= MAX_TEXT else text[:MAX_TEXT] + "…"
+
+
+def _decode_text(raw: bytes) -> str:
+    raw = raw.split(b"\x00", 1)[0]
+    try:
+        return raw.decode("utf-8").strip()
+    except UnicodeDecodeError:
+        return raw.decode("latin-1").strip()
+
+
+# --- TIFF / EXIF -----------------------------------------------------------
+
+def _parse_tiff(buf: bytes, meta: _Metadata):
+    if buf[:2] == b"II":
+        order = "<"
+    elif buf[:2] == b"MM":
+        order = ">"
+    else:
+        return
+    if struct.unpack_from(order + "H", buf, 2)[0] != 42:
+        return
+    visited = set()
+
+    def read_ifd(offset: int, wanted: Dict[int, str]) -> Dict[int, object]:
+        if offset in visited or offset + 2 > len(buf):
+            return {}
+        visited.add(offset)
+        count = struct.unpack_from(order + "H", buf, offset)[0]
+        values = {}
+        for i in range(min(count, 512)):
+            entry = offset + 2 + 12 * i
+            if entry + 12 > len(buf):
+                break
+            tag, kind, n = struct.unpack_from(order + "HHI", buf, entry)
+            meta.exif_tags += 1
+            if tag not in wanted and tag not in (EXIF_IFD, GPS_IFD, XMP_TAG, IPTC_TAG):
+                continue
+            if kind not in TYPE_SIZES:
+                continue  # unknown field type: its size (and so its value) can't be read
+            size = TYPE_SIZES[kind] * n
+            start = entry + 8 if size <= 4 else struct.unpack_from(order + "I", buf, entry + 8)[0]
+            if start + size > len(buf):
+                continue
+            raw = bytes(buf[start:start + size])
+            # XMP/IPTC blocks are declared as BYTE, UNDEFINED or LONG arrays
+            values[tag] = bytes(raw) if tag in (XMP_TAG, IPTC_TAG) else _tiff_value(raw, kind, n, order)
+        return values
+
+    ifd0 = read_ifd(struct.unpack_from(order + "I", buf, 4)[0], IFD0_TAGS)
+    sections = [(ifd0, IFD0_TAGS, "")]
+    if isinstance(ifd0.get(EXIF_IFD), int):
+        sections.append((read_ifd(ifd0[EXIF_IFD], EXIF_TAGS), EXIF_TAGS, ""))
+    if isinstance(ifd0.get(GPS_IFD), int):
+        sections.append((read_ifd(ifd0[GPS_IFD], GPS_TAGS), GPS_TAGS, "gps_"))
+    for values, names, prefix in sections:
+        for tag, value in values.items():
+            if tag in names:
+                name = prefix + names[tag]
+                if name in TEXT_TAGS and not isinstance(value, str):
+                    value = _decode_text(value) if isinstance(value, bytes) else None
+                meta.exif.setdefault(name, value)
+    # TIFF files carry XMP and IPTC as IFD0 tags
+    if isinstance(ifd0.get(XMP_TAG), bytes):
+        meta.xmp.append(ifd0[XMP_TAG])
+    if isinstance(ifd0.get(IPTC_TAG), bytes):
+        _parse_iim(ifd0[IPTC_TAG], meta)
+
+
+def _tiff_value(raw: bytes, kind: int, n: int, order: str):
+    if kind == 2:
+        return _decode_text(raw)
+    if kind in (1, 6, 7):
+        return raw
+    if kind in (5, 10):
+        pairs = struct.unpack(order + ("II" if kind == 5 else "ii") * n, raw)
+        values = tuple(pairs[i] / pairs[i + 1] if pairs[i + 1] else None for i in range(0, len(pairs), 2))
+    else:
+        code = {3: "H", 4: "I", 8: "h", 9: "i", 11: "f", 12: "d", 13: "I"}[kind]
+        values = struct.unpack(order + code * n, raw)
+    return values[0] if n == 1 else values
+
+
+def _number(value):
+    """A finite int/float EXIF value (first of an array); None for anything else."""
+    if isinstance(value, tuple):
+        value = value[0] if value else None
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+        return value
+    return None
+
+
+def _user_comment(raw) -> Optional[str]:
+    if not isinstance(raw, bytes) or len(raw) <= 8:
+        return None
+    charset, body = raw[:8], raw[8:]
+    if charset.startswith(b"UNICODE"):
+        # Byte order isn't specified; writers use either
+        text = body.decode("utf-16-be" if body[:1] == b"\x00" else "utf-16-le", "replace")
+    else:
+        text = body.decode("utf-8", "replace")
+    return text.strip("\x00 ").strip() or None
+
+
+# --- XMP / IPTC / JUMBF ------------------------------------------------------
+
+_XMP_PATTERNS = {}
+_RDF_LI = re.compile(rb"<rdf:li(?:\s[^>]*)?>(.*?)</rdf:li>", re.S)
+
+
+def _xmp_values(xmp: bytes, name: str) -> List[str]:
+    """Values of an XMP property in attribute or element form (first rdf:li of lists)."""
+    key = name.encode()
+    if key not in xmp:
+        return []
+    if name not in _XMP_PATTERNS:
+        escaped = re.escape(key)
+        _XMP_PATTERNS[name] = (
+            re.compile(rb"\s" + escaped + rb'="([^"]*)"'),
+            re.compile(rb"<" + escaped + rb"(?:\s[^>]*)?>(.*?)</" + escaped + rb">", re.S),
+        )
+    attribute, element = _XMP_PATTERNS[name]
+    values = attribute.findall(xmp)
+    for content in element.findall(xmp):
+        item = _RDF_LI.search(content)
+        values.append(item.group(1) if item else content)
+    return [html.unescape(v.decode("utf-8", "replace")).strip() for v in values if v.strip()]
+
+
+def _parse_iim(buf: bytes, meta: _Metadata):
+    position = 0
+    while position + 5 <= len(buf) and buf[position] == 0x1C:
+        record, dataset, length = buf[position + 1], buf[position + 2], struct.unpack_from(">H", buf, position + 3)[0]
+        if length & 0x8000:
+            break  # extended datasets are never metadata text
+        value = buf[position + 5:position + 5 + length]
+        if record == 2 and dataset in IPTC_DATASETS:
+            meta.iptc.setdefault(IPTC_DATASETS[dataset], _clip(value.decode("utf-8", "replace")))
+        position += 5 + length
+
+
+def _parse_photoshop(buf: bytes, meta: _Metadata):
+    """Photoshop image resources (JPEG APP13); resource 0x0404 holds IPTC-IIM."""
+    position = 0
+    while position + 12 <= len(buf) and buf[position:position + 4] == b"8BIM":
+        resource = struct.unpack_from(">H", buf, position + 4)[0]
+        name_length = buf[position + 6]
+        position += 6 + ((name_length + 2) & ~1)
+        size = struct.unpack_from(">I", buf, position)[0]
+        data = buf[position + 4:position + 4 + size]
+        if resource == 0x0404:
+            _parse_iim(data, meta)
+        position += 4 + size + (size & 1)
+
+
+def _boxes(buf: bytes, start: int = 0, end: Optional[int] = None):
+    """(type, payload start, payload end) for each ISO BMFF / JUMBF box."""
+    end = len(buf) if end is None else end
+    position = start
+    while position + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", buf, position)
+        header = 8
+        if size == 1:
+            if position + 16 > end:
+                return
+            size = struct.unpack_from(">Q", buf, position + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - position
+        if size < header or position + size > end:
+            return
+        yield kind, position + header, position + size
+        position += size
+
+
+def _jumbf_tree(buf: bytes, start: int, end: int) -> List[Dict]:
+    """Superboxes as {label, children, content}; content keeps the raw non-description boxes."""
+    nodes = []
+    for kind, payload, box_end in _boxes(buf, start, end):
+        if kind != b"jumb":
+            continue
+        node = {"label": None, "children": [], "content": b""}
+        children = list(_boxes(buf, payload, box_end))
+        for child_kind, child_payload, child_end in children:
+            if child_kind == b"jumd":
+                toggles = buf[child_payload + 16] if child_payload + 16 < child_end else 0
+                if toggles & 0x02:
+                    node["label"] = _decode_text(buf[child_payload + 17:child_end])
+            elif child_kind == b"jumb":
+                continue
+            else:
+                node["content"] += buf[child_payload:child_end]
+        node["children"] = _jumbf_tree(buf, payload, box_end)
+        nodes.append(node)
+    return nodes
+
+
+def _cbor_text(buf: bytes, position: int) -> Optional[str]:
+    if position >= len(buf) or buf[position] >> 5 != 3:
+        return None
+    info = buf[position] & 0x1F
+    if info < 24:
+        length, start = info, position + 1
+    elif info == 24:
+        length, start = buf[position + 1], position + 2
+    elif info == 25:
+        length, start = struct.unpack_from(">H", buf, position + 1)[0], position + 3
+    else:
+        return None
+    return buf[start:start + length].decode("utf-8", "replace")
+
+
+def _cbor_key(key: str) -> bytes:
+    encoded = key.encode()
+    return bytes([0x60 + len(encoded)]) + encoded if len(encoded) < 24 else bytes([0x78, len(encoded)]) + encoded
+
+
+def _cbor_value_after(buf: bytes, key: str, start: int = 0, window: Optional[int] = None) -> Optional[str]:
+    """Text value following a short CBOR map key; enough for the claim's fixed fields."""
+    marker = _cbor_key(key)
+    end = len(buf) if window is None else start + window
+    found = buf.find(marker, start, end)
+    return None if found < 0 else _cbor_text(buf, found + len(marker))
+
+
+def _cbor_values_after(buf: bytes, key: str) -> List[str]:
+    """Text values following every occurrence of a CBOR map key."""
+    marker = _cbor_key(key)
+    values = []
+    found = buf.find(marker)
+    while found >= 0:
+        value = _cbor_text(buf, found + len(marker))
+        if value is not None:
+            values.append(value)
+        found = buf.find(marker, found + len(marker))
+    return values
+
+
+def _c2pa(store: bytes) -> Optional[Dict]:
+    """
+    Summary of a C2PA manifest store: active manifest, claim generator,
+    assertions, actions and any declared digital source type. Signatures
+    are not validated here.
+    """
+    roots = [node for node in _jumbf_tree(store, 0, len(store)) if node["label"] == "c2pa"]
+    if not roots or not roots[0]["children"]:
+        return None
+    manifests = roots[0]["children"]
+    active = manifests[-1]
+    result = {"manifest_count": len(manifests), "active_manifest": active["label"], "signature_validated": False}
+    assertions, actions = [], []
+    for node in active["children"]:
+        label = node["label"] or ""
+        if label.startswith("c2pa.claim"):
+            claim = node["content"]
+            generator = _cbor_value_after(claim, "claim_generator")
+            if generator is None:
+                position = claim.find(b"claim_generator_info")
+                if position >= 0:
+                    name = _cbor_value_after(claim, "name", position, 200)
+                    version = _cbor_value_after(claim, "version", position, 300)
+                    generator = f"{name} {version}" if name and version else name
+            result["claim_generator"] = generator
+            result["title"] = _cbor_value_after(claim, "dc:title")
+        elif label == "c2pa.signature":
+            result["signed"] = bool(node["content"])
+        elif label == "c2pa.assertions":
+            for assertion in node["children"]:
+                assertions.append(assertion["label"])
+                if (assertion["label"] or "").startswith("c2pa.actions"):
+                    content = assertion["content"]
+                    actions += _cbor_values_after(content, "action")
+                    for agent in _cbor_values_after(content, "softwareAgent"):
+                        result.setdefault("software_agents", []).append(agent)
+    result["assertions"] = assertions
+    result["actions"] = sorted(set(actions))
+    source = _DIGITAL_SOURCE_RE.search(store)
+    if source:
+        result["digital_source_type"] = source.group(1).decode()
+    return result
+
+
+# --- Containers ------------------------------------------------------------
+
+def _parse_jpeg(buf: bytes, meta: _Metadata):
+    position = 2
+    app11 = {}
+    while position + 4 <= len(buf):
+        if buf[position] != 0xFF:
+            break
+        marker = buf[position + 1]
+        if marker == 0xFF:
+            position += 1  # fill byte
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            position += 2
+            continue
+        length = struct.unpack_from(">H", buf, position + 2)[0]
+        if marker == 0xDA or marker == 0xD9:
+            break  # entropy-coded data follows; all metadata precedes it
+        segment = bytes(buf[position + 4:position + 2 + length])
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC) and len(segment) >= 6:
+            meta.height, meta.width = struct.unpack_from(">HH", segment, 1)
+            meta.mode = {1: "L", 3: "RGB", 4: "CMYK"}.get(segment[5])
+        elif marker == 0xE1 and segment.startswith(b"Exif\x00"):
+            meta.tiff(segment[6:])
+        elif marker == 0xE1 and segment.startswith(b"http://ns.adobe.com/xap/1.0/\x00"):
+            meta.xmp.append(segment[29:])
+        elif marker == 0xED and segment.startswith(b"Photoshop 3.0\x00"):
+            _parse_photoshop(segment[14:], meta)
+        elif marker == 0xEB and segment.startswith(b"JP") and len(segment) >= 16:
+            # JUMBF split over APP11 segments: each repeats the box header after its sequence number
+            instance = segment[2:4]
+            if instance in app11:
+                app11[instance] += segment[16:]
+            else:
+                app11[instance] = bytearray(segment[8:])
+        position += 2 + length
+    meta.jumbf += [bytes(box) for box in app11.values()]
+
+
+def _parse_png(buf: bytes, meta: _Metadata):
+    position = 8
+    while position + 8 <= len(buf):
+        length, kind = struct.unpack_from(">I4s", buf, position)
+        data = buf[position + 8:position + 8 + length]
+        if kind in (b"eXIf", b"caBX", b"tEXt", b"zTXt", b"iTXt"):
+            data = bytes(data)  # copy the metadata chunks only, never IDAT
+        if kind == b"IHDR" and len(data) >= 10:
+            meta.width, meta.height = struct.unpack_from(">II", data)
+            meta.mode = {0: "L", 2: "RGB", 3: "P", 4: "LA", 6: "RGBA"}.get(data[9])
+        elif kind == b"eXIf":
+            meta.tiff(data)
+        elif kind == b"caBX":
+            meta.jumbf.append(data)
+        elif kind in (b"tEXt", b"zTXt", b"iTXt"):
+            _png_text(kind, data, meta)
+        elif kind == b"IEND":
+            break
+        position += 12 + length
+
+
+def _png_text(kind: bytes, data: bytes, meta: _Metadata):
+    keyword, _, rest = data.partition(b"\x00")
+    keyword = keyword.decode("latin-1")
+    try:
+        if kind == b"tEXt":
+            text = rest.decode("latin-1")
+        elif kind == b"zTXt":
+            text = zlib.decompressobj().decompress(rest[1:], MAX_INFLATED).decode("latin-1")
+        else:
+            compressed = rest[:1] == b"\x01"
+            _, _, rest = rest[2:].partition(b"\x00")   # language tag
+            _, _, rest = rest.partition(b"\x00")       # translated keyword
+            if compressed:
+                rest = zlib.decompressobj().decompress(rest, MAX_INFLATED)
+            text = rest.decode("utf-8", "replace")
+    except zlib.error:
+        return
+    if keyword == "XML:com.adobe.xmp":
+        meta.xmp.append(text.encode())
+    elif keyword.startswith("Raw profile type") and ("exif" in keyword or "APP1" in keyword):
+        # ImageMagick: "\nexif\n   <size>\n<hex>"
+        hex_data = "".join(text.split("\n")[3:]).replace(" ", "")
+        try:
+            raw = bytes.fromhex(hex_data)
+            meta.tiff(raw[6:] if raw.startswith(b"Exif") else raw)
+        except ValueError:
+            pass
+    else:
+        meta.text[keyword] = text
+
+
+def _parse_webp(buf: bytes, meta: _Metadata):
+    position = 12
+    while position + 8 <= len(buf):
+        kind, size = struct.unpack_from("<4sI", buf, position)
+        data = buf[position + 8:position + 8 + size]
+        if kind in (b"EXIF", b"XMP ", b"C2PA"):
+            data = bytes(data)
+        if kind == b"VP8X" and len(data) >= 10:
+            meta.width = 1 + int.from_bytes(data[4:7], "little")
+            meta.height = 1 + int.from_bytes(data[7:10], "little")
+        elif kind == b"VP8 " and len(data) >= 10 and meta.width is None:
+            meta.width = struct.unpack_from("<H", data, 6)[0] & 0x3FFF
+            meta.height = struct.unpack_from("<H", data, 8)[0] & 0x3FFF
+        elif kind == b"VP8L" and len(data) >= 5 and meta.width is None:
+            bits = int.from_bytes(data[1:5], "little")
+            meta.width = (bits & 0x3FFF) + 1
+            meta.height = ((bits >> 14) & 0x3FFF) + 1
+        elif kind == b"EXIF":
+            meta.tiff(data[6:] if data.startswith(b"Exif\x00") else data)
+        elif kind == b"XMP ":
+            meta.xmp.append(data)
+        elif kind == b"C2PA":
+            meta.jumbf.append(data)
+        position += 8 + size + (size & 1)
+    meta.mode = "RGB"
+
+
+def _parse_heif(buf: bytes, meta: _Metadata):
+    """ISO BMFF (HEIC/AVIF): Exif and XMP are items located via iinf/iloc; C2PA is a uuid box."""
+    for kind, start, end in _boxes(buf):
+        if kind == b"uuid" and buf[start:start + 16] == C2PA_BMFF_UUID:
+            # version/flags, purpose ("manifest"), then an 8-byte offset before the JUMBF
+            purpose_end = _find(buf, b"\x00", start + 20, end)
+            if purpose_end > 0 and buf[start + 20:purpose_end] == b"manifest":
+                meta.jumbf.append(bytes(buf[purpose_end + 9:end]))
+        if kind != b"meta":
+            continue
+        items, locations = {}, {}
+        for child, child_start, child_end in _boxes(buf, start + 4, end):
+            if child == b"iinf":
+                version = buf[child_start]
+                first = child_start + (6 if version == 0 else 8)
+                for entry, entry_start, entry_end in _boxes(buf, first, child_end):
+                    if entry != b"infe" or buf[entry_start] < 2:
+                        continue
+                    id_size = 2 if buf[entry_start] == 2 else 4
+                    item_id = int.from_bytes(buf[entry_start + 4:entry_start + 4 + id_size], "big")
+                    item_type = bytes(buf[entry_start + 6 + id_size:entry_start + 10 + id_size])
+                    if item_type == b"mime":
+                        name_end = _find(buf, b"\x00", entry_start + 10 + id_size, entry_end)
+                        content_type = bytes(buf[name_end + 1:entry_end]).split(b"\x00")[0]
+                        item_type = b"xmp" if b"rdf+xml" in content_type else item_type
+                    items[item_id] = item_type
+            elif child == b"iloc":
+                locations = _iloc(buf, child_start)
+            elif child == b"iprp":
+                for prop, prop_start, prop_end in _boxes(buf, child_start, child_end):
+                    if prop != b"ipco":
+                        continue
+                    for spatial, spatial_start, _ in _boxes(buf, prop_start, prop_end):
+                        if spatial == b"ispe":
+                            width, height = struct.unpack_from(">II", buf, spatial_start + 4)
+                            if width * height > (meta.width or 0) * (meta.height or 0):
+                                meta.width, meta.height = width, height
+        for item_id, item_type in items.items():
+            # Image items (tiles, thumbnails) are never copied
+            if item_type not in (b"Exif", b"xmp") or item_id not in locations:
+                continue
+            offset, length = locations[item_id]
+            data = bytes(buf[offset:offset + length])
+            if item_type == b"Exif" and len(data) > 4:
+                tiff = data[4 + struct.unpack_from(">I", data)[0]:]
+                meta.tiff(tiff[6:] if tiff.startswith(b"Exif\x00") else tiff)
+            elif item_type == b"xmp":
+                meta.xmp.append(data)
+    meta.mode = "RGB"
+
+
+def _find(buf, sub: bytes, start: int, end: int) -> int:
+    """bytes.find for a memoryview, copying only the searched range."""
+    found = bytes(buf[start:end]).find(sub)
+    return found + start if found >= 0 else -1
+
+
+def _iloc(buf: bytes, start: int) -> Dict[int, Tuple[int, int]]:
+    """First extent (file offset, length) of each item stored in the file itself."""
+    version = buf[start]
+    sizes = buf[start + 4], buf[start + 5]
+    offset_size, length_size = sizes[0] >> 4, sizes[0] & 0x0F
+    base_size, index_size = sizes[1] >> 4, (sizes[1] & 0x0F if version in (1, 2) else 0)
+    position = start + 6
+
+    def read(n):
+        nonlocal position
+        value = int.from_bytes(buf[position:position + n], "big") if n else 0
+        position += n
+        return value
+
+    locations = {}
+    for _ in range(read(2 if version < 2 else 4)):
+        item_id = read(2 if version < 2 else 4)
+        method = read(2) & 0x0F if version in (1, 2) else 0
+        read(2)  # data reference index
+        base = read(base_size)
+        extents = [(read(index_size), read(offset_size), read(length_size)) for _ in range(read(2))]
+        if method == 0 and extents:
+            locations[item_id] = (base + extents[0][1], extents[0][2])
+    return locations
+
+
+def _parse_simple(buf: bytes, meta: _Metadata):
+    if meta.format == "GIF" and len(buf) >= 10:
+        meta.width, meta.height = struct.unpack_from("<HH", buf, 6)
+        meta.mode = "P"
+    elif meta.format == "BMP" and len(buf) >= 26:
+        width, height = struct.unpack_from("<ii", buf, 18)
+        meta.width, meta.height = width, abs(height)
+        meta.mode = "RGB"
+    elif meta.format == "TIFF":
+        meta.tiff(buf)
+        meta.width = meta.exif.get("width") if isinstance(meta.exif.get("width"), int) else None
+        meta.height = meta.exif.get("height") if isinstance(meta.exif.get("height"), int) else None
+
+
+PARSERS = {"JPEG": _parse_jpeg, "PNG": _parse_png, "WEBP": _parse_webp, "AVIF": _parse_heif, "HEIF": _parse_heif}
+
+
+# --- Interpretation ------------------------------------------------------------
+
+def _timestamp(value, offset=None) -> Optional[str]:
+    """EXIF "YYYY:MM:DD HH:MM:SS" as ISO 8601 (other strings pass through)."""
+    if not isinstance(value, str) or not value.strip("0: "):
+        return None
+    match = re.match(r"(\d{4}):(\d{2}):(\d{2})[ T](\d{2}:\d{2}:\d{2})", value)
+    if not match:
+        return value
+    iso = f"{match.group(1)}-{match.group(2)}-{match.group(3)}T{match.group(4)}"
+    return iso + offset if isinstance(offset, str) and re.fullmatch(r"[+-]\d{2}:\d{2}", offset) else iso
+
+
+def _gps(exif: Dict) -> Optional[Dict]:
+    def degrees(value, ref, negative):
+        if not isinstance(value, tuple) or len(value) != 3 or None in value:
+            return None
+        decimal = value[0] + value[1] / 60 + value[2] / 3600
+        return round(-decimal if ref == negative else decimal, 6)
+
+    latitude = degrees(exif.get("gps_lat"), exif.get("gps_lat_ref"), "S")
+    longitude = degrees(exif.get("gps_lon"), exif.get("gps_lon_ref"), "W")
+    if latitude is None or longitude is None:
+        return None
+    gps = {"latitude": latitude, "longitude": longitude}
+    altitude = exif.get("gps_alt")
+    if isinstance(altitude, float):
+        gps["altitude_m"] = round(-altitude if exif.get("gps_alt_ref") in (1, b"\x01") else altitude, 1)
+    if isinstance(exif.get("gps_date"), str):
+        gps["date"] = exif["gps_date"]
+    return gps
+
+
+def _generator(meta: _Metadata, fields: List[Tuple[str, str]], c2pa: Optional[Dict], digital_source: Optional[str]) -> Dict:
+    tools, signals = [], []
+
+    def match(text: str, where: str):
+        for name, pattern in GENERATORS:
+            if pattern.search(text):
+                if name not in tools:
+                    tools.append(name)
+                signals.append(f"{where}: {name}")
+
+    for where, text in fields:
+        match(text, where)
+    prompt = None
+    parameters = meta.text.get("parameters") or meta.exif.get("user_comment_text") or ""
+    if _SD_PARAMETERS.search(parameters):
+        if "Stable Diffusion" not in tools:
+            tools.append("Stable Diffusion")
+        signals.append("generation parameters (Automatic1111 format)")
+        prompt = parameters.split("\n", 1)[0]
+    if "workflow" in meta.text or ("prompt" in meta.text and meta.text["prompt"].lstrip().startswith("{")):
+        if "ComfyUI" not in tools:
+            tools.append("ComfyUI")
+        signals.append("ComfyUI workflow embedded")
+    if "invokeai_metadata" in meta.text or "sd-metadata" in meta.text:
+        if "InvokeAI" not in tools:
+            tools.append("InvokeAI")
+        signals.append("InvokeAI metadata embedded")
+    for key in ("Comment", "Description", "Software", "Author"):
+        if key in meta.text:
+            match(meta.text[key], f"PNG {key}")
+    if digital_source in ("trainedAlgorithmicMedia", "compositeWithTrainedAlgorithmicMedia"):
+        signals.append(f"IPTC digital source type: {digital_source}")
+    if c2pa and c2pa.get("digital_source_type") in ("trainedAlgorithmicMedia", "compositeWithTrainedAlgorithmicMedia"):
+        signals.append("C2PA manifest declares AI generation")
+    result = {"detected": bool(tools or signals), "tools": tools, "signals": signals}
+    if prompt:
+        result["prompt"] = _clip(prompt)
+    return result
+
+
+def parse_metadata(data) -> Dict:
+    """
+    Metadata from the header segments of an image (bytes or memoryview).
+    The buffer is walked in place; only the segments that are parsed get
+    copied, so a memory-mapped upload is never read in full.
+    Keys with nothing to report are omitted; `signals` lists the
+    provenance clues found (camera EXIF, GPS, editing software, AI
+    generator tags, content credentials, stripped metadata).
+    """
+    started = time.perf_counter()
+    buf = memoryview(data).cast("B")
+    meta = _Metadata()
+    meta.format = sniff_format(bytes(buf[:32]))
+    if meta.format is None:
+        raise ValueError("Unrecognized image format")
+    try:
+        PARSERS.get(meta.format, _parse_simple)(buf, meta)
+    except (struct.error, IndexError, ValueError) as e:
+        # Truncated or malformed segments: keep what was read before them
+        log.warning("Metadata parsing stopped early", error=str(e))
+
+    exif = meta.exif
+    result = {
+        "format": meta.format,
+        "mode": meta.mode,
+        "width": meta.width,
+        "height": meta.height,
+        "size": f"{meta.width}x{meta.height}" if meta.width and meta.height else None,
+        "has_exif": bool(meta.exif_tags),
+        "exif_tags_count": meta.exif_tags,
+    }
+    user_comment = _user_comment(exif.get("user_comment"))
+    if user_comment:
+        exif["user_comment_text"] = user_comment
+
+    camera = {key: _clip(exif[key]) for key in ("make", "model", "lens_model") if isinstance(exif.get(key), str) and exif[key].strip()}
+    camera.update({
+        key: _number(exif.get(key))
+        for key in ("exposure_time", "f_number", "iso", "focal_length")
+        if _number(exif.get(key)) is not None
+    })
+    if camera:
+        camera["maker_note"] = "maker_note" in exif
+        result["camera"] = camera
+    orientation = exif.get("orientation")
+    if isinstance(orientation, int) and orientation != 1:
+        result["orientation"] = orientation
+
+    xmp = b"".join(meta.xmp)
+    xmp_values = {}
+    for name, key in XMP_PROPERTIES.items():
+        values = _xmp_values(xmp, name) if xmp else []
+        if values:
+            xmp_values[key] = _clip(values[0])
+    if xmp:
+        agents = []
+        for agent in _xmp_values(xmp, "stEvt:softwareAgent"):
+            if agent not in agents:
+                agents.append(agent)
+        if agents:
+            xmp_values["history_agents"] = agents[:10]
+        result["xmp"] = xmp_values
+    if meta.iptc:
+        result["iptc"] = meta.iptc
+
+    # Tool names that wrote or edited the file, by where they were found
+    software = [(where, value) for where, value in (
+        ("EXIF Software", exif.get("software")),
+        ("XMP CreatorTool", xmp_values.get("creator_tool")),
+        ("IPTC OriginatingProgram", meta.iptc.get("originating_program")),
+    ) if isinstance(value, str) and value]
+    software += [("XMP history", agent) for agent in xmp_values.get("history_agents", [])]
+    if software:
+        result["software"] = software[0][1]
+
+    timestamps = {
+        "original": _timestamp(exif.get("original"), exif.get("offset_original")),
+        "digitized": _timestamp(exif.get("digitized")),
+        "modified": _timestamp(exif.get("modified")),
+        "created_xmp": xmp_values.get("create_date") or xmp_values.get("date_created"),
+        "iptc_date": meta.iptc.get("date_created"),
+    }
+    timestamps = {key: value for key, value in timestamps.items() if value}
+    if timestamps:
+        result["timestamps"] = timestamps
+    gps = _gps(exif)
+    if gps:
+        result["gps"] = gps
+
+    c2pa = None
+    for store in meta.jumbf:
+        try:
+            c2pa = _c2pa(store)
+        except (struct.error, IndexError, ValueError):
+            c2pa = None
+        if c2pa:
+            break
+    if c2pa:
+        if c2pa.get("claim_generator"):
+            software.append(("C2PA claim generator", c2pa["claim_generator"]))
+        software += [("C2PA action agent", agent) for agent in c2pa.get("software_agents", [])]
+        result["c2pa"] = c2pa
+    if meta.text:
+        result["png_text"] = {key: _clip(value) for key, value in meta.text.items()}
+
+    digital_source = None
+    match = _DIGITAL_SOURCE_RE.search(xmp) if xmp else None
+    if match:
+        digital_source = match.group(1).decode()
+    elif c2pa:
+        digital_source = c2pa.get("digital_source_type")
+    if digital_source:
+        result["digital_source_type"] = {"value": digital_source, "meaning": DIGITAL_SOURCE_TYPES.get(digital_source, "other")}
+
+    # Some generators sign their name in free-text fields instead
+    captions = [(where, value) for where, value in (
+        ("EXIF Artist", exif.get("artist")),
+        ("EXIF ImageDescription", exif.get("description")),
+        ("EXIF UserComment", user_comment),
+    ) if isinstance(value, str) and value]
+    generator = _generator(meta, software + captions, c2pa, digital_source)
+    result["generator"] = generator
+
+    signals = []
+    if camera.get("make") or camera.get("model"):
+        signals.append("camera_exif")
+    if camera.get("maker_note"):
+        signals.append("maker_note")
+    if gps:
+        signals.append("gps")
+    if any(EDITORS.search(text) for _, text in software):
+        signals.append("editing_software")
+    if generator["detected"]:
+        signals.append("ai_generator")
+    if c2pa:
+        signals.append("content_credentials")
+    if not (meta.exif_tags or xmp or meta.iptc or c2pa or meta.text):
+        signals.append("no_metadata")
+    result["signals"] = signals
+    if not meta.exif_tags:
+        result["note"] = "No EXIF data found (common in AI-generated images)"
+    result["parse_us"] = round((time.perf_counter() - started) * 1e6, 1)
+    return {key: value for key, value in result.items() if value is not None}
@@ -0,0 +1,236 @@
+"""
+Intent Router Module
+CPU-only classifier for assistant chat: navigation, feature and small-talk
+messages are answered from templates filled with live platform data;
+anything open-ended goes on to the LLM.
+"""
+import os
+import math
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+from claim_cache import claim_terms
+from logs import get_logger
+
+log = get_logger("intent_router")
+
+# Cosine similarity to an intent's nearest example needed to answer locally,
+# and the lead it must have over the runner-up intent
+CHAT_INTENT_THRESHOLD = float(os.getenv("CHAT_INTENT_THRESHOLD", "0.5"))
+CHAT_INTENT_MARGIN = 0.1
+# Longer messages are treated as open-ended questions
+MAX_ROUTED_TERMS = 10
+CLASSIFY_CACHE_SIZE = 4096
+# Rendered answers are reused this long (seconds) before live data is re-read
+TEMPLATE_TTL = 15
+
+INTENTS = {
+    "verify_claim": {
+        "examples": [
+            "how do I verify a claim", "how to fact check something", "check if news is true",
+            "where do I verify a link", "how does verification work", "verify a claim",
+            "can you fact check a claim", "how to check a rumor", "submit a claim",
+        ],
+        "template": "To verify a claim, open Credibility Scoring (/credibility) and paste the text or a link, or upload an image. You'll get a 0-100 credibility score with the evidence behind it.{recent_verdicts}",
+    },
+    "crisis_alerts": {
+        "examples": [
+            "where are crisis alerts", "show crisis alerts", "any emergencies right now",
+            "is there a crisis", "current alerts", "breaking crisis news", "disaster alerts",
+            "where can I see alerts",
+        ],
+        "template": "{alert_status} See the details and recommended actions on Crisis Alerts (/crisis-alerts).",
+    },
+    "media_forensics": {
+        "examples": [
+            "how do I check an image", "is this photo fake", "detect deepfake", "check if image is ai generated",
+            "analyze a photo", "image forensics", "detect manipulated image", "upload an image",
+            "how to spot edited photos", "is this image fake", "check a picture",
+        ],
+        "template": "Open Media Forensics (/media-forensics) and upload the image or paste its URL. It checks for editing (error levels, compression history, copy-move) and AI generation, and shows suspicious regions on a heatmap.",
+    },
+    "agent_monitor": {
+        "examples": [
+            "agent status", "what are the agents doing", "show agent monitor", "how do the agents work",
+            "which agents are running", "system status",
+        ],
+        "template": "The Agent Monitor (/agent-monitor) shows what each agent is doing: ScanAgent collects news, VerifyAgent gathers evidence, ScoreAgent rates credibility and ExplainAgent writes the explanation.{claims_processed}",
+    },
+    "scoring": {
+        "examples": [
+            "how is the score calculated", "what does the credibility score mean", "how do you score claims",
+            "what is source reliability", "what does evidence strength mean", "how accurate is the score",
+        ],
+        "template": "The credibility score (0-100) combines source reliability, evidence strength and consistency across sources. 70+ is generally credible, below 40 is likely false, and in between the evidence is mixed.",
+    },
+    "news_categories": {
+        "examples": [
+            "where is the news", "show latest news", "news categories", "health news", "politics news",
+            "finance news", "browse news",
+        ],
+        "template": "Browse news by topic from the categories on the home page (/category/general-news, /category/politics, /category/health, /category/finance). Every headline can be sent to verification.",
+    },
+    "account": {
+        "examples": [
+            "how do I sign up", "create an account", "log in", "forgot my password", "reset password",
+            "how to login", "sign out", "forgot password", "change my password",
+        ],
+        "template": "Use Sign up (/signup) to create an account or Log in (/login) if you have one. Forgot your password? Reset it at /forgot-password.",
+    },
+    "about": {
+        "examples": [
+            "what is cruxai", "what can you do", "what does this site do", "help", "what is this platform",
+            "who are you", "what features are there",
+        ],
+        "template": "I'm the CruxAI Assistant. CruxAI verifies claims and links with AI agents, flags breaking crises, and checks images for manipulation. Ask me how to use any of these, or about a specific claim.",
+    },
+    "greeting": {
+        "examples": ["hi", "hello", "hey there", "good morning", "hey", "hi there"],
+        "template": "Hi! I can help you verify claims, check crisis alerts, or analyze images. What would you like to do?",
+    },
+    "thanks": {
+        "examples": ["thanks", "thank you", "thanks a lot", "great thank you", "ok thanks", "cheers"],
+        "template": "You're welcome! Anything else you'd like to check?",
+    },
+}
+
+
+def _features(text: str) -> Dict[str, int]:
+    terms = claim_terms(text)
+    features: Dict[str, int] = {}
+    for feature in terms + [f"{a} {b}" for a, b in zip(terms, terms[1:])]:
+        features[feature] = features.get(feature, 0) + 1
+    return features
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split()).strip(" ?!.")
+
+
+class IntentRouter:
+    """
+    Nearest-example classifier over TF-IDF word unigrams and bigrams.
+    Answers only when the best intent is both similar enough and clearly
+    ahead of the next one.
+    """
+
+    def __init__(self, intents: Dict[str, Dict] = INTENTS):
+        self.intents = intents
+        examples = [(name, _features(text)) for name, spec in intents.items() for text in spec["examples"]]
+        document_frequency: Dict[str, int] = {}
+        for _, features in examples:
+            for feature in features:
+                document_frequency[feature] = document_frequency.get(feature, 0) + 1
+        self._idf = {feature: math.log((1 + len(examples)) / (1 + count)) + 1 for feature, count in document_frequency.items()}
+        # Features never seen in the examples can't match anything; they only lengthen the query
+        self._unseen_idf = math.log(1 + len(examples)) + 1
+        self._labels = [name for name, _ in examples]
+        # Inverted index: feature -> [(example, weight)]
+        self._postings: Dict[str, List[Tuple[int, float]]] = {}
+        for index, (_, features) in enumerate(examples):
+            for feature, weight in self._vector(features).items():
+                self._postings.setdefault(feature, []).append((index, weight))
+        self._classified: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()
+        self._rendered: Dict[str, Tuple[float, str]] = {}
+        self.stats = {"messages": 0, "deflected": 0, "forwarded": 0, "by_intent": {}}
+
+    def _vector(self, features: Dict[str, int]) -> Dict[str, float]:
+        vector = {f: count * self._idf.get(f, self._unseen_idf) for f, count in features.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {f: v / norm for f, v in vector.items()}
+
+    def classify(self, message: str) -> Tuple[Optional[str], float]:
+        """(intent, similarity), intent None when the message should go to the LLM."""
+        key = _normalize(message)
+        cached = self._classified.get(key)
+        if cached is not None:
+            self._classified.move_to_end(key)
+            return cached
+        features = _features(key)
+        result: Tuple[Optional[str], float] = (None, 0.0)
+        if features and len(claim_terms(key)) <= MAX_ROUTED_TERMS and "http" not in key:
+            scores: Dict[int, float] = {}
+            for feature, weight in self._vector(features).items():
+                for index, example_weight in self._postings.get(feature, ()):
+                    scores[index] = scores.get(index, 0.0) + weight * example_weight
+            best: Dict[str, float] = {}
+            for index, similarity in scores.items():
+                name = self._labels[index]
+                if similarity > best.get(name, 0.0):
+                    best[name] = similarity
+            ranked = sorted(best.items(), key=lambda item: -item[1])
+            if ranked:
+                name, similarity = ranked[0]
+                runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+                if similarity >= CHAT_INTENT_THRESHOLD and similarity - runner_up >= CHAT_INTENT_MARGIN:
+                    result = (name, round(similarity, 3))
+                else:
+                    result = (None, round(similarity, 3))
+        self._classified[key] = result
+        if len(self._classified) > CLASSIFY_CACHE_SIZE:
+            self._classified.popitem(last=False)
+        return result
+
+    def _render(self, intent: str, context_provider: Optional[Callable[[], Dict]]) -> str:
+        now = time.monotonic()
+        cached = self._rendered.get(intent)
+        if cached and now - cached[0] < TEMPLATE_TTL:
+            return cached[1]
+        context = {}
+        if context_provider:
+            try:
+                context = context_provider() or {}
+            except Exception as e:
+                log.error("Failed to read chat context", error=str(e))
+        alert_count = context.get("alert_count")
+        verdicts = context.get("recent_verdicts") or []
+        values = {
+            "alert_status": (
+                "Live alert status is unavailable right now." if alert_count is None
+                else "No crisis alerts are active right now." if alert_count == 0
+                else f"There {'is' if alert_count == 1 else 'are'} {alert_count} active crisis alert{'' if alert_count == 1 else 's'} right now."
+            ),
+            "recent_verdicts": (
+                " Recently checked: " + "; ".join(f"\"{v['text']}\" ({v['verdict']}, {v['score']}/100)" for v in verdicts[:3]) + "."
+                if verdicts else ""
+            ),
+            "claims_processed": (
+                f" {context['claims_processed']} claims processed so far." if context.get("claims_processed") else ""
+            ),
+        }
+        text = self.intents[intent]["template"].format(**values)
+        self._rendered[intent] = (now, text)
+        return text
+
+    def route(self, message: str, context_provider: Optional[Callable[[], Dict]] = None) -> Optional[Dict]:
+        """
+        Templated answer for a known intent, or None to forward to the LLM.
+        context_provider returns live data for the templates (alert_count,
+        recent_verdicts, claims_processed).
+        """
+        started = time.perf_counter()
+        intent, similarity = self.classify(message)
+        self.stats["messages"] += 1
+        if intent is None:
+            self.stats["forwarded"] += 1
+            return None
+        self.stats["deflected"] += 1
+        self.stats["by_intent"][intent] = self.stats["by_intent"].get(intent, 0) + 1
+        return {
+            "intent": intent,
+            "similarity": similarity,
+            "response": self._render(intent, context_provider),
+            "elapsed_us": round((time.perf_counter() - started) * 1e6, 1),
+        }
+
+    def status(self) -> Dict:
+        messages = self.stats["messages"]
+        return {
+            **self.stats,
+            "by_intent": dict(self.stats["by_intent"]),
+            "deflection_rate": round(self.stats["deflected"] / messages, 3) if messages else 0.0,
+        }
+
+
+# Global instance
+intent_router = IntentRouter()
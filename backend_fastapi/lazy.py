@@ -0,0 +1,95 @@
+"""
+Lazy Module
+Deferred imports and on-first-use construction, so the API process can
+answer its first request without loading ML clients, HTTP stacks or
+on-disk indexes. Every deferred load is timed for /api/ready.
+"""
+import time
+import importlib
+import threading
+from typing import Any, Callable, Dict, List
+from logs import get_logger
+from tracing import span
+
+log = get_logger("lazy")
+
+_lock = threading.RLock()
+_registry: Dict[str, "Lazy"] = {}
+
+
+class Lazy:
+    """
+    Stand-in for a module or object that is loaded on first attribute
+    access or call. Loading is thread-safe and happens once.
+    """
+
+    def __init__(self, name: str, loader: Callable[[], Any]):
+        self._name = name
+        self._loader = loader
+        self._target = None
+        self._loaded = False
+        self._load_ms = None
+        _registry[name] = self
+
+    def resolve(self) -> Any:
+        if not self._loaded:
+            with _lock:
+                if not self._loaded:
+                    started = time.perf_counter()
+                    with span("lazy_load", component=self._name):
+                        self._target = self._loader()
+                    self._load_ms = round((time.perf_counter() - started) * 1000, 1)
+                    self._loaded = True
+                    log.info("Loaded deferred component", component=self._name, load_ms=self._load_ms)
+        return self._target
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def __getattr__(self, attribute: str) -> Any:
+        return getattr(self.resolve(), attribute)
+
+    def __call__(self, *args, **kwargs) -> Any:
+        return self.resolve()(*args, **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.resolve())
+
+    def __repr__(self) -> str:
+        return f"<Lazy {self._name} ({'loaded' if self._loaded else 'not loaded'})>"
+
+
+def lazy_module(name: str) -> Lazy:
+    return Lazy(name, lambda: importlib.import_module(name))
+
+
+def lazy_attribute(module: str, attribute: str) -> Lazy:
+    """A module-level object (global instance, function) imported on first use."""
+    return Lazy(f"{module}.{attribute}", lambda: getattr(importlib.import_module(module), attribute))
+
+
+def lazy_instance(module: str, class_name: str) -> Lazy:
+    """An instance of module.class_name, constructed with no arguments on first use."""
+    return Lazy(f"{module}.{class_name}()", lambda: getattr(importlib.import_module(module), class_name)())
+
+
+def warm(names: List[str] = None) -> Dict[str, Any]:
+    """Load the named (default: all) deferred objects now; failures are reported, not raised."""
+    errors = {}
+    for name, item in list(_registry.items()):
+        if names and name not in names:
+            continue
+        try:
+            item.resolve()
+        except Exception as e:
+            log.exception("Failed to warm component", component=name)
+            errors[name] = str(e)
+    return errors
+
+
+def status() -> Dict[str, Any]:
+    return {
+        "loaded": {name: item._load_ms for name, item in _registry.items() if item.loaded},
+        "pending": [name for name, item in _registry.items() if not item.loaded],
+    }
@@ -0,0 +1,174 @@
+"""
+Logs Module
+Structured logging for the backend. Callers only enqueue records; a
+background listener formats and writes them (stdout, optionally a file),
+so a slow terminal or disk never blocks a request. Every record carries
+the current request id and span, and routine DEBUG/INFO lines can be
+sampled per request.
+"""
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+import zlib
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+from tracing import current_ids
+
+LOG_LEVEL = (os.getenv("LOG_LEVEL") or "INFO").upper()
+# "text" for humans, "json" (one object per line) for log shippers
+LOG_FORMAT = (os.getenv("LOG_FORMAT") or "text").lower()
+# Also write to this file (same format as stdout)
+LOG_FILE = os.getenv("LOG_FILE") or None
+# Fraction of requests whose DEBUG/INFO lines are kept; warnings and errors always are
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE") or "1.0")
+# Records waiting for the writer; beyond this new records are dropped and counted
+LOG_QUEUE_SIZE = 10000
+
+_lock = threading.Lock()
+_listener: Optional[QueueListener] = None
+_handler: Optional["_NonBlockingQueueHandler"] = None
+
+
+class _RequestContextFilter(logging.Filter):
+    """Stamps request/span ids on the caller's thread and applies sampling."""
+
+    def __init__(self, sample_rate: float):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        request_id, span_id = current_ids()
+        record.request_id = request_id
+        record.span_id = span_id
+        if record.levelno >= logging.WARNING or self.sample_rate >= 1.0 or request_id is None:
+            return True
+        # Same decision for every line of a request, so kept requests are complete
+        return zlib.crc32(request_id.encode()) / 0xFFFFFFFF < self.sample_rate
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting happens on the listener thread; the record is only handed over
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+            entry["span_id"] = record.span_id
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s%(context)s %(message)s", "%H:%M:%S")
+
+    def format(self, record: logging.LogRecord) -> str:
+        request_id = getattr(record, "request_id", None)
+        record.context = f" [{request_id[:8]}]" if request_id else ""
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+def configure(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, path: Optional[str] = LOG_FILE,
+              sample_rate: float = LOG_SAMPLE_RATE):
+    """Install the queue handler on the `crux` logger (idempotent; called on first get_logger)."""
+    global _listener, _handler
+    with _lock:
+        if _listener is not None:
+            return
+        formatter = JsonFormatter() if fmt == "json" else TextFormatter()
+        outputs = [logging.StreamHandler(sys.stdout)]
+        if path:
+            outputs.append(logging.FileHandler(path, encoding="utf-8"))
+        for output in outputs:
+            output.setFormatter(formatter)
+        log_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+        _handler = _NonBlockingQueueHandler(log_queue)
+        _handler.addFilter(_RequestContextFilter(sample_rate))
+        root = logging.getLogger("crux")
+        root.setLevel(getattr(logging, level, logging.INFO))
+        root.addHandler(_handler)
+        root.propagate = False
+        _listener = QueueListener(log_queue, *outputs, respect_handler_level=False)
+        _listener.start()
+        atexit.register(flush)
+
+
+def flush():
+    """Stop the writer after draining queued records (shutdown)."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+            logging.getLogger("crux").removeHandler(_handler)
+
+
+def dropped() -> int:
+    return _handler.dropped if _handler else 0
+
+
+class StructuredLogger:
+    """
+    Thin wrapper over a stdlib logger: keyword arguments become structured
+    fields, and disabled levels return before anything is built.
+    """
+
+    def __init__(self, logger: logging.Logger):
+        self._logger = logger
+
+    def _log(self, level: int, message: str, fields: Dict[str, Any], exc_info=False):
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, message, extra={"fields": fields}, exc_info=exc_info, stacklevel=3)
+
+    def debug(self, message: str, **fields):
+        self._log(logging.DEBUG, message, fields)
+
+    def info(self, message: str, **fields):
+        self._log(logging.INFO, message, fields)
+
+    def warning(self, message: str, **fields):
+        self._log(logging.WARNING, message, fields)
+
+    def error(self, message: str, **fields):
+        self._log(logging.ERROR, message, fields)
+
+    def exception(self, message: str, **fields):
+        self._log(logging.ERROR, message, fields, exc_info=True)
+
+    def enabled(self, level: int) -> bool:
+        return self._logger.isEnabledFor(level)
+
+
+def get_logger(name: str) -> StructuredLogger:
+    configure()
+    return StructuredLogger(logging.getLogger(f"crux.{name}"))
@@ -1,17 +1,59 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, UploadFile, File, Form
+import time
+STARTED = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, BackgroundTasks, UploadFile, File, Form, Depends, Header, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic_core import to_json
+from starlette.concurrency import run_in_threadpool
 from typing import Optional, List
+import os
 import uuid
+import threading
 from datetime import datetime
 from models import (
     Claim, Evidence, ScoreResponse, ExplainResponse, 
-    CrisisResponse, ScanRequest, ScoreRequest, ExplainRequest
+    CrisisResponse, ScanRequest, ScoreRequest, ExplainRequest, ChatRequest, DomainRatingRequest
 )
-from agents import ScanAgent, VerifyAgent, ScoreAgent, ExplainAgent, CrisisAgent
-from image_analyzer import image_analyzer
+from deadline import Deadline
+from uploads import BATCH_MAX_TOTAL_BYTES, UploadLimitMiddleware, UploadRejected, receive_upload
+import lazy
+from lazy import lazy_attribute, lazy_instance, lazy_module
+from telemetry import telemetry
+from tracing import TracingMiddleware, span
+import tracing
+from logs import get_logger
+import logs
+from admin import require_admin
+from admission import AdmissionMiddleware, admission, scan_guard
+from compression import CompressionMiddleware
+from serialization import JSONBytes
+from events import event_bus, parse_topics
+import profiling
+from profiling import ProfilingMiddleware, memory_profiler, profiler, request_profile
+
+# Heavy modules (Groq, Hugging Face, DuckDuckGo, PIL/NumPy, on-disk indexes)
+# load on first use so cold starts only pay for FastAPI
+image_analyzer = lazy_attribute("image_analyzer", "image_analyzer")
+news_cache = lazy_attribute("news_cache", "news_cache")
+claim_cache = lazy_attribute("claim_cache", "claim_cache")
+reverse_image_index = lazy_attribute("reverse_search", "reverse_image_index")
+download_image = lazy_attribute("reverse_search", "download_image")
+forensics_engine = lazy_attribute("forensics", "forensics_engine")
+batch_analyzer = lazy_attribute("batch", "batch_analyzer")
+domain_registry = lazy_attribute("reputation", "domain_registry")
+chat_module = lazy_module("chat")
+
+# Load everything right after startup instead of on the first requests
+WARM_ON_STARTUP = os.getenv("WARM_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+
+log = get_logger("api")
 
 app = FastAPI(title="Crux-AI Backend")
 
+# Per-client rate limits, concurrency caps and load shedding for the endpoints
+# that call paid upstreams (inside CORS, so 429/503 responses carry its headers)
+app.add_middleware(AdmissionMiddleware)
 # CORS Setup
 app.add_middleware(
     CORSMiddleware,
@@ -20,30 +62,62 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Refuse oversized multipart bodies before they are parsed and spooled
+app.add_middleware(UploadLimitMiddleware, path_limits={"/api/images/batch": BATCH_MAX_TOTAL_BYTES})
+# Per-request stack samples for admin requests sent with X-Debug-Profile
+app.add_middleware(ProfilingMiddleware)
+# gzip/brotli for large JSON bodies (claim lists, news, crisis reports)
+app.add_middleware(CompressionMiddleware)
+# Request id + root span for every request (outermost, so it times everything)
+app.add_middleware(TracingMiddleware)
 
-# Initialize Agents
-scan_agent = ScanAgent()
-verify_agent = VerifyAgent()
-score_agent = ScoreAgent()
-explain_agent = ExplainAgent()
-crisis_agent = CrisisAgent()
+# Initialize Agents (constructed on first use)
+scan_agent = lazy_instance("agents", "ScanAgent")
+verify_agent = lazy_instance("agents", "VerifyAgent")
+score_agent = lazy_instance("agents", "ScoreAgent")
+explain_agent = lazy_instance("agents", "ExplainAgent")
+crisis_agent = lazy_instance("agents", "CrisisAgent")
 
 # In-memory storage for demo purposes
 processed_claims: List[Claim] = []
 
+STARTUP_MS = round((time.perf_counter() - STARTED) * 1000, 1)
+
 @app.get("/")
 def health_check():
     return {"status": "CruxAI System Online"}
 
+@app.get("/api/ready")
+def readiness(warm: bool = False):
+    """
+    Which deferred modules, agents and clients are loaded (with load times).
+    `warm=true` loads the rest first, so the next requests don't pay for it.
+    """
+    errors = lazy.warm() if warm else {}
+    state = lazy.status()
+    return {
+        "ready": not state["pending"] and not errors,
+        "startup_ms": STARTUP_MS,
+        **state,
+        "errors": errors,
+    }
+
+@app.on_event("startup")
+def warm_on_startup():
+    if WARM_ON_STARTUP:
+        threading.Thread(target=lazy.warm, name="warm-up", daemon=True).start()
+
 @app.get("/api/claims", response_model=List[Claim])
 def get_claims():
-    return processed_claims
+    # Encoded by pydantic-core in one pass, skipping response_model re-validation
+    return JSONBytes(to_json(processed_claims))
 
 @app.post("/api/verify")
 async def verify_claim(
     text: str = Form(None),
     link: str = Form(None),
-    image: UploadFile = File(None)
+    image: UploadFile = File(None),
+    budget: float = Form(None)
 ):
     # Handle cases where only link or image is provided
     claim_text = text or ""
@@ -52,65 +126,124 @@ async def verify_claim(
     """
     Verify a claim (text, link, or image).
     Now supports AI-generated image detection!
+    `budget` (seconds) bounds the whole request; stages that ran out of
+    time are listed in deadline.cut_short.
     """
+    deadline = Deadline.from_request(budget)
     result = {
         "claim": None,
         "score": None,
-        "image_analysis": None
+        "image_analysis": None,
+        "cache_match": None,
+        "deadline": None
     }
     
-    # Handle text/link verification (existing functionality)
-    if text or link:
-        claim_text = text if text else f"Claim from: {link}"
-        
-        # Create a new claim object
-        claim = Claim(
-            id=str(uuid.uuid4()),
-            text=claim_text,
-            status="processing"
-        )
-
-        # Verify using existing agents
-        claim = verify_agent.verify(claim, link=link) # Assuming verify_agent.verify can take a Claim object and link
-        score = score_agent.score(claim)
-        
-        # Set status based on score
-        if score.verdict == "VERIFIED": # Assuming score object has a verdict
-            claim.status = "verified"
-        elif score.verdict == "FALSE": # Assuming score object has a verdict
-            claim.status = "false"
-        else:
-            claim.status = "unverified"
-        
-        processed_claims.append(claim)
-        
-        result["claim"] = claim
-        result["score"] = score
-    
-    # Handle image analysis (NEW functionality)
+    # Receive the upload before any paid work: an oversized or non-image file is
+    # rejected up front instead of after the text claim was searched, scored and stored
+    upload = None
     if image:
         try:
-            print(f"Received image: {image.filename}")
-            
-            # Read image data
-            image_data = await image.read()
-            print(f"Image size: {len(image_data)} bytes")
-            
-            # Analyze image
-            analysis = image_analyzer.analyze_image(image_data)
-            
-            result["image_analysis"] = analysis
-            print("Image analysis complete!")
-            
+            # Stream the spooled upload once (size limit, hash, format sniff);
+            # large files are memory-mapped rather than read onto the heap
+            with span("receive_upload"):
+                upload = await run_in_threadpool(receive_upload, image)
+            log.info("Received image", filename=image.filename, bytes=upload.size, format=upload.format)
+        except UploadRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
         except Exception as e:
-            print(f"ERROR analyzing image: {e}")
+            log.exception("Failed to receive image")
             result["image_analysis"] = {
                 "error": str(e),
                 "message": "Failed to analyze image"
             }
+
+    try:
+        # Handle text/link verification (existing functionality)
+        if text or link:
+            claim_text = text if text else f"Claim from: {link}"
+        
+            # Create a new claim object
+            claim = Claim(
+                id=str(uuid.uuid4()),
+                text=claim_text,
+                status="processing"
+            )
+
+            # Reuse the verdict of a previously verified paraphrase of this claim.
+            # Link submissions always go through the agents: the linked page is the evidence.
+            with span("claim_cache.lookup"):
+                cached = await run_in_threadpool(claim_cache.lookup, claim_text) if not link else None
+            if not link:
+                # A reused verdict skips both evidence gathering and the scoring call
+                telemetry.cache("ScoreAgent", hit=bool(cached))
+            if cached:
+                entry, match = cached
+                log.info("Reusing verdict of canonical claim", canonical_claim_id=match.canonical_claim_id, similarity=match.similarity)
+                claim.evidence = list(entry.evidence)
+                claim.canonical_claim_id = match.canonical_claim_id
+                score = entry.score
+                result["cache_match"] = match
+            else:
+                # Verify using existing agents (blocking network calls: keep them off the event loop)
+                claim = await run_in_threadpool(verify_agent.verify, claim, link=link, deadline=deadline)
+                score = await run_in_threadpool(score_agent.score, claim, deadline=deadline)
+                # Only cache complete model verdicts, not the all-zero fallback
+                if not link and not deadline.cut_short and any([score.final_score, score.source_reliability, score.evidence_strength, score.consistency]):
+                    await run_in_threadpool(claim_cache.store, claim, score)
+        
+            # Set status based on score
+            if score.verdict == "VERIFIED": # Assuming score object has a verdict
+                claim.status = "verified"
+            elif score.verdict == "FALSE": # Assuming score object has a verdict
+                claim.status = "false"
+            else:
+                claim.status = "unverified"
+            # Kept on the claim so the claims feed and chat context show the verdict
+            claim.score = score
+        
+            processed_claims.append(claim)
+            event_bus.publish("verdicts", "claim.verified", {"claim": claim, "score": score, "cache_match": result["cache_match"]})
+            event_bus.publish_alerts(crisis_agent.detect_crisis([claim]).alerts)
+        
+            result["claim"] = claim
+            result["score"] = score
     
+        # Handle image analysis (NEW functionality)
+        if upload:
+            try:
+                analysis = await run_in_threadpool(
+                    image_analyzer.analyze_image,
+                    upload.data,
+                    deadline=deadline,
+                    source_url=link,
+                    claim_ids=[result["claim"].id] if result["claim"] else None
+                )
+                analysis["upload"] = upload.summary()
+                
+                result["image_analysis"] = analysis
+                
+            except Exception as e:
+                log.exception("Image analysis failed")
+                result["image_analysis"] = {
+                    "error": str(e),
+                    "message": "Failed to analyze image"
+                }
+    finally:
+        if upload:
+            upload.close()
+    
+    result["deadline"] = deadline.summary()
     return result
 
+@app.get("/api/claims/cache/audit")
+def get_claim_cache_audit():
+    """Recent verdict reuses: which canonical claim answered which query"""
+    return {
+        "entries": len(claim_cache),
+        "threshold": claim_cache.threshold,
+        "matches": claim_cache.audit_log()
+    }
+
 @app.post("/api/score", response_model=ScoreResponse)
 def score_claim(request: ScoreRequest):
     # Construct a temporary claim object for scoring
@@ -120,6 +253,14 @@ def score_claim(request: ScoreRequest):
     )
     return score_agent.score(claim)
 
+@app.get("/api/reputation/{domain}")
+def get_domain_reputation(domain: str):
+    """Reliability score and category the scorer uses for a domain (or URL host)"""
+    rating = domain_registry.lookup(domain)
+    if rating is None:
+        raise HTTPException(status_code=404, detail=f"{domain} is not in the reputation registry")
+    return rating.to_dict()
+
 @app.post("/api/explain", response_model=ExplainResponse)
 def explain_verdict(request: ExplainRequest):
     explanation = explain_agent.explain(request.claim_text, request.verdict, request.lang)
@@ -130,187 +271,325 @@ def check_crisis():
     claims_to_check = processed_claims
     # If no claims have been processed locally, fetch fresh news to check for crises
     if not claims_to_check:
-        print("No local claims found. Scanning for breaking news...")
+        log.info("No local claims found. Scanning for breaking news")
         claims_to_check = scan_agent.scan()
         
-    return crisis_agent.detect_crisis(claims_to_check)
+    report = crisis_agent.detect_crisis(claims_to_check)
+    event_bus.publish_alerts(report.alerts)
+    return JSONBytes(report)
+
+@app.get("/api/events")
+async def event_stream(topics: str = None, since: int = None, last_event_id: Optional[str] = Header(None)):
+    """
+    Server-sent events: new and updated claims (claims), verification
+    results (verdicts) and crisis alerts (crisis). `topics` filters
+    (comma-separated); `since` (or Last-Event-ID on reconnect) replays
+    events after that offset.
+    """
+    try:
+        topic_set = parse_topics(topics)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if since is None and last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    subscriber = event_bus.subscribe(topic_set, since)
+    return StreamingResponse(
+        event_bus.sse(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.websocket("/api/events/ws")
+async def event_socket(websocket: WebSocket, topics: str = None, since: int = None):
+    """The /api/events feed as JSON text frames"""
+    try:
+        topic_set = parse_topics(topics)
+    except ValueError:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    await event_bus.websocket(websocket, event_bus.subscribe(topic_set, since))
 
 def background_scan(source_url: str):
-    new_claims = scan_agent.scan(source_url)
+    new_claims = scan_agent.ingest(source_url)
+    claims_by_id = {c.id: c for c in processed_claims}
     for claim in new_claims:
-        claim.id = str(uuid.uuid4())
+        existing = claims_by_id.get(claim.id)
+        if existing:
+            # Near-duplicate of a stored claim: attach as extra evidence
+            known_urls = {e.url for e in existing.evidence}
+            added = [e for e in claim.evidence if e.url not in known_urls]
+            if added:
+                existing.evidence.extend(added)
+                event_bus.publish("claims", "claim.updated", existing)
+            continue
+        if not claim.id:
+            claim.id = str(uuid.uuid4())
         # Optional: Auto-verify scanned claims?
         # For now, just add them
         processed_claims.append(claim)
+        claims_by_id[claim.id] = claim
+        event_bus.publish("claims", "claim.ingested", claim)
+    event_bus.publish_alerts(crisis_agent.detect_crisis(new_claims).alerts)
+    
+    # Index article images so uploads can be traced back to earlier coverage
+    for claim in new_claims:
+        for evidence in claim.evidence:
+            if evidence.image_url:
+                reverse_image_index.ingest_remote(
+                    evidence.image_url,
+                    source_url=evidence.url,
+                    claim_ids=[claim.id],
+                    title=claim.text,
+                    seen_at=evidence.published_at.timestamp() if evidence.published_at else None
+                )
+
+def guarded_scan(source_url: str):
+    try:
+        background_scan(source_url)
+    finally:
+        scan_guard.release(source_url)
 
 @app.post("/api/scan")
 def trigger_scan(request: ScanRequest, background_tasks: BackgroundTasks):
-    background_tasks.add_task(background_scan, request.source_url)
+    # One scan per source at a time
+    if not scan_guard.acquire(request.source_url):
+        raise HTTPException(status_code=409, detail=f"A scan of {request.source_url} is already in progress")
+    background_tasks.add_task(guarded_scan, request.source_url)
     return {"message": f"Scan initiated for {request.source_url}"}
 
 @app.get("/api/news/{category}")
 def get_news_by_category(category: str):
-    """Fetch news by category"""
+    """Fetch news by category (stale-while-revalidate cached)"""
+    if category not in scan_agent.category_mapping:
+        raise HTTPException(status_code=404, detail=f"Unknown category: {category}")
     try:
-        claims = scan_agent.scan_by_category(category)
-        return {
-            "category": category,
-            "count": len(claims),
-            "articles": claims
-        }
+        claims, age, cache_state = news_cache.get(
+            category,
+            fetch=scan_agent.fetch_by_category,
+            fallback=scan_agent._get_mock_news_by_category,
+        )
+        telemetry.cache("ScanAgent", hit=cache_state in ("HIT", "STALE"))
+        # Cached snapshots are the same claim objects on every hit, so their JSON is reused
+        body = b'{"category":%s,"count":%d,"articles":%s}' % (to_json(category), len(claims), to_json(claims))
+        return JSONBytes(body, headers={"Age": str(age), "X-Cache": cache_state})
     except Exception as e:
-        print(f"Error fetching news for category {category}: {e}")
+        log.exception("Failed to fetch news", category=category)
         raise HTTPException(status_code=500, detail=str(e))
 
+# Agents shown on the Agent Monitor, in pipeline order
+MONITORED_AGENTS = ["ScanAgent", "VerifyAgent", "ScoreAgent", "ExplainAgent", "CrisisAgent", "ImageAgent", "ChatAgent"]
+
 @app.get("/api/agents")
-def get_agents_status():
-    try:
-        # Calculate stats based on processed_claims
-        total_processed = len(processed_claims)
-        
-        return {
-            "agents": [
-                {
-                    "name": "ScanAgent",
-                    "status": "active",
-                    "processed": total_processed * 2 + 120, # Mock logic for demo
-                    "active": 1,
-                    "description": "Monitors social media and news sources for emerging claims",
-                    "progress": 95,
-                },
-                {
-                    "name": "VerifyAgent",
-                    "status": "active",
-                    "processed": total_processed,
-                    "active": 0,
-                    "description": "Cross-references claims with trusted fact-checking sources",
-                    "progress": 100,
-                },
-                {
-                    "name": "ScoreAgent",
-                    "status": "active",
-                    "processed": total_processed,
-                    "active": 0,
-                    "description": "Calculates credibility scores based on evidence strength",
-                    "progress": 100,
-                },
-                {
-                    "name": "ExplainAgent",
-                    "status": "idle",
-                    "processed": total_processed // 2,
-                    "active": 0,
-                    "description": "Generates human-readable explanations and translations",
-                    "progress": 0,
-                },
-            ],
-            "activity_logs": [
-                {"time": "Just now", "agent": "System", "action": "System health check passed", "status": "success"},
-                {"time": "1 min ago", "agent": "ScanAgent", "action": "Scanned for crisis events", "status": "success"},
-            ]
-        }
-    except Exception as e:
-        print(f"Error in get_agents_status: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+def get_agents_status(logs: int = 20):
+    """
+    Live per-agent telemetry (calls, in-flight, errors, latency percentiles,
+    cache hit rate, token usage) and the most recent activity events.
+    """
+    return {
+        "agents": [telemetry.agent_status(name) for name in MONITORED_AGENTS],
+        "activity_logs": telemetry.recent_activity(max(1, min(logs, 200))),
+        "claims_processed": len(processed_claims),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus scrape endpoint"""
+    gauges = {
+        "crux_processed_claims": len(processed_claims),
+        "crux_components_loaded": len(lazy.status()["loaded"]),
+    }
+    if chat_module.loaded:
+        gauges["crux_chat_sessions"] = len(chat_module.chat_service.sessions)
+    gauges["crux_scans_in_progress"] = len(scan_guard)
+    events = event_bus.status()
+    gauges["crux_event_subscribers"] = events["subscribers"]
+    gauges["crux_events_published"] = events["published"]
+    gauges["crux_event_subscribers_dropped"] = events["dropped_subscribers"]
+    return PlainTextResponse(telemetry.prometheus(gauges) + admission.prometheus(), media_type="text/plain; version=0.0.4")
 
 @app.post("/api/forensics")
 def analyze_media(
     url: str = Form(None),
     file: UploadFile = File(None)
 ):
-    # Mock forensic analysis
-    import random
-    score = random.randint(10, 90)
-    
+    """
+    Forensic analysis of an uploaded image (or one fetched from `url`):
+    ELA, JPEG compression history, noise consistency and copy-move, with
+    per-detector heatmaps and suspicious regions.
+    """
+    upload = None
+    try:
+        if file is not None:
+            upload = receive_upload(file)
+            image_data = upload.data
+        elif url:
+            image_data = download_image(url)
+            if image_data is None:
+                raise HTTPException(status_code=400, detail="Could not download media from URL")
+        else:
+            raise HTTPException(status_code=400, detail="Provide a file or a URL")
+        
+        return forensics_engine.analyze(image_data)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except ValueError as e:
+        log.error("Forensic analysis rejected the image", error=str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        if upload:
+            upload.close()
+
+@app.post("/api/images/batch")
+async def analyze_image_batch(
+    files: List[UploadFile] = File(...),
+    link: str = Form(None),
+    budget: float = Form(None)
+):
+    """
+    Analyze several images from one story: multiple files and/or zip/tar
+    archives. Streams NDJSON, one line per image as it finishes (in
+    completion order, with its `index`), then a `done` summary line.
+    `budget` (seconds) applies to each image; `link` is recorded as the
+    images' source in the reverse image index.
+    """
+    try:
+        items = await run_in_threadpool(batch_analyzer.collect, files)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return StreamingResponse(batch_analyzer.stream(items, budget, link), media_type="application/x-ndjson")
+
+@app.on_event("shutdown")
+def shutdown_batch_pool():
+    if batch_analyzer.loaded:
+        batch_analyzer.shutdown()
+
+@app.on_event("shutdown")
+def flush_logs_and_traces():
+    tracing.exporter.flush()
+    logs.flush()
+
+def chat_context() -> dict:
+    """Live data for templated chat answers; local state only, no network."""
+    scored = [c for c in processed_claims if c.score is not None][-3:]
     return {
-        "defakeScore": score,
-        "manipulations": [
-            "Potential face manipulation detected" if score > 50 else "No significant manipulation detected",
-            "Compression artifacts analyzed"
+        "alert_count": len(crisis_agent.detect_crisis(processed_claims).alerts),
+        "claims_processed": len(processed_claims),
+        "recent_verdicts": [
+            {"text": c.text[:80], "verdict": c.score.verdict, "score": c.score.final_score}
+            for c in reversed(scored)
         ],
-        "provenance": "Source origin analysis completed.",
-        "recommendation": "HIGH RISK" if score > 60 else ("MODERATE RISK" if score > 30 else "LIKELY AUTHENTIC")
     }
 
 @app.post("/api/chat")
-async def chat(request: dict):
+async def chat(request: ChatRequest):
     """
-    Chat endpoint using Hugging Face LLM for AI assistance (FREE!).
+    Assistant chat backed by Groq. Conversations are kept server-side:
+    send back the returned `session_id`; `history` is only used to seed a
+    new session. One reply per session at a time (429 while one is pending).
     """
     try:
-        user_message = request.get("message", "")
-        chat_history = request.get("history", [])
-        
-        if not user_message:
-            raise HTTPException(status_code=400, detail="Message is required")
-        
-        # Use Hugging Face API for real LLM response
-        from huggingface_hub import InferenceClient
-        import os
-        
-        hf_api_key = os.getenv("HUGGINGFACE_API_KEY")
-        if not hf_api_key:
-            return {
-                "response": "I'm here to help! I can assist you with verifying claims, checking crisis alerts, or navigating the platform. How can I help you today?"
-            }
-        
-        client = InferenceClient(token=hf_api_key)
-        
-        # Build messages for chat
-        messages = [
-            {
-                "role": "system",
-                "content": "You are CruxAI Assistant, a helpful AI for a fact-checking platform. Be concise (2-3 sentences max). Help users verify claims and navigate features."
-            }
-        ]
-        
-        # Add last 3 messages for context
-        for msg in chat_history[-3:]:
-            messages.append({
-                "role": msg.get("role", "user"),
-                "content": msg.get("content", "")
-            })
-        
-        # Add current message
-        messages.append({
-            "role": "user",
-            "content": user_message
-        })
-        
-        # Use Groq API (same as credibility scoring - we know it works!)
-        from groq import Groq
-        
-        groq_api_key = os.getenv("GROQ_API_KEY")
-        if not groq_api_key:
-            return {
-                "response": "I'm here to help! I can assist you with verifying claims, checking crisis alerts, or navigating the platform."
-            }
-        
-        client = Groq(api_key=groq_api_key)
-        
-        # Use Groq's chat completion
-        completion = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",  # Fast and capable
-            messages=messages,
-            temperature=0.7,
-            max_tokens=150,
-            top_p=1,
-            stream=False
+        return await chat_module.chat_service.reply(
+            request.message,
+            session_id=request.session_id,
+            history=request.history,
+            context=chat_context,
         )
-        
-        response_text = completion.choices[0].message.content.strip()
-        
-        return {
-            "response": response_text
-        }
-        
-    except Exception as e:
-        print(f"ERROR in chat endpoint: {e}")
-        import traceback
-        traceback.print_exc()
-        # Fallback response on error
-        return {
-            "response": "I'm here to help! You can ask me about crisis alerts, agent status, or to verify claims. What would you like to know?"
-        }
+    except chat_module.ChatRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@app.get("/api/chat/status")
+def get_chat_status():
+    return chat_module.chat_service.status()
+
+# Admin-only profiling (requires ADMIN_TOKEN; send it as X-Admin-Token)
+
+def collapsed_response(sampler) -> PlainTextResponse:
+    """Collapsed stacks for flamegraph.pl / speedscope, with the session summary in headers."""
+    summary = sampler.summary()
+    return PlainTextResponse(sampler.collapsed(), headers={
+        "X-Profile-Samples": str(summary["samples"]),
+        "X-Profile-Seconds": str(summary["seconds"]),
+    })
+
+@app.post("/api/admin/profile/start", dependencies=[Depends(require_admin)])
+def start_profile(seconds: float = 30, interval_ms: float = None):
+    """Sample every thread's stack for `seconds` (stops on its own; max 300)"""
+    try:
+        return profiler.start(seconds, interval_ms or profiling.PROFILE_INTERVAL_MS)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/api/admin/profile/stop", dependencies=[Depends(require_admin)])
+def stop_profile():
+    sampler = profiler.stop()
+    if sampler is None:
+        raise HTTPException(status_code=404, detail="No profile has been recorded")
+    return collapsed_response(sampler)
+
+@app.get("/api/admin/profile", dependencies=[Depends(require_admin)])
+def get_profile():
+    """Last finished profile as collapsed stacks (see /status for one in progress)"""
+    sampler = profiler.result()
+    if sampler is None:
+        raise HTTPException(status_code=404, detail="No finished profile")
+    return collapsed_response(sampler)
+
+@app.get("/api/admin/profile/status", dependencies=[Depends(require_admin)])
+def get_profile_status():
+    return {"profile": profiler.status(), "memory": memory_profiler.status()}
+
+@app.get("/api/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+def get_request_profile(profile_id: str):
+    """Profile of a request sent with X-Debug-Profile (id from its X-Profile-ID header)"""
+    sampler = request_profile(profile_id)
+    if sampler is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired profile id")
+    return collapsed_response(sampler)
+
+@app.get("/api/admin/admission", dependencies=[Depends(require_admin)])
+def get_admission_status():
+    """Limits, current load and rejection counts per endpoint class"""
+    return admission.status()
+
+@app.get("/api/admin/reputation", dependencies=[Depends(require_admin)])
+def get_reputation_status():
+    return {**domain_registry.status(), "categories": domain_registry.categories}
+
+@app.put("/api/admin/reputation/{domain}", dependencies=[Depends(require_admin)])
+def set_domain_reputation(domain: str, request: DomainRatingRequest):
+    """Add or re-rate a domain; takes effect for the next scored claim and persists across restarts"""
+    try:
+        return domain_registry.set(domain, request.score, request.category).to_dict()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.delete("/api/admin/reputation/{domain}", dependencies=[Depends(require_admin)])
+def delete_domain_reputation(domain: str, restore: bool = False):
+    """Remove a domain, or with restore=true undo its runtime changes (back to the shipped rating)"""
+    changed = domain_registry.reset(domain) if restore else domain_registry.remove(domain)
+    if not changed:
+        raise HTTPException(status_code=404, detail=f"No {'runtime change' if restore else 'entry'} for {domain}")
+    rating = domain_registry.lookup(domain)
+    return {"domain": domain, "rating": rating.to_dict() if rating else None}
+
+@app.post("/api/admin/memory/start", dependencies=[Depends(require_admin)])
+def start_memory_tracing(frames: int = profiling.MEMORY_TRACE_FRAMES):
+    return memory_profiler.start(max(1, min(frames, 100)))
+
+@app.post("/api/admin/memory/snapshot", dependencies=[Depends(require_admin)])
+def take_memory_snapshot(top: int = 25, group_by: str = "lineno"):
+    """Top allocations, and the biggest changes since the previous snapshot"""
+    try:
+        return memory_profiler.snapshot(max(1, min(top, 200)), group_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/api/admin/memory/stop", dependencies=[Depends(require_admin)])
+def stop_memory_tracing():
+    return memory_profiler.stop()
 
 if __name__ == "__main__":
     import uvicorn
@@ -6,6 +6,8 @@ class Evidence(BaseModel):
     source: str
     content: str
     url: str
+    image_url: Optional[str] = None
+    published_at: Optional[datetime] = None
 
 class ScoreResponse(BaseModel):
     final_score: int = Field(..., ge=0, le=100)
@@ -14,6 +16,12 @@ class ScoreResponse(BaseModel):
     consistency: int = Field(..., ge=0, le=100)
     verdict: Literal["VERIFIED", "FALSE", "MIXED", "UNVERIFIED"]
 
+class ClaimMatch(BaseModel):
+    canonical_claim_id: str
+    canonical_text: str
+    similarity: float
+    verified_at: float
+
 class Claim(BaseModel):
     id: Optional[str] = None
     text: str
@@ -22,6 +30,7 @@ class Claim(BaseModel):
     status: Literal["unverified", "verified", "processing"] = "unverified"
     evidence: List[Evidence] = []
     score: Optional[ScoreResponse] = None
+    canonical_claim_id: Optional[str] = None
 
 class CrisisAlert(BaseModel):
     id: str
@@ -55,3 +64,13 @@ class ScoreRequest(BaseModel):
     claim_id: Optional[str] = None
     claim_text: str
     evidence: List[Evidence]
+
+class ChatRequest(BaseModel):
+    message: str = ""
+    session_id: Optional[str] = None
+    # Earlier turns ({"role", "content"}), only used to seed a new session
+    history: Optional[List[dict]] = None
+
+class DomainRatingRequest(BaseModel):
+    score: int = Field(..., ge=0, le=100)
+    category: str
@@ -0,0 +1,134 @@
+"""
+News Cache Module
+Stale-while-revalidate cache for per-category news responses.
+"""
+import os
+import time
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+from models import Claim
+from logs import get_logger
+
+log = get_logger("news_cache")
+
+# Seconds a snapshot is served as-is, and how long past that it may still be
+# served while a background refresh runs.
+NEWS_CACHE_FRESH_TTL = float(os.getenv("NEWS_CACHE_FRESH_TTL", "300"))
+NEWS_CACHE_STALE_TTL = float(os.getenv("NEWS_CACHE_STALE_TTL", "3600"))
+# Categories kept at once (least recently fetched evicted first)
+NEWS_CACHE_MAX_ENTRIES = 32
+# How long a request waits for another request's fetch of the same category
+NEWS_FETCH_WAIT_SECONDS = 30
+
+
+class CacheEntry:
+    def __init__(self, claims: List[Claim], fetched_at: float):
+        self.claims = claims
+        self.fetched_at = fetched_at
+
+    def age(self, now: float) -> float:
+        return max(0.0, now - self.fetched_at)
+
+
+class NewsCache:
+    def __init__(self, fresh_ttl: float = NEWS_CACHE_FRESH_TTL, stale_ttl: float = NEWS_CACHE_STALE_TTL,
+                 max_entries: int = NEWS_CACHE_MAX_ENTRIES):
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = max(stale_ttl, fresh_ttl)
+        self.max_entries = max_entries
+        self._entries: Dict[str, CacheEntry] = {}
+        self._refreshing: set = set()
+        # Synchronous fetches in progress, so concurrent misses share one upstream call
+        self._inflight: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        category: str,
+        fetch: Callable[[str], List[Claim]],
+        fallback: Callable[[str], List[Claim]],
+    ) -> Tuple[List[Claim], int, str]:
+        """
+        Return (claims, age_seconds, cache_state) for a category.
+        cache_state is one of HIT, STALE, MISS, FALLBACK.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(category)
+
+        if entry is not None:
+            age = entry.age(now)
+            if age < self.fresh_ttl:
+                return entry.claims, int(age), "HIT"
+            if age < self.stale_ttl:
+                self._refresh_in_background(category, fetch)
+                return entry.claims, int(age), "STALE"
+
+        # Missing or expired: fetch synchronously (once, however many requests are waiting)
+        claims = self._fetch_once(category, fetch)
+        if claims:
+            return claims, 0, "MISS"
+
+        # Upstream failed: prefer the last good snapshot, however old
+        if entry is not None:
+            return entry.claims, int(entry.age(now)), "FALLBACK"
+        return fallback(category), 0, "FALLBACK"
+
+    def invalidate(self, category: Optional[str] = None):
+        with self._lock:
+            if category is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(category, None)
+
+    def _fetch(self, category: str, fetch: Callable[[str], List[Claim]]) -> List[Claim]:
+        try:
+            claims = fetch(category)
+        except Exception as e:
+            log.error("News refresh failed", category=category, error=str(e))
+            return []
+        if claims:
+            with self._lock:
+                self._entries[category] = CacheEntry(claims, time.time())
+                if len(self._entries) > self.max_entries:
+                    oldest = min(self._entries, key=lambda key: self._entries[key].fetched_at)
+                    del self._entries[oldest]
+        return claims
+
+    def _fetch_once(self, category: str, fetch: Callable[[str], List[Claim]]) -> List[Claim]:
+        with self._lock:
+            done = self._inflight.get(category)
+            leader = done is None
+            if leader:
+                done = self._inflight[category] = threading.Event()
+        if not leader:
+            # Another request is fetching this category; use its result (or its failure)
+            done.wait(NEWS_FETCH_WAIT_SECONDS)
+            with self._lock:
+                entry = self._entries.get(category)
+            return entry.claims if entry is not None and entry.age(time.time()) < self.fresh_ttl else []
+        try:
+            return self._fetch(category, fetch)
+        finally:
+            with self._lock:
+                del self._inflight[category]
+            done.set()
+
+    def _refresh_in_background(self, category: str, fetch: Callable[[str], List[Claim]]):
+        with self._lock:
+            if category in self._refreshing:
+                return
+            self._refreshing.add(category)
+
+        def run():
+            try:
+                self._fetch(category, fetch)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(category)
+
+        threading.Thread(target=run, name=f"news-refresh-{category}", daemon=True).start()
+
+
+# Global instance
+news_cache = NewsCache()
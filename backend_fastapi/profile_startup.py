@@ -0,0 +1,78 @@
+"""
+Cold-start profile of the API: import time of `main` by module (from
+python -X importtime), time to the first `/` response, and how long each
+deferred component takes to load afterwards.
+
+    python profile_startup.py            # top 15 modules
+    python profile_startup.py --top 30 --no-warm
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Runs in a fresh interpreter so nothing is imported yet
+FIRST_RESPONSE = """
+import time, json
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+client = TestClient(main.app)
+client.get("/")
+first = time.perf_counter()
+result = {"import_ms": (imported - started) * 1000, "first_response_ms": (first - started) * 1000}
+if WARM:
+    result["ready"] = client.get("/api/ready", params={"warm": "true"}).json()
+print("RESULT " + json.dumps(result))
+"""
+
+
+def import_times(top: int):
+    """(self_us, cumulative_us, module) for the slowest imports under main."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=HERE, capture_output=True, text=True,
+    )
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.rstrip()))
+    # Top-level packages only (least indented), by cumulative time
+    depth = lambda name: len(name) - len(name.lstrip())
+    shallow = [row for row in rows if depth(row[2]) <= 3]
+    return sorted(shallow, key=lambda row: -row[1])[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--no-warm", action="store_true", help="skip loading the deferred components")
+    args = parser.parse_args()
+
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for self_us, cumulative_us, name in import_times(args.top):
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:8.1f}  {name}")
+
+    code = f"WARM = {not args.no_warm}\n" + FIRST_RESPONSE
+    completed = subprocess.run([sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True)
+    lines = [line for line in completed.stdout.splitlines() if line.startswith("RESULT ")]
+    if not lines:
+        sys.exit(completed.stderr[-2000:])
+    result = json.loads(lines[-1][len("RESULT "):])
+    print(f"\nimport main: {result['import_ms']:.0f} ms   first / response: {result['first_response_ms']:.0f} ms")
+    if "ready" in result:
+        print("\nDeferred loads (ms):")
+        for name, load_ms in sorted(result["ready"]["loaded"].items(), key=lambda item: -(item[1] or 0)):
+            print(f"{load_ms:10.1f}  {name}")
+        for name, error in result["ready"]["errors"].items():
+            print(f"{'failed':>10}  {name}: {error}")
+
+
+if __name__ == "__main__":
+    main()
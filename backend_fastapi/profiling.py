@@ -0,0 +1,293 @@
+"""
+Profiling Module
+On-demand profiling of the live process: a sampling profiler that
+produces flamegraph-compatible collapsed stacks, tracemalloc snapshots
+with top-allocation diffs, and per-request profiles for requests sent
+with X-Debug-Profile. Nothing runs (or costs anything) until started.
+"""
+import os
+import sys
+import time
+import threading
+import tracemalloc
+from collections import deque
+from contextvars import ContextVar
+from typing import Callable, Deque, Dict, Optional, Set, Tuple
+from admin import is_admin
+
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS") or "5")
+PROFILE_MAX_SECONDS = 300
+# Per-request profiles kept for GET /api/admin/profiles/{profile_id}
+REQUEST_PROFILES_KEPT = 20
+# Finer sampling for per-request profiles (they are short)
+REQUEST_PROFILE_INTERVAL_MS = 1
+MEMORY_TRACE_FRAMES = 25
+DEBUG_PROFILE_HEADER = b"x-debug-profile"
+ADMIN_TOKEN_HEADER = b"x-admin-token"
+PROFILE_ID_HEADER = b"x-profile-id"
+
+# Threads working on the current profiled request (set by ProfilingMiddleware,
+# shared with worker threads through copied contexts; see note_thread)
+_profiled_threads: ContextVar[Optional[Set[int]]] = ContextVar("profiled_threads", default=None)
+
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def note_thread():
+    """Mark the calling thread as working on the profiled request, if there is one."""
+    threads = _profiled_threads.get()
+    if threads is not None:
+        threads.add(threading.get_ident())
+
+
+def _short_path(path: str) -> str:
+    if path.startswith(_BACKEND_DIR):
+        return os.path.relpath(path, _BACKEND_DIR)
+    # .../site-packages/fastapi/routing.py -> fastapi/routing.py; stdlib -> threading.py
+    marker = os.sep + "site-packages" + os.sep
+    index = path.rfind(marker)
+    return path[index + len(marker):] if index >= 0 else os.path.basename(path)
+
+
+class StackSampler:
+    """
+    Wall-clock sampler: every interval it walks the stack of each thread
+    (sys._current_frames) and counts the collapsed stack. Output is the
+    `frame;frame;frame count` format used by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS, threads: Optional[Callable[[], Set[int]]] = None):
+        self.interval = max(0.5, interval_ms) / 1000
+        self.threads = threads
+        self.counts: Dict[str, int] = {}
+        self.samples = 0
+        self.started: Optional[float] = None
+        self.stopped: Optional[float] = None
+        self._labels: Dict[object, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{getattr(code, 'co_qualname', code.co_name)} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def sample(self):
+        own = threading.get_ident()
+        wanted = self.threads() if self.threads else None
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own or (wanted is not None and ident not in wanted):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            key = ";".join(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+        self.samples += 1
+
+    def _run(self, seconds: float):
+        deadline = time.monotonic() + seconds
+        while not self._stop.wait(self.interval):
+            self.sample()
+            if time.monotonic() >= deadline:
+                break
+        self.stopped = time.time()
+
+    def start(self, seconds: float = PROFILE_MAX_SECONDS):
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, args=(min(seconds, PROFILE_MAX_SECONDS),), name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.stopped = self.stopped or time.time()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.counts.items()))
+
+    def summary(self) -> Dict:
+        return {
+            "running": self.running,
+            "samples": self.samples,
+            "stacks": len(self.counts),
+            "interval_ms": self.interval * 1000,
+            "seconds": round((self.stopped or time.time()) - self.started, 2) if self.started else 0,
+        }
+
+
+class Profiler:
+    """One process-wide sampling session at a time, plus the last finished one."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.current: Optional[StackSampler] = None
+        self.last: Optional[StackSampler] = None
+
+    def start(self, seconds: float, interval_ms: float = PROFILE_INTERVAL_MS) -> Dict:
+        """Sample for `seconds` (stops on its own). Raises RuntimeError if one is running."""
+        with self._lock:
+            if self.current is not None and self.current.running:
+                raise RuntimeError("A profile is already running")
+            self.current = StackSampler(interval_ms)
+            self.current.start(seconds)
+            return self.current.summary()
+
+    def stop(self) -> Optional[StackSampler]:
+        """Stop the running (or just finished) session and keep it as the last result."""
+        with self._lock:
+            if self.current is None:
+                return self.last
+            self.current.stop()
+            self.last, self.current = self.current, None
+            return self.last
+
+    def result(self) -> Optional[StackSampler]:
+        with self._lock:
+            if self.current is not None and not self.current.running:
+                self.last, self.current = self.current, None
+            return self.last
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                "current": self.current.summary() if self.current else None,
+                "last": self.last.summary() if self.last else None,
+            }
+
+
+class MemoryProfiler:
+    """tracemalloc control; each snapshot is compared with the previous one."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._previous: Optional[tracemalloc.Snapshot] = None
+
+    def start(self, frames: int = MEMORY_TRACE_FRAMES) -> Dict:
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+                self._previous = None
+            return self.status()
+
+    def stop(self) -> Dict:
+        with self._lock:
+            tracemalloc.stop()
+            self._previous = None
+            return self.status()
+
+    def snapshot(self, top: int = 25, group_by: str = "lineno") -> Dict:
+        """Top allocations by size and, after the first snapshot, the biggest changes since the last."""
+        if group_by not in ("lineno", "filename", "traceback"):
+            raise ValueError("group_by must be lineno, filename or traceback")
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                raise RuntimeError("tracemalloc is not running")
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            ))
+            previous, self._previous = self._previous, snapshot
+
+        def where(traceback) -> str:
+            frame = traceback[0]
+            location = f"{_short_path(frame.filename)}:{frame.lineno}"
+            if group_by == "traceback":
+                return " <- ".join(f"{_short_path(f.filename)}:{f.lineno}" for f in traceback)
+            return location if group_by == "lineno" else _short_path(frame.filename)
+
+        result = {
+            **self.status(),
+            "top": [
+                {"where": where(stat.traceback), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+                for stat in snapshot.statistics(group_by)[:top]
+            ],
+            "diff": None,
+        }
+        if previous is not None:
+            result["diff"] = [
+                {
+                    "where": where(stat.traceback),
+                    "size_kb": round(stat.size / 1024, 1),
+                    "size_diff_kb": round(stat.size_diff / 1024, 1),
+                    "count_diff": stat.count_diff,
+                }
+                for stat in snapshot.compare_to(previous, group_by)[:top]
+            ]
+        return result
+
+    def status(self) -> Dict:
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {
+            "tracing": tracing,
+            "frames": tracemalloc.get_traceback_limit() if tracing else 0,
+            "traced_kb": round(current / 1024, 1),
+            "peak_kb": round(peak / 1024, 1),
+        }
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware: a request carrying X-Debug-Profile and a valid
+    X-Admin-Token is sampled while it runs (only the threads working on
+    it), and the collapsed stacks are kept under the id returned in
+    X-Profile-ID. Other requests pay one header lookup.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        if DEBUG_PROFILE_HEADER not in headers or not is_admin(headers.get(ADMIN_TOKEN_HEADER, b"").decode("latin-1")):
+            await self.app(scope, receive, send)
+            return
+
+        threads = {threading.get_ident()}
+        token = _profiled_threads.set(threads)
+        sampler = StackSampler(REQUEST_PROFILE_INTERVAL_MS, threads=lambda: set(threads))
+        profile_id = os.urandom(8).hex()
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers") or []) + [(PROFILE_ID_HEADER, profile_id.encode())]
+            await send(message)
+
+        sampler.start(PROFILE_MAX_SECONDS)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.stop()
+            _profiled_threads.reset(token)
+            _request_profiles.append((profile_id, sampler))
+
+
+_request_profiles: "Deque[Tuple[str, StackSampler]]" = deque(maxlen=REQUEST_PROFILES_KEPT)
+
+
+def request_profile(profile_id: str) -> Optional[StackSampler]:
+    """Profile of a request sent with X-Debug-Profile, while it is among the most recent."""
+    for key, sampler in list(_request_profiles):
+        if key == profile_id:
+            return sampler
+    return None
+
+
+# Global instances
+profiler = Profiler()
+memory_profiler = MemoryProfiler()
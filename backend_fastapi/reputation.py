@@ -0,0 +1,228 @@
+"""
+Reputation Module
+Registry of known outlets, fact-checkers and public bodies with a
+reliability score (0-100) and category, used to compute a claim's
+source_reliability from its evidence URLs instead of asking the LLM.
+Lookups are dict probes on the host and its parent domains
+("edition.cnn.com", "cnn.com", "com"), so suffix entries such as "gov" or
+"ac.uk" cover whole namespaces. The preloaded table lives in
+domain_reputation.json; runtime changes are kept as overrides under the
+data directory and survive restarts.
+"""
+import os
+import json
+import threading
+from urllib.parse import urlsplit
+from typing import Dict, Iterable, Optional, Tuple
+from storage import data_path
+from logs import get_logger
+
+log = get_logger("reputation")
+
+DOMAIN_REPUTATION_FILE = os.getenv("DOMAIN_REPUTATION_FILE") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "domain_reputation.json"
+)
+# Score for evidence from a domain the registry does not know, and how much
+# such a source counts next to a known one
+UNKNOWN_DOMAIN_SCORE = int(os.getenv("UNKNOWN_DOMAIN_SCORE") or "45")
+UNKNOWN_DOMAIN_WEIGHT = 0.5
+OVERRIDES_FILE = "overrides.json"
+# Hosts whose match is remembered (cleared whenever the table changes)
+MATCH_CACHE_SIZE = 4096
+
+
+def host_of(value: str) -> Optional[str]:
+    """Lower-cased host of a URL (or bare domain); None for anything without one."""
+    value = (value or "").strip()
+    if not value:
+        return None
+    if "://" not in value:
+        value = "//" + value
+    try:
+        host = urlsplit(value).hostname
+    except ValueError:
+        return None
+    if not host or "." not in host:
+        return None
+    return host.rstrip(".")
+
+
+class SourceRating:
+    __slots__ = ("domain", "score", "category")
+
+    def __init__(self, domain: str, score: int, category: str):
+        self.domain = domain
+        self.score = score
+        self.category = category
+
+    def to_dict(self) -> Dict:
+        return {"domain": self.domain, "score": self.score, "category": self.category}
+
+
+class DomainRegistry:
+    def __init__(self, path: Optional[str] = DOMAIN_REPUTATION_FILE, overrides_dir: Optional[str] = "reputation"):
+        self._lock = threading.Lock()
+        self.categories: Dict[str, str] = {}
+        self._preloaded: Dict[str, Tuple[int, str]] = {}
+        # domain -> (score, category), or None for a preloaded domain removed at runtime
+        self._overrides: Dict[str, Optional[Tuple[int, str]]] = {}
+        self._table: Dict[str, Tuple[int, str]] = {}
+        self._matches: Dict[str, Optional[SourceRating]] = {}
+        self._overrides_file = data_path(overrides_dir, OVERRIDES_FILE) if overrides_dir else None
+        if path:
+            self._load(path)
+        self._load_overrides()
+        self._rebuild()
+
+    def _load(self, path: str):
+        try:
+            with open(path, encoding="utf-8") as handle:
+                data = json.load(handle)
+        except (OSError, ValueError) as e:
+            log.error("Could not load domain reputation table", path=path, error=str(e))
+            return
+        self.categories = dict(data.get("categories", {}))
+        self._preloaded = {domain.lower(): (int(score), category) for domain, (score, category) in data.get("domains", {}).items()}
+        log.info("Loaded domain reputation table", domains=len(self._preloaded))
+
+    def _load_overrides(self):
+        if not self._overrides_file or not os.path.exists(self._overrides_file):
+            return
+        try:
+            with open(self._overrides_file, encoding="utf-8") as handle:
+                data = json.load(handle)
+            self._overrides = {domain: (tuple(entry) if entry else None) for domain, entry in data.items()}
+        except (OSError, ValueError, TypeError) as e:
+            log.error("Could not load domain reputation overrides", error=str(e))
+
+    def _rebuild(self):
+        table = dict(self._preloaded)
+        for domain, entry in self._overrides.items():
+            if entry is None:
+                table.pop(domain, None)
+            else:
+                table[domain] = entry
+        # Swapped in whole, so lookups never take the lock
+        self._table = table
+        self._matches = {}
+
+    def _save(self):
+        if not self._overrides_file:
+            return
+        temporary = self._overrides_file + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as handle:
+            json.dump({domain: list(entry) if entry else None for domain, entry in sorted(self._overrides.items())}, handle, indent=2)
+        os.replace(temporary, self._overrides_file)
+
+    def lookup(self, value: str) -> Optional[SourceRating]:
+        """Rating of the most specific registered domain covering a URL or domain."""
+        host = host_of(value)
+        return self._match(host) if host is not None else None
+
+    def _match(self, host: str) -> Optional[SourceRating]:
+        matches = self._matches
+        if host in matches:
+            return matches[host]
+        table = self._table
+        rating = None
+        labels = host.split(".")
+        for i in range(len(labels)):
+            domain = ".".join(labels[i:])
+            entry = table.get(domain)
+            if entry is not None:
+                rating = SourceRating(domain, entry[0], entry[1])
+                break
+        if len(matches) >= MATCH_CACHE_SIZE:
+            matches.clear()
+        matches[host] = rating
+        return rating
+
+    def assess(self, urls: Iterable[str]) -> Optional[Dict]:
+        """
+        source_reliability for a set of evidence URLs: the weighted mean of
+        their distinct domains' scores (unknown domains count as
+        UNKNOWN_DOMAIN_SCORE at UNKNOWN_DOMAIN_WEIGHT). None when no URL has a host.
+        """
+        sources: Dict[str, Dict] = {}
+        for url in urls:
+            host = host_of(url)
+            if host is None:
+                continue
+            rating = self._match(host)
+            key = rating.domain if rating else host
+            if key not in sources:
+                sources[key] = rating.to_dict() if rating else {"domain": host, "score": UNKNOWN_DOMAIN_SCORE, "category": "unknown"}
+        if not sources:
+            return None
+        total = weight = 0.0
+        for source in sources.values():
+            w = UNKNOWN_DOMAIN_WEIGHT if source["category"] == "unknown" else 1.0
+            total += source["score"] * w
+            weight += w
+        return {
+            "score": int(round(total / weight)),
+            "known": sum(1 for source in sources.values() if source["category"] != "unknown"),
+            "sources": list(sources.values()),
+        }
+
+    def source_reliability(self, urls: Iterable[str]) -> Optional[int]:
+        assessment = self.assess(urls)
+        return assessment["score"] if assessment else None
+
+    def set(self, domain: str, score: int, category: str) -> SourceRating:
+        """Add or change a domain at runtime. Raises ValueError on a bad domain, score or category."""
+        host = host_of(domain) or (domain or "").strip().lower()
+        if not host or "/" in host or " " in host:
+            raise ValueError(f"Invalid domain: {domain!r}")
+        if not 0 <= score <= 100:
+            raise ValueError("score must be between 0 and 100")
+        if category not in self.categories:
+            raise ValueError(f"Unknown category: {category} (available: {', '.join(sorted(self.categories))})")
+        with self._lock:
+            self._overrides[host] = (int(score), category)
+            self._rebuild()
+            self._save()
+        log.info("Domain reputation updated", domain=host, score=score, category=category)
+        return SourceRating(host, int(score), category)
+
+    def remove(self, domain: str) -> bool:
+        """Forget a domain (runtime entry or preloaded); False if it was not registered."""
+        host = host_of(domain) or (domain or "").strip().lower()
+        with self._lock:
+            if host not in self._table:
+                return False
+            if host in self._preloaded:
+                self._overrides[host] = None
+            else:
+                self._overrides.pop(host, None)
+            self._rebuild()
+            self._save()
+        log.info("Domain reputation removed", domain=host)
+        return True
+
+    def reset(self, domain: str) -> bool:
+        """Drop a runtime change, restoring the preloaded entry (if any); False if there was none."""
+        host = host_of(domain) or (domain or "").strip().lower()
+        with self._lock:
+            if host not in self._overrides:
+                return False
+            del self._overrides[host]
+            self._rebuild()
+            self._save()
+        return True
+
+    def status(self) -> Dict:
+        by_category: Dict[str, int] = {}
+        for _, category in self._table.values():
+            by_category[category] = by_category.get(category, 0) + 1
+        return {
+            "domains": len(self._table),
+            "preloaded": len(self._preloaded),
+            "overrides": len(self._overrides),
+            "by_category": dict(sorted(by_category.items())),
+            "unknown_domain_score": UNKNOWN_DOMAIN_SCORE,
+        }
+
+
+# Global instance
+domain_registry = DomainRegistry()
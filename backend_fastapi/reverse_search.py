@@ -0,0 +1,343 @@
+"""
+Reverse Image Search Module
+Local index of every image we have seen (uploads and article images), with
+provenance, searchable by perceptual hash and global descriptor.
+"""
+import os
+import json
+import time
+import array
+import hashlib
+import socket
+import ipaddress
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from image_hash import DESCRIPTOR_DIM, HammingIndex, ImageSignature, hamming, image_signature
+from storage import data_path
+from logs import get_logger
+
+log = get_logger("reverse_search")
+
+# pHash radius (0-7) for candidate retrieval
+REVERSE_SEARCH_MAX_DISTANCE = int(os.getenv("REVERSE_SEARCH_MAX_DISTANCE", "7"))
+# Descriptor cosine similarity for matches the hash misses (crops, recolors)
+REVERSE_SEARCH_MIN_SIMILARITY = float(os.getenv("REVERSE_SEARCH_MIN_SIMILARITY", "0.95"))
+# Descriptor brute-force scan is skipped above this many images (hash lookup only)
+REVERSE_SEARCH_SCAN_LIMIT = int(os.getenv("REVERSE_SEARCH_SCAN_LIMIT", "200000"))
+SCAN_BLOCK = 32768
+REMOTE_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+REMOTE_IMAGE_MAX_REDIRECTS = 3
+
+
+def is_public_address(address: str) -> bool:
+    """Whether an IP is globally routable (not loopback, private, link-local, reserved or multicast)."""
+    ip = ipaddress.ip_address(address.split("%")[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+class _PublicPeerOnly:
+    """
+    Connection mixin refusing non-public hosts on every redirect hop: the
+    DNS answer is checked before connecting, and the address actually
+    connected to before any request bytes are sent (in case the answer
+    changed in between).
+    """
+
+    def _new_conn(self):
+        for *_, sockaddr in socket.getaddrinfo(self._dns_host, self.port, type=socket.SOCK_STREAM):
+            if not is_public_address(sockaddr[0]):
+                raise ConnectionRefusedError(f"Refusing to fetch from non-public address {sockaddr[0]}")
+        sock = super()._new_conn()
+        address = sock.getpeername()[0]
+        if not is_public_address(address):
+            sock.close()
+            raise ConnectionRefusedError(f"Refusing to fetch from non-public address {address}")
+        return sock
+
+
+class _PublicHTTPConnection(_PublicPeerOnly, HTTPConnection):
+    pass
+
+
+class _PublicHTTPSConnection(_PublicPeerOnly, HTTPSConnection):
+    pass
+
+
+class _PublicHTTPPool(HTTPConnectionPool):
+    ConnectionCls = _PublicHTTPConnection
+
+
+class _PublicHTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = _PublicHTTPSConnection
+
+
+class _PublicOnlyAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _PublicHTTPPool, "https": _PublicHTTPSPool}
+
+
+def _public_session() -> requests.Session:
+    session = requests.Session()
+    # Environment proxies would make the proxy the peer that gets checked
+    session.trust_env = False
+    session.max_redirects = REMOTE_IMAGE_MAX_REDIRECTS
+    adapter = _PublicOnlyAdapter()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def download_image(url: str, timeout: float = 10, max_bytes: int = REMOTE_IMAGE_MAX_BYTES) -> Optional[bytes]:
+    """
+    Fetch an image from a public http(s) URL, streaming so oversized bodies
+    are abandoned early. `timeout` bounds the whole download, not each read.
+    URLs are client- and feed-supplied, so hosts on loopback, private or
+    link-local addresses are refused.
+    """
+    if urlsplit(url or "").scheme.lower() not in ("http", "https"):
+        log.warning("Refusing non-HTTP image URL", url=url)
+        return None
+    started = time.monotonic()
+    try:
+        with _public_session() as session, session.get(url, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            chunks = []
+            size = 0
+            while True:
+                # read1 returns whatever has arrived, so a slow drip is caught here
+                chunk = response.raw.read1(64 * 1024, decode_content=True)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    log.warning("Skipping oversized image", url=url)
+                    return None
+                if time.monotonic() - started > timeout:
+                    log.warning("Image download timed out", url=url, timeout=timeout)
+                    return None
+                chunks.append(chunk)
+        return b"".join(chunks)
+    except Exception as e:
+        log.error("Failed to download image", url=url, error=str(e))
+        return None
+
+
+def _url_key(url: str) -> int:
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class ReverseImageIndex:
+    """
+    Every sighting of an image is one row: pHash/dHash (hashes.u64), a
+    float16 descriptor (descriptors.f16), first-seen time (seen.f64) and a
+    provenance record (records.jsonl, located via offsets.i64). Only the
+    numeric columns are held in memory; records are read for returned rows.
+    """
+
+    def __init__(self, path: Optional[str] = "reverse_index"):
+        self._lock = threading.Lock()
+        self._index = HammingIndex()
+        self._dhashes = array.array("Q")
+        self._seen = array.array("d")
+        self._offsets = array.array("q")
+        self._descriptors = np.empty((1024, DESCRIPTOR_DIM), dtype=np.float16)
+        self._image_urls: set = set()
+        self._memory_records: Dict[int, Dict] = {}
+        self.directory = None
+        if path:
+            try:
+                self.directory = os.path.dirname(data_path(path, "records.jsonl"))
+                self._load()
+            except Exception as e:
+                log.warning("Reverse image index persistence unavailable. Using memory only.", error=str(e))
+                self.directory = None
+
+    def __len__(self) -> int:
+        return len(self._dhashes)
+
+    def search(self, signature: ImageSignature, k: int = 10) -> List[Dict]:
+        """
+        Matches ordered closest first; the earliest sighting among them is
+        flagged with "earliest": True.
+        """
+        with self._lock:
+            count = len(self._dhashes)
+            if not count:
+                return []
+            query = signature.descriptor.astype(np.float32)
+            distances = {row: d for row, d in self._index.search(signature.phash, REVERSE_SEARCH_MAX_DISTANCE)}
+            if len(distances) < k and count <= REVERSE_SEARCH_SCAN_LIMIT:
+                # Blockwise so the float32 copy of the descriptors stays small
+                for start in range(0, count, SCAN_BLOCK):
+                    block = self._descriptors[start:min(count, start + SCAN_BLOCK)].astype(np.float32)
+                    for row in np.flatnonzero(block @ query >= REVERSE_SEARCH_MIN_SIMILARITY):
+                        distances.setdefault(start + int(row), None)
+            if not distances:
+                return []
+            rows = np.fromiter(distances, dtype=np.int64, count=len(distances))
+            similarity = self._descriptors[rows].astype(np.float32) @ query
+            phash_distance = hamming(np.array([self._index.hash_at(int(r)) for r in rows], dtype=np.uint64), signature.phash)
+            # Closest first: pHash distance, then descriptor similarity
+            order = np.lexsort((-similarity, phash_distance))[:k]
+            seen = [self._seen[int(rows[i])] for i in order]
+            matches = []
+            for i in order:
+                row = int(rows[i])
+                record = self._read(row) or {}
+                first_seen = datetime.fromtimestamp(self._seen[row], tz=timezone.utc)
+                matches.append({
+                    "title": record.get("title") or "Previously seen image",
+                    "url": record.get("source_url") or "",
+                    "source": record.get("kind", "unknown"),
+                    "snippet": f"First seen {first_seen.strftime('%Y-%m-%d')}" + (f" at {record['source_url']}" if record.get("source_url") else ""),
+                    "first_seen": first_seen.isoformat(),
+                    "phash_distance": int(phash_distance[i]),
+                    "similarity": round(float(similarity[i]), 4),
+                    "claim_ids": record.get("claim_ids", []),
+                    "image_url": record.get("image_url"),
+                    "earliest": False,
+                })
+        if matches:
+            matches[int(np.argmin(seen))]["earliest"] = True
+        return matches
+
+    def add(
+        self,
+        signature: ImageSignature,
+        kind: str,
+        source_url: Optional[str] = None,
+        image_url: Optional[str] = None,
+        claim_ids: Optional[List[str]] = None,
+        title: Optional[str] = None,
+        seen_at: Optional[float] = None,
+    ) -> int:
+        """Record a sighting. seen_at defaults to now (use the publish date for articles)."""
+        seen_at = seen_at or time.time()
+        record = {
+            "kind": kind,
+            "source_url": source_url,
+            "image_url": image_url,
+            "claim_ids": claim_ids or [],
+            "title": title,
+            "seen_at": seen_at,
+        }
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            offset = -1
+            if self.directory:
+                try:
+                    with open(os.path.join(self.directory, "records.jsonl"), "ab") as f:
+                        offset = f.tell()
+                        f.write(line.encode("utf-8"))
+                    self._append_columns(signature, seen_at, offset)
+                except OSError as e:
+                    log.warning("Failed to persist reverse image index entry", error=str(e))
+                    offset = -1
+            row = len(self._dhashes)
+            if row == len(self._descriptors):
+                grown = np.empty((2 * row, DESCRIPTOR_DIM), dtype=np.float16)
+                grown[:row] = self._descriptors
+                self._descriptors = grown
+            self._descriptors[row] = signature.descriptor
+            self._dhashes.append(signature.dhash)
+            self._seen.append(seen_at)
+            self._offsets.append(offset)
+            if offset < 0:
+                self._memory_records[row] = record
+            if image_url:
+                self._image_urls.add(_url_key(image_url))
+            self._index.add(signature.phash)
+            return row
+
+    def has_image_url(self, image_url: str) -> bool:
+        return _url_key(image_url) in self._image_urls
+
+    def ingest_remote(
+        self,
+        image_url: str,
+        source_url: Optional[str] = None,
+        claim_ids: Optional[List[str]] = None,
+        title: Optional[str] = None,
+        seen_at: Optional[float] = None,
+        timeout: float = 10,
+    ) -> Optional[int]:
+        """Download an article image (size-capped) and index it once per URL."""
+        if not image_url or self.has_image_url(image_url):
+            return None
+        image_data = download_image(image_url, timeout=timeout)
+        if image_data is None:
+            return None
+        try:
+            signature = image_signature(image_data)
+        except Exception as e:
+            log.error("Failed to index article image", url=image_url, error=str(e))
+            return None
+        return self.add(signature, "article", source_url=source_url, image_url=image_url,
+                        claim_ids=claim_ids, title=title, seen_at=seen_at)
+
+    def _append_columns(self, signature: ImageSignature, seen_at: float, offset: int):
+        # Column files first, hashes.u64 last: a row only counts once its hash is written
+        with open(os.path.join(self.directory, "descriptors.f16"), "ab") as f:
+            f.write(signature.descriptor.astype(np.float16).tobytes())
+        with open(os.path.join(self.directory, "seen.f64"), "ab") as f:
+            f.write(array.array("d", [seen_at]).tobytes())
+        with open(os.path.join(self.directory, "offsets.i64"), "ab") as f:
+            f.write(array.array("q", [offset]).tobytes())
+        with open(os.path.join(self.directory, "hashes.u64"), "ab") as f:
+            f.write(array.array("Q", [signature.phash, signature.dhash]).tobytes())
+
+    def _read(self, row: int) -> Optional[Dict]:
+        if row in self._memory_records:
+            return self._memory_records[row]
+        try:
+            with open(os.path.join(self.directory, "records.jsonl"), "rb") as f:
+                f.seek(self._offsets[row])
+                return json.loads(f.readline())
+        except (OSError, ValueError) as e:
+            log.warning("Failed to read reverse image record", error=str(e))
+            return None
+
+    def _load(self):
+        files = {name: os.path.join(self.directory, name) for name in ("hashes.u64", "descriptors.f16", "seen.f64", "offsets.i64")}
+        if not all(os.path.exists(f) for f in files.values()):
+            return
+        hashes = np.fromfile(files["hashes.u64"], dtype=np.uint64)
+        hashes = hashes[:len(hashes) // 2 * 2].reshape(-1, 2)
+        descriptors = np.fromfile(files["descriptors.f16"], dtype=np.float16)
+        descriptors = descriptors[:len(descriptors) // DESCRIPTOR_DIM * DESCRIPTOR_DIM].reshape(-1, DESCRIPTOR_DIM)
+        seen = np.fromfile(files["seen.f64"], dtype=np.float64)
+        offsets = np.fromfile(files["offsets.i64"], dtype=np.int64)
+        count = min(len(hashes), len(descriptors), len(seen), len(offsets))
+        for name, row_bytes in (("hashes.u64", 16), ("descriptors.f16", 2 * DESCRIPTOR_DIM), ("seen.f64", 8), ("offsets.i64", 8)):
+            if os.path.getsize(files[name]) != count * row_bytes:
+                os.truncate(files[name], count * row_bytes)  # realign after a torn append
+        self._descriptors = np.empty((max(1024, 2 * count), DESCRIPTOR_DIM), dtype=np.float16)
+        self._descriptors[:count] = descriptors[:count]
+        self._dhashes.frombytes(hashes[:count, 1].tobytes())
+        self._seen.frombytes(seen[:count].tobytes())
+        self._offsets.frombytes(offsets[:count].tobytes())
+        with open(os.path.join(self.directory, "records.jsonl"), "rb") as f:
+            for line in f:
+                try:
+                    image_url = json.loads(line).get("image_url")
+                except ValueError:
+                    continue  # torn final write
+                if image_url:
+                    self._image_urls.add(_url_key(image_url))
+        self._index.extend(hashes[:count, 0])
+        if count:
+            log.info("Loaded reverse image index", images=count)
+
+
+# Global instance
+reverse_image_index = ReverseImageIndex()
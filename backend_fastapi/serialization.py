@@ -0,0 +1,19 @@
+"""
+Serialization Module
+Fast JSON path for the list-heavy endpoints (/api/claims, /api/news,
+/api/crisis). Responses are encoded by pydantic-core in one pass, without
+FastAPI's response-model re-validation and jsonable_encoder walk.
+"""
+from typing import Any
+from pydantic_core import to_json
+from fastapi import Response
+
+
+class JSONBytes(Response):
+    """Response whose content is already-encoded JSON (bytes) or any value pydantic-core can encode."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return content if isinstance(content, bytes) else to_json(content)
+
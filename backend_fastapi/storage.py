@@ -0,0 +1,18 @@
+"""
+Storage Module
+Location of on-disk state (indexes, snapshots) shared by the backend modules.
+"""
+import os
+
+# Defaults to backend_fastapi/data; point at a writable volume (or /tmp on
+# serverless hosts) via CRUX_DATA_DIR.
+DATA_DIR = os.getenv("CRUX_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+
+
+def data_path(*parts: str) -> str:
+    """
+    Return a path under DATA_DIR, creating its parent directory.
+    """
+    path = os.path.join(DATA_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
@@ -0,0 +1,333 @@
+"""
+Telemetry Module
+Per-agent instrumentation: calls, in-flight work, errors, latency
+histograms, cache hit rates and upstream token usage, plus a bounded
+feed of recent activity. Feeds /api/agents and the Prometheus /metrics
+endpoint.
+"""
+import os
+import time
+import bisect
+import inspect
+import functools
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Deque, Dict, Iterator, List, Optional
+from tracing import span
+
+# Recent activity events kept for the Agent Monitor feed
+TELEMETRY_ACTIVITY_SIZE = int(os.getenv("TELEMETRY_ACTIVITY_SIZE") or "200")
+
+# Latency bucket upper bounds (ms): four per doubling from 0.1 ms to ~3.5 min,
+# so interpolated percentiles are within ~10% of the true value
+BUCKET_BOUNDS_MS = [round(0.1 * 2 ** (i / 4), 4) for i in range(85)]
+# Subset exported to Prometheus (one per doubling); cumulative counts stay exact
+EXPORTED_BOUNDS_MS = BUCKET_BOUNDS_MS[::4]
+
+AGENT_DESCRIPTIONS = {
+    "ScanAgent": "Monitors social media and news sources for emerging claims",
+    "VerifyAgent": "Cross-references claims with trusted fact-checking sources",
+    "ScoreAgent": "Calculates credibility scores based on evidence strength",
+    "ExplainAgent": "Generates human-readable explanations and translations",
+    "CrisisAgent": "Flags claims that describe breaking crises",
+    "ImageAgent": "Checks uploaded images for AI generation and manipulation",
+    "ChatAgent": "Answers assistant chat messages",
+}
+
+_current_call: ContextVar[Optional["Call"]] = ContextVar("telemetry_call", default=None)
+
+
+class LatencyHistogram:
+    """Fixed log-spaced buckets; constant memory however many calls are recorded."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.sum_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimated q-quantile (ms), linearly interpolated inside its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BUCKET_BOUNDS_MS[index - 1] if index else 0.0
+                upper = BUCKET_BOUNDS_MS[index] if index < len(BUCKET_BOUNDS_MS) else self.max_ms
+                estimate = lower + (upper - lower) * (rank - seen) / count
+                return round(min(estimate, self.max_ms), 2)
+            seen += count
+        return round(self.max_ms, 2)
+
+    def cumulative(self, bounds: List[float]) -> List[int]:
+        """Calls at or under each bound (bounds must be bucket bounds)."""
+        result, seen, index = [], 0, 0
+        for bound in bounds:
+            while index < len(BUCKET_BOUNDS_MS) and BUCKET_BOUNDS_MS[index] <= bound:
+                seen += self.counts[index]
+                index += 1
+            result.append(seen)
+        return result
+
+
+class AgentStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.in_flight = 0
+        self.errors: Dict[str, int] = {}
+        self.latency = LatencyHistogram()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.last_call: Optional[float] = None
+        self.last_status: Optional[str] = None
+
+    @property
+    def error_count(self) -> int:
+        return sum(self.errors.values())
+
+    def summary(self) -> Dict:
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "calls": self.calls,
+            "in_flight": self.in_flight,
+            "errors": self.error_count,
+            "errors_by_kind": dict(self.errors),
+            "latency_ms": {
+                "p50": self.latency.quantile(0.5),
+                "p95": self.latency.quantile(0.95),
+                "p99": self.latency.quantile(0.99),
+                "mean": round(self.latency.sum_ms / self.latency.count, 2) if self.latency.count else None,
+                "max": round(self.latency.max_ms, 2) if self.latency.count else None,
+            },
+            "cache": {
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "hit_rate": round(self.cache_hits / lookups, 3) if lookups else None,
+            },
+            "tokens": {"prompt": self.prompt_tokens, "completion": self.completion_tokens},
+            "last_call": datetime.fromtimestamp(self.last_call, timezone.utc).isoformat() if self.last_call else None,
+        }
+
+
+class Call:
+    """One instrumented call; agent code marks failures and usage on it."""
+
+    def __init__(self, agent: str, action: str):
+        self.agent = agent
+        self.action = action
+        self.error: Optional[str] = None
+        self.detail: Optional[str] = None
+
+
+def _ago(seconds: float) -> str:
+    if seconds < 60:
+        return "Just now"
+    if seconds < 3600:
+        return f"{int(seconds // 60)} min ago"
+    if seconds < 86400:
+        return f"{int(seconds // 3600)} h ago"
+    return f"{int(seconds // 86400)} d ago"
+
+
+class Telemetry:
+    def __init__(self, activity_size: int = TELEMETRY_ACTIVITY_SIZE):
+        self._lock = threading.Lock()
+        self.agents: Dict[str, AgentStats] = {}
+        self.activity: Deque[Dict] = deque(maxlen=activity_size)
+        self.started = time.time()
+
+    def _agent(self, name: str) -> AgentStats:
+        stats = self.agents.get(name)
+        if stats is None:
+            stats = self.agents.setdefault(name, AgentStats(name))
+        return stats
+
+    @contextmanager
+    def track(self, agent: str, action: str) -> Iterator[Call]:
+        """
+        Time one agent call. An exception counts as an error; agents that
+        handle failures themselves call error() instead. Nested calls are
+        counted under their own agent. Each call is also a tracing span.
+        """
+        call = Call(agent, action)
+        token = _current_call.set(call)
+        with self._lock:
+            self._agent(agent).in_flight += 1
+        started = time.perf_counter()
+        try:
+            with span(agent, action=action) as agent_span:
+                try:
+                    yield call
+                finally:
+                    if call.error:
+                        agent_span.fail(call.error)
+        except BaseException as e:
+            call.error = call.error or type(e).__name__
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            _current_call.reset(token)
+            with self._lock:
+                stats = self._agent(agent)
+                stats.in_flight -= 1
+                stats.calls += 1
+                stats.latency.observe(elapsed_ms)
+                stats.last_call = time.time()
+                stats.last_status = "error" if call.error else "success"
+                if call.error:
+                    stats.errors[call.error] = stats.errors.get(call.error, 0) + 1
+                self.activity.append({
+                    "timestamp": stats.last_call,
+                    "agent": agent,
+                    "action": call.action + (f" ({call.detail})" if call.detail else ""),
+                    "status": stats.last_status,
+                    "duration_ms": round(elapsed_ms, 1),
+                    "error": call.error,
+                })
+
+    def instrument(self, agent: str, action: str):
+        """Decorator form of track() for agent methods (sync or async)."""
+        def decorate(function):
+            if inspect.iscoroutinefunction(function):
+                @functools.wraps(function)
+                async def async_wrapper(*args, **kwargs):
+                    with self.track(agent, action):
+                        return await function(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.track(agent, action):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def error(self, kind: str, detail: Optional[str] = None):
+        """Mark the current tracked call as failed (with a short error kind)."""
+        call = _current_call.get()
+        if call is not None:
+            call.error = kind
+            if detail:
+                call.detail = detail
+
+    def note(self, detail: str):
+        """Short outcome shown with the current call in the activity feed."""
+        call = _current_call.get()
+        if call is not None:
+            call.detail = detail
+
+    def cache(self, agent: str, hit: bool):
+        with self._lock:
+            stats = self._agent(agent)
+            if hit:
+                stats.cache_hits += 1
+            else:
+                stats.cache_misses += 1
+
+    def tokens(self, agent: str, usage) -> None:
+        """Add an upstream completion's usage (Groq/OpenAI `usage` object or dict)."""
+        if usage is None:
+            return
+        if isinstance(usage, dict):
+            prompt, completion = usage.get("prompt_tokens"), usage.get("completion_tokens")
+        else:
+            prompt, completion = getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
+        with self._lock:
+            stats = self._agent(agent)
+            stats.prompt_tokens += prompt or 0
+            stats.completion_tokens += completion or 0
+
+    def event(self, agent: str, action: str, status: str = "success"):
+        """Activity feed entry that isn't a timed call."""
+        with self._lock:
+            self.activity.append({
+                "timestamp": time.time(), "agent": agent, "action": action,
+                "status": status, "duration_ms": None, "error": None,
+            })
+
+    def agent_status(self, name: str) -> Dict:
+        """Summary for one agent, in the shape the Agent Monitor cards use."""
+        with self._lock:
+            stats = self.agents.get(name) or AgentStats(name)
+            summary = stats.summary()
+            last_status = stats.last_status
+        calls = summary["calls"]
+        return {
+            "name": name,
+            "status": "active" if summary["in_flight"] else "error" if last_status == "error" else "idle",
+            "processed": calls,
+            "active": summary["in_flight"],
+            "description": AGENT_DESCRIPTIONS.get(name, ""),
+            # Share of calls that completed without error
+            "progress": round(100 * (calls - summary["errors"]) / calls) if calls else 0,
+            **summary,
+        }
+
+    def recent_activity(self, limit: int = 20) -> List[Dict]:
+        now = time.time()
+        with self._lock:
+            events = list(self.activity)[-limit:]
+        return [
+            {**event, "time": _ago(now - event["timestamp"]),
+             "timestamp": datetime.fromtimestamp(event["timestamp"], timezone.utc).isoformat()}
+            for event in reversed(events)
+        ]
+
+    def prometheus(self, extra: Optional[Dict[str, float]] = None) -> str:
+        """All agent metrics in the Prometheus text exposition format."""
+        with self._lock:
+            agents = sorted(self.agents.values(), key=lambda stats: stats.name)
+            rows = [(s.name, s.calls, s.in_flight, dict(s.errors), s.latency.cumulative(EXPORTED_BOUNDS_MS),
+                     s.latency.count, s.latency.sum_ms, s.cache_hits, s.cache_misses,
+                     s.prompt_tokens, s.completion_tokens) for s in agents]
+        lines = []
+
+        def family(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        family("crux_agent_calls_total", "counter", "Completed agent calls")
+        lines += [f'crux_agent_calls_total{{agent="{r[0]}"}} {r[1]}' for r in rows]
+        family("crux_agent_in_flight", "gauge", "Agent calls currently running")
+        lines += [f'crux_agent_in_flight{{agent="{r[0]}"}} {r[2]}' for r in rows]
+        family("crux_agent_errors_total", "counter", "Failed agent calls by error kind")
+        lines += [f'crux_agent_errors_total{{agent="{r[0]}",kind="{kind}"}} {count}' for r in rows for kind, count in sorted(r[3].items())]
+        family("crux_agent_latency_seconds", "histogram", "Agent call latency")
+        for r in rows:
+            for bound, count in zip(EXPORTED_BOUNDS_MS, r[4]):
+                lines.append(f'crux_agent_latency_seconds_bucket{{agent="{r[0]}",le="{bound / 1000:g}"}} {count}')
+            lines.append(f'crux_agent_latency_seconds_bucket{{agent="{r[0]}",le="+Inf"}} {r[5]}')
+            lines.append(f'crux_agent_latency_seconds_sum{{agent="{r[0]}"}} {r[6] / 1000:.6f}')
+            lines.append(f'crux_agent_latency_seconds_count{{agent="{r[0]}"}} {r[5]}')
+        family("crux_agent_cache_lookups_total", "counter", "Agent cache lookups by result")
+        for r in rows:
+            lines.append(f'crux_agent_cache_lookups_total{{agent="{r[0]}",result="hit"}} {r[7]}')
+            lines.append(f'crux_agent_cache_lookups_total{{agent="{r[0]}",result="miss"}} {r[8]}')
+        family("crux_agent_tokens_total", "counter", "Upstream LLM tokens by type")
+        for r in rows:
+            lines.append(f'crux_agent_tokens_total{{agent="{r[0]}",type="prompt"}} {r[9]}')
+            lines.append(f'crux_agent_tokens_total{{agent="{r[0]}",type="completion"}} {r[10]}')
+        family("crux_uptime_seconds", "gauge", "Seconds since the process started")
+        lines.append(f"crux_uptime_seconds {time.time() - self.started:.1f}")
+        for name, value in (extra or {}).items():
+            family(name, "gauge", name.replace("_", " "))
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Global instance
+telemetry = Telemetry()
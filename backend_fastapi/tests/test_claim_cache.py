@@ -0,0 +1,61 @@
+"""
+Canonical-claim matching: paraphrases reuse a verdict, while swapped
+names, a different verb, reversed roles or flipped negation never do.
+"""
+import pytest
+import claim_cache
+from claim_cache import ClaimCache
+from models import Claim, ScoreResponse
+
+SCORE = ScoreResponse(final_score=40, source_reliability=50, evidence_strength=40, consistency=30, verdict="MIXED")
+FILLER = ["Stock markets fall after rate decision", "New policy on school fees announced", "Earthquake hits coastal town"]
+
+
+def cache_with(*texts) -> ClaimCache:
+    cache = ClaimCache(path=None)
+    for i, text in enumerate(FILLER + list(texts)):
+        cache.store(Claim(id=f"c{i}", text=text, source="test"), SCORE)
+    return cache
+
+
+@pytest.mark.parametrize("stored, query", [
+    ("Biden won the 2020 election in Georgia", "Trump won the 2020 election in Georgia"),
+    ("vaccines cause autism", "vaccines prevent autism"),
+    ("Israel attacked Iran", "Iran attacked Israel"),
+    ("Israel attacked Iran", "iran attacked israel"),
+    ("The vaccine causes autism", "The vaccine does not cause autism"),
+    ("Flood kills 50 in Assam", "Flood kills 500 in Assam"),
+])
+def test_different_claims_do_not_match(stored, query):
+    assert cache_with(stored).lookup(query) is None
+
+
+@pytest.mark.parametrize("stored, query", [
+    ("Israel attacked Iran", "israel attacked iran"),
+    ("Vaccines cause autism in children", "vaccine causes autism in children"),
+    ("NASA confirms water found on the Moon", "NASA confirmed water was found on the moon"),
+    ("The WHO declared a global health emergency over mpox", "WHO has declared a global health emergency over mpox"),
+])
+def test_paraphrases_match(stored, query):
+    result = cache_with(stored).lookup(query)
+    assert result is not None
+    entry, match = result
+    assert entry.text == stored
+    assert match.similarity >= claim_cache.CLAIM_CACHE_THRESHOLD
+
+
+def test_eviction_keeps_rows_aligned(monkeypatch):
+    monkeypatch.setattr(claim_cache, "CLAIM_CACHE_MAX_ENTRIES", 8)
+    texts = [f"Dam number {i} bursts near village {i}" for i in range(19)]
+    cache = cache_with(*texts)
+    fresh = ClaimCache(path=None)
+    for entry in cache._entries:
+        fresh._insert(entry)
+    assert len(cache) == len(fresh) <= 8
+    assert cache._size == fresh._size
+    assert (cache._starts[:len(cache)] == fresh._starts[:len(fresh)]).all()
+    assert (cache._buckets[:cache._size] == fresh._buckets[:fresh._size]).all()
+    assert (cache._doc_freq == fresh._doc_freq).all()
+    assert cache._term_docs == fresh._term_docs
+    entry, _ = cache.lookup(texts[-1])
+    assert entry.text == texts[-1]
@@ -0,0 +1,35 @@
+"""
+Trailing attribution stripping in headline normalization: only the
+article's own outlet (or a known one) is dropped, and long headlines that
+merely look like "text - words" stay linear to scan.
+"""
+import time
+import pytest
+from dedup import normalize_headline
+
+
+@pytest.mark.parametrize("text, source", [
+    ("Floods hit Assam - BBC News", "bbc"),
+    ("Floods hit Assam | Times of India", "timesofindia"),
+    ("Floods hit Assam — Reuters  ", None),
+    ("Floods hit Assam - Local Herald", "localherald"),
+])
+def test_attribution_is_dropped(text, source):
+    assert normalize_headline(text, source) == "floods hit assam"
+
+
+@pytest.mark.parametrize("text, source", [
+    ("Markets rally - India", "indiatoday"),
+    ("Israel - Hamas ceasefire collapses", None),
+    ("Storm nears coast - Local Herald", "local"),
+])
+def test_story_words_are_kept(text, source):
+    assert normalize_headline(text, source) == normalize_headline(text)
+    assert len(normalize_headline(text, source).split()) >= 3
+
+
+def test_long_dash_separated_headline_is_fast():
+    text = "a - " + "word " * 400 + "!"
+    start = time.perf_counter()
+    normalize_headline(text, "x")
+    assert time.perf_counter() - start < 0.5
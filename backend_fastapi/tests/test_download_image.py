@@ -0,0 +1,69 @@
+"""
+Remote image downloads: client-supplied URLs must not reach loopback,
+private or link-local hosts, and a slow server can't hold a worker past
+the download timeout.
+"""
+import http.server
+import socketserver
+import threading
+import time
+import pytest
+import reverse_search
+from reverse_search import download_image, is_public_address
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "1000" if self.path == "/drip" else "5")
+        self.end_headers()
+        if self.path == "/drip":
+            for _ in range(100):
+                self.wfile.write(b"x")
+                self.wfile.flush()
+                time.sleep(0.05)
+        else:
+            self.wfile.write(b"hello")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def local_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+@pytest.mark.parametrize("address, public", [
+    ("8.8.8.8", True),
+    ("2001:4860:4860::8888", True),
+    ("127.0.0.1", False),
+    ("10.1.2.3", False),
+    ("169.254.169.254", False),
+    ("100.64.0.1", False),
+    ("::1", False),
+    ("::ffff:192.168.1.1", False),
+    ("fe80::1%eth0", False),
+    ("239.1.1.1", False),
+])
+def test_public_address(address, public):
+    assert is_public_address(address) is public
+
+
+def test_refuses_non_http_and_internal_urls(local_server):
+    host, port = local_server.split(":")
+    for url in ["file:///etc/passwd", "ftp://example.com/a.jpg", f"http://{local_server}/",
+                f"http://localhost:{port}/", "http://169.254.169.254/latest/meta-data/"]:
+        assert download_image(url, timeout=2) is None
+
+
+def test_timeout_bounds_the_whole_download(local_server, monkeypatch):
+    monkeypatch.setattr(reverse_search, "is_public_address", lambda address: True)
+    assert download_image(f"http://{local_server}/") == b"hello"
+    start = time.perf_counter()
+    assert download_image(f"http://{local_server}/drip", timeout=0.5) is None
+    assert time.perf_counter() - start < 1.5
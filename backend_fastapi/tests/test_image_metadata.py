@@ -0,0 +1,185 @@
+"""
+Header metadata parser against crafted files: odd EXIF field types,
+undecodable text, unknown TIFF types and truncated or out-of-range
+segments. Every result must survive FastAPI's JSON encoding.
+"""
+import io
+import json
+import mmap
+import struct
+import tempfile
+import pytest
+from PIL import Image
+from fastapi.encoders import jsonable_encoder
+from image_metadata import parse_metadata
+
+MAKE, MODEL, ORIENTATION, SOFTWARE, EXIF_IFD = 0x010F, 0x0110, 0x0112, 0x0131, 0x8769
+EXPOSURE_TIME, ISO = 0x829A, 0x8827
+
+
+def tiff(entries, exif_entries=None, order="<"):
+    """
+    TIFF block with one IFD0 (and optionally an Exif IFD). Entries are
+    (tag, type, count, payload bytes); payloads over 4 bytes go after the IFDs.
+    """
+    def ifd(items, offset, extra_start):
+        table, extra = b"", b""
+        for tag, kind, count, payload in items:
+            if len(payload) <= 4:
+                value = payload.ljust(4, b"\x00")
+            else:
+                value = struct.pack(order + "I", extra_start + len(extra))
+                extra += payload
+            table += struct.pack(order + "HHI", tag, kind, count) + value
+        return struct.pack(order + "H", len(items)) + table + struct.pack(order + "I", 0), extra
+
+    header = (b"II*\x00" if order == "<" else b"MM\x00*") + struct.pack(order + "I", 8)
+    entries = list(entries)
+    exif_entries = list(exif_entries or [])
+    if exif_entries:
+        entries.append((EXIF_IFD, 4, 1, b""))  # offset patched below
+    ifd0_size = 2 + 12 * len(entries) + 4
+    exif_offset = 8 + ifd0_size
+    exif_size = 2 + 12 * len(exif_entries) + 4 if exif_entries else 0
+    extra_start = exif_offset + exif_size
+    if exif_entries:
+        entries[-1] = (EXIF_IFD, 4, 1, struct.pack(order + "I", exif_offset))
+    ifd0, extra0 = ifd(entries, 8, extra_start)
+    exif, extra1 = ifd(exif_entries, exif_offset, extra_start + len(extra0)) if exif_entries else (b"", b"")
+    return header + ifd0 + exif + extra0 + extra1
+
+
+def jpeg_with_exif(tiff_block: bytes) -> bytes:
+    """Small real JPEG with an APP1 Exif segment inserted after SOI."""
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), (120, 80, 40)).save(buffer, "JPEG")
+    body = buffer.getvalue()
+    payload = b"Exif\x00\x00" + tiff_block
+    return body[:2] + b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload + body[2:]
+
+
+def text(value: bytes) -> bytes:
+    return value + b"\x00"
+
+
+def encodes(result) -> str:
+    """Same path as the API response (fails on bytes and non-finite floats)."""
+    return json.dumps(jsonable_encoder(result), allow_nan=False)
+
+
+@pytest.fixture
+def odd_make_jpeg():
+    # Make as UNDEFINED (type 7) with bytes that are not valid UTF-8
+    raw = b"\xff\xfeCan\xe9on\x80"
+    return jpeg_with_exif(tiff([(MAKE, 7, len(raw), raw), (MODEL, 2, 7, text(b"EOS R5"))]))
+
+
+def test_undefined_make_is_decoded_to_text(odd_make_jpeg):
+    result = parse_metadata(odd_make_jpeg)
+    encodes(result)
+    assert isinstance(result["camera"]["make"], str)
+    assert result["camera"]["model"] == "EOS R5"
+    assert "camera_exif" in result["signals"]
+
+
+@pytest.mark.parametrize("kind", [0, 14, 200])
+def test_unknown_tiff_type_is_skipped(kind):
+    data = jpeg_with_exif(tiff([
+        (SOFTWARE, kind, 4, b"\x01\x02\x03\x04"),
+        (MAKE, 2, 6, text(b"Nikon")),
+    ]))
+    result = parse_metadata(data)
+    encodes(result)
+    assert "error" not in result
+    assert result["camera"]["make"] == "Nikon"
+    assert "software" not in result
+
+
+def test_orientation_must_be_an_integer():
+    undefined = parse_metadata(jpeg_with_exif(tiff([(ORIENTATION, 7, 2, b"\x06\x00")])))
+    encodes(undefined)
+    assert "orientation" not in undefined
+    short = parse_metadata(jpeg_with_exif(tiff([(ORIENTATION, 3, 1, struct.pack("<H", 6))])))
+    assert short["orientation"] == 6
+
+
+def test_non_finite_and_byte_exposure_values_are_dropped():
+    data = jpeg_with_exif(tiff(
+        [(MAKE, 2, 6, text(b"Canon"))],
+        [(EXPOSURE_TIME, 11, 1, struct.pack("<f", float("nan"))), (ISO, 7, 2, b"\x90\x01")],
+    ))
+    result = parse_metadata(data)
+    encodes(result)
+    assert set(result["camera"]) == {"make", "maker_note"}
+
+
+def test_big_endian_rational_exposure():
+    data = jpeg_with_exif(tiff(
+        [(MAKE, 2, 5, text(b"Sony"))],
+        [(EXPOSURE_TIME, 5, 1, struct.pack(">II", 1, 250))],
+        order=">",
+    ))
+    result = parse_metadata(data)
+    assert result["camera"]["exposure_time"] == pytest.approx(0.004)
+
+
+def test_value_offset_past_end_is_ignored():
+    block = bytearray(tiff([(MAKE, 2, 6, text(b"Canon")), (MODEL, 2, 40, text(b"x" * 39))]))
+    # Point Model's out-of-line value far past the end of the segment
+    model_entry = 8 + 2 + 12
+    struct.pack_into("<I", block, model_entry + 8, 0xFFFF0)
+    result = parse_metadata(jpeg_with_exif(bytes(block)))
+    encodes(result)
+    assert result["camera"] == {"make": "Canon", "maker_note": False}
+
+
+def test_truncated_ifd_keeps_entries_read_before_it():
+    block = tiff([(MAKE, 2, 6, text(b"Canon")), (MODEL, 2, 3, text(b"R6"))])
+    # Claim 300 entries in a segment that holds two
+    block = block[:8] + struct.pack("<H", 300) + block[10:]
+    result = parse_metadata(jpeg_with_exif(block))
+    encodes(result)
+    assert result["camera"]["make"] == "Canon"
+
+
+def test_ifd_loop_terminates():
+    block = bytearray(tiff([(MAKE, 2, 6, text(b"Canon"))], [(ISO, 3, 1, struct.pack("<H", 100))]))
+    # Exif IFD pointer back at IFD0
+    exif_entry = 8 + 2 + 12
+    struct.pack_into("<I", block, exif_entry + 8, 8)
+    result = parse_metadata(jpeg_with_exif(bytes(block)))
+    encodes(result)
+    assert result["camera"]["make"] == "Canon"
+
+
+def test_truncated_app1_segment_does_not_raise():
+    data = jpeg_with_exif(tiff([(MAKE, 2, 6, text(b"Canon"))]))
+    # Segment length running past the end of the file
+    result = parse_metadata(data[:40])
+    encodes(result)
+    assert result["format"] == "JPEG"
+
+
+def test_tiff_file_with_odd_dimension_types():
+    block = tiff([(0x0100, 7, 2, b"\x10\x00"), (0x0101, 3, 1, struct.pack("<H", 16)), (MAKE, 7, 3, b"\xc3\x28\x00")])
+    result = parse_metadata(block)
+    encodes(result)
+    assert result["format"] == "TIFF"
+    assert result["height"] == 16
+    assert "width" not in result
+
+
+def test_memory_mapped_upload_is_parsed_in_place(odd_make_jpeg):
+    expected = parse_metadata(odd_make_jpeg)
+    with tempfile.TemporaryFile() as handle:
+        handle.write(odd_make_jpeg)
+        handle.flush()
+        mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        result = parse_metadata(view)
+        view.release()
+        # No view of the map may outlive the parse (UploadedImage.close closes it)
+        mapped.close()
+    expected.pop("parse_us")
+    result.pop("parse_us")
+    assert result == expected
@@ -0,0 +1,293 @@
+"""
+Tracing Module
+Request-scoped tracing: every HTTP request gets a request id and a root
+span, and pipeline stages (link fetch, search, score, explain, image
+sub-analyses, ...) open child spans under it. Finished traces are
+exported in the background, as Zipkin v2 JSON, to a local NDJSON file or
+a collector, so a tail-latency outlier can be pinned to the stage that
+caused it.
+"""
+import os
+import json
+import time
+import uuid
+import zlib
+import queue
+import atexit
+import logging
+import threading
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from storage import data_path
+from profiling import note_thread
+
+# "" (off: ids only, no spans recorded), "file" or "zipkin"
+TRACE_EXPORT = (os.getenv("TRACE_EXPORT") or "").lower()
+TRACE_FILE = os.getenv("TRACE_FILE") or None
+TRACE_COLLECTOR_URL = os.getenv("TRACE_COLLECTOR_URL") or "http://localhost:9411/api/v2/spans"
+# Fraction of traces exported; slow and failed traces are always exported
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE") or "1.0")
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS") or "2000")
+SERVICE_NAME = "crux-backend"
+# Traces waiting for the exporter, and how many are written per batch
+EXPORT_QUEUE_SIZE = 1000
+EXPORT_BATCH = 100
+REQUEST_ID_HEADER = b"x-request-id"
+
+_current: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Trace:
+    """Finished spans of one request; exported when the root span ends."""
+
+    __slots__ = ("trace_id", "request_id", "spans", "closed")
+
+    def __init__(self, request_id: Optional[str] = None):
+        self.trace_id = uuid.uuid4().hex
+        self.request_id = request_id or self.trace_id
+        self.spans: List["Span"] = []
+        self.closed = False
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start", "_started", "duration_ms", "attributes", "error")
+
+    def __init__(self, trace: Trace, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def fail(self, kind: str):
+        self.error = kind
+
+    def to_zipkin(self) -> Dict:
+        tags = {key: str(value) for key, value in self.attributes.items() if value is not None}
+        if self.error:
+            tags["error"] = self.error
+        span = {
+            "traceId": self.trace.trace_id,
+            "id": self.span_id,
+            "name": self.name,
+            "timestamp": int(self.start * 1e6),
+            "duration": max(1, int((self.duration_ms or 0) * 1000)),
+            "localEndpoint": {"serviceName": SERVICE_NAME},
+            "tags": tags,
+        }
+        if self.parent_id:
+            span["parentId"] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    """Stand-in for child spans while export is off."""
+
+    __slots__ = ()
+
+    def set(self, key: str, value: Any):
+        pass
+
+    def fail(self, kind: str):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def current_ids() -> Tuple[Optional[str], Optional[str]]:
+    """(request_id, span_id) of the active span, for log records."""
+    span = _current.get()
+    if span is None:
+        return None, None
+    return span.trace.request_id, span.span_id
+
+
+def _keep(trace: Trace, root: Span) -> bool:
+    if root.duration_ms >= TRACE_SLOW_MS or any(span.error for span in trace.spans):
+        return True
+    return TRACE_SAMPLE_RATE >= 1.0 or zlib.crc32(trace.request_id.encode()) / 0xFFFFFFFF < TRACE_SAMPLE_RATE
+
+
+def _slowest_stage(trace: Trace, root: Span) -> Optional[Span]:
+    """Child span with the most self time (its duration minus its children's)."""
+    child_ms: Dict[str, float] = {}
+    for span in trace.spans:
+        if span.parent_id:
+            child_ms[span.parent_id] = child_ms.get(span.parent_id, 0.0) + (span.duration_ms or 0.0)
+    stages = [span for span in trace.spans if span is not root]
+    if not stages:
+        return None
+    return max(stages, key=lambda span: (span.duration_ms or 0.0) - child_ms.get(span.span_id, 0.0))
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Any]:
+    """
+    Child span of the current one. Outside a request (background scans,
+    warm-up) this starts a new trace. An exception marks the span failed.
+    """
+    note_thread()
+    parent = _current.get()
+    if parent is None or parent.trace.closed:
+        with root_span(name, **attributes) as root:
+            yield root
+        return
+    if not exporter.enabled:
+        yield _NOOP
+        return
+    child = Span(parent.trace, name, parent, attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = child.error or type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        child.duration_ms = (time.perf_counter() - child._started) * 1000
+        parent.trace.spans.append(child)
+
+
+@contextmanager
+def root_span(name: str, request_id: Optional[str] = None, **attributes) -> Iterator[Span]:
+    """Start a new trace (one per request); exported when this span ends."""
+    trace = Trace(request_id)
+    root = Span(trace, name, None, attributes)
+    token = _current.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.error = root.error or type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        root.duration_ms = (time.perf_counter() - root._started) * 1000
+        trace.closed = True
+        if exporter.enabled:
+            trace.spans.append(root)
+            root.set("request_id", trace.request_id)
+            slowest = _slowest_stage(trace, root)
+            if slowest:
+                root.set("slowest_stage", slowest.name)
+            if _keep(trace, root):
+                exporter.submit(trace)
+
+
+class Exporter:
+    """Background writer for finished traces (file or Zipkin-compatible collector)."""
+
+    def __init__(self, mode: str = TRACE_EXPORT, path: Optional[str] = TRACE_FILE, url: str = TRACE_COLLECTOR_URL):
+        self.mode = mode if mode in ("file", "zipkin") else ""
+        self.path = path
+        self.url = url
+        self.queue: queue.Queue = queue.Queue(EXPORT_QUEUE_SIZE)
+        self.stats = {"exported_traces": 0, "exported_spans": 0, "dropped": 0, "failures": 0}
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.mode)
+
+    def submit(self, trace: Trace):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+        try:
+            self.queue.put_nowait(trace)
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def _run(self):
+        while True:
+            traces = [self.queue.get()]
+            while len(traces) < EXPORT_BATCH:
+                try:
+                    traces.append(self.queue.get(timeout=0.5))
+                except queue.Empty:
+                    break
+            stop = None in traces
+            spans = [span.to_zipkin() for trace in traces if trace is not None for span in trace.spans]
+            if spans:
+                try:
+                    self._write(spans)
+                    self.stats["exported_traces"] += sum(1 for trace in traces if trace is not None)
+                    self.stats["exported_spans"] += len(spans)
+                except Exception as e:
+                    self.stats["failures"] += 1
+                    logging.getLogger("crux.tracing").error("Trace export failed", extra={"fields": {"error": str(e), "mode": self.mode}})
+            for _ in traces:
+                self.queue.task_done()
+            if stop:
+                return
+
+    def _write(self, spans: List[Dict]):
+        if self.mode == "file":
+            if self.path is None:
+                self.path = data_path("traces.ndjson")
+            with open(self.path, "a", encoding="utf-8") as handle:
+                handle.write("".join(json.dumps(span, separators=(",", ":")) + "\n" for span in spans))
+        else:
+            request = urllib.request.Request(
+                self.url, data=json.dumps(spans).encode(), headers={"Content-Type": "application/json"}, method="POST"
+            )
+            with urllib.request.urlopen(request, timeout=5) as response:
+                response.read()
+
+    def flush(self):
+        """Write everything queued so far (shutdown)."""
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def status(self) -> Dict:
+        return {"mode": self.mode or None, "queued": self.queue.qsize(), **self.stats}
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that runs each HTTP request in a root span. The request
+    id comes from X-Request-ID when the client sends one and is echoed back;
+    streamed responses are timed until their last chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(REQUEST_ID_HEADER, b"").decode("latin-1")[:64] or None
+        with root_span(f"{scope['method']} {scope['path']}", request_id=request_id) as root:
+            async def send_with_id(message):
+                if message["type"] == "http.response.start":
+                    root.set("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        root.fail(f"http_{message['status']}")
+                    root.set("response_start_ms", round((time.perf_counter() - root._started) * 1000, 1))
+                    message["headers"] = list(message.get("headers") or []) + [
+                        (REQUEST_ID_HEADER, root.trace.request_id.encode("latin-1"))
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_with_id)
+
+
+# Global instance
+exporter = Exporter()
@@ -0,0 +1,208 @@
+"""
+Uploads Module
+Bounded, streamed handling of uploaded images: size limit, SHA-256 and
+format sniffing in one pass, and zero-copy buffers for the image stages.
+"""
+import os
+import io
+import mmap
+import hashlib
+from typing import Dict, Optional, Union
+
+# Largest accepted upload (bytes)
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+# Uploads up to this size stay in memory; larger ones are memory-mapped from their spool file
+UPLOAD_MEMORY_BYTES = int(os.getenv("UPLOAD_MEMORY_BYTES", str(1024 * 1024)))
+# Limit on a whole batch request body and on its expanded images together (bytes)
+BATCH_MAX_TOTAL_BYTES = int(os.getenv("BATCH_MAX_TOTAL_BYTES", str(200 * 1024 * 1024)))
+CHUNK_SIZE = 256 * 1024
+# Multipart framing allowance when checking Content-Length against UPLOAD_MAX_BYTES
+MULTIPART_OVERHEAD = 64 * 1024
+
+ImageBuffer = Union[bytes, memoryview]
+
+
+def _megabytes(size: int) -> str:
+    return f"{size / (1024 * 1024):.3g}"
+
+
+class UploadRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """Image format from magic bytes, or None."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "GIF"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    if head[:2] == b"BM":
+        return "BMP"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "TIFF"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in (b"avif", b"avis"):
+            return "AVIF"
+        if brand in (b"heic", b"heix", b"hevc", b"mif1", b"msf1"):
+            return "HEIF"
+    return None
+
+
+class _ViewReader(io.RawIOBase):
+    """Seekable raw stream over a buffer; each reader keeps its own position."""
+
+    def __init__(self, view: memoryview):
+        self._view = view
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        chunk = self._view[self._position:self._position + len(target)]
+        target[:len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+
+def image_stream(data: ImageBuffer) -> io.BufferedIOBase:
+    """
+    File object for Image.open. bytes go through BytesIO, which shares the
+    buffer until written; memoryviews (mapped uploads) are read in place.
+    """
+    if isinstance(data, bytes):
+        return io.BytesIO(data)
+    return io.BufferedReader(_ViewReader(memoryview(data).cast("B")))
+
+
+class UploadedImage:
+    """
+    A received upload. `data` is bytes for small files and a read-only
+    memoryview of the mapped spool file for large ones; call close() (or
+    use as a context manager) before the upload itself is closed.
+    """
+
+    def __init__(self, data: ImageBuffer, size: int, sha256: str, image_format: str, filename: Optional[str], mapped: Optional[mmap.mmap] = None):
+        self.data = data
+        self.size = size
+        self.sha256 = sha256
+        self.format = image_format
+        self.filename = filename
+        self._mapped = mapped
+
+    def summary(self) -> dict:
+        return {
+            "filename": self.filename,
+            "bytes": self.size,
+            "sha256": self.sha256,
+            "format": self.format,
+            "memory_mapped": self._mapped is not None,
+        }
+
+    def close(self):
+        if self._mapped is None:
+            return
+        if isinstance(self.data, memoryview):
+            self.data.release()
+        try:
+            self._mapped.close()
+        except BufferError:
+            # A stage that outlived the request still holds a view; GC closes the map
+            pass
+        self._mapped = None
+
+    def __enter__(self) -> "UploadedImage":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def receive_upload(upload, max_bytes: int = UPLOAD_MAX_BYTES) -> UploadedImage:
+    """
+    Stream an UploadFile's spooled body once: enforce max_bytes, hash it and
+    sniff the format from the first chunk. Blocking (the spool may be on
+    disk); call via run_in_threadpool from async endpoints.
+    """
+    source = upload.file
+    source.seek(0)
+    digest = hashlib.sha256()
+    size = 0
+    image_format = None
+    small = []
+    while True:
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if image_format is None:
+            image_format = sniff_format(chunk[:32])
+            if image_format is None:
+                raise UploadRejected(415, "Unsupported media type: expected an image")
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadRejected(413, f"Upload exceeds the {_megabytes(max_bytes)} MB limit")
+        digest.update(chunk)
+        if size <= UPLOAD_MEMORY_BYTES:
+            small.append(chunk)
+    if not size:
+        raise UploadRejected(400, "Empty upload")
+
+    if size <= UPLOAD_MEMORY_BYTES:
+        return UploadedImage(b"".join(small), size, digest.hexdigest(), image_format, upload.filename)
+    # Map the spool file instead of copying it onto the heap (fileno() rolls
+    # an in-memory spool over to disk first)
+    mapped = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    return UploadedImage(memoryview(mapped)[:size], size, digest.hexdigest(), image_format, upload.filename, mapped)
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware that refuses multipart bodies whose Content-Length is
+    over the limit before they are parsed and spooled. receive_upload still
+    checks the actual size (chunked bodies carry no Content-Length).
+    path_limits overrides max_bytes for endpoints taking several files.
+    """
+
+    def __init__(self, app, max_bytes: int = UPLOAD_MAX_BYTES, path_limits: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            headers = dict(scope.get("headers") or [])
+            length = headers.get(b"content-length")
+            max_bytes = self.path_limits.get(scope.get("path"), self.max_bytes)
+            if (
+                headers.get(b"content-type", b"").startswith(b"multipart/form-data")
+                and length and length.isdigit()
+                and int(length) > max_bytes + MULTIPART_OVERHEAD
+            ):
+                body = f'{{"detail":"Upload exceeds the {_megabytes(max_bytes)} MB limit"}}'.encode()
+                await send({
+                    "type": "http.response.start",
+                    "status": 413,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), (b"connection", b"close")],
+                })
+                await send({"type": "http.response.body", "body": body})
+                return
+        await self.app(scope, receive, send)
@@ -8,6 +8,7 @@ import { cn } from "@/lib/utils";
 export function ChatBot() {
   const [isOpen, setIsOpen] = useState(false);
   const [input, setInput] = useState("");
+  const [sessionId, setSessionId] = useState<string | null>(null);
   const [messages, setMessages] = useState<Array<{ role: "user" | "assistant"; content: string }>>([
     { role: "assistant", content: "Hi! I'm your CruxAI assistant. I can help you verify claims, check crisis alerts, or navigate the platform. How can I help you today?" }
   ]);
@@ -26,15 +27,18 @@ export function ChatBot() {
         headers: {
           "Content-Type": "application/json",
         },
+        // The server keeps the conversation; history only seeds a new session
         body: JSON.stringify({
           message: userMessage,
-          history: messages
+          session_id: sessionId,
+          history: sessionId ? undefined : messages
         }),
       });
 
       if (!response.ok) throw new Error("Chat API failed");
 
       const data = await response.json();
+      if (data.session_id) setSessionId(data.session_id);
       setMessages(prev => [...prev, { role: "assistant", content: data.response }]);
     } catch (error) {
       console.error("Chat error:", error);